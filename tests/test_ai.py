@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import numpy as np
+
+from zilch_dice_game.ai import AIPlayer, DecisionBatcher
+from zilch_dice_game.utils.cache import LRUCache
+from zilch_dice_game.rl.solver import TurnPolicy
+
+POLICY = TurnPolicy.solve()
+
+
+def test_concurrent_decisions_are_batched():
+    ai = AIPlayer(POLICY, max_wait=0.01)
+    rolls = np.random.default_rng(0).integers(1, 7, size=(200, 6)).tolist()
+    with ThreadPoolExecutor(32) as pool:
+        results = list(pool.map(lambda d: ai.decide(d, 0, 0), rolls))
+    assert ai.batcher.batches < ai.batcher.decisions
+    for dice, (indices, bank) in zip(rolls, results):
+        assert (indices, bank) == POLICY.decide(dice, 0, 0)
+
+def test_batch_wait_is_bounded_under_steady_arrivals():
+    batcher = DecisionBatcher(POLICY, max_wait=0.02)
+    # Arrivals just inside max_wait would otherwise keep the first batch open
+    first = batcher.submit([1, 2, 3, 4, 6, 6], 0, 0)
+    start = time.monotonic()
+    futures = []
+    while not first.done() and time.monotonic() - start < 1.0:
+        time.sleep(0.015)
+        futures.append(batcher.submit([1, 2, 3, 4, 6, 6], 0, 0))
+    first.result()
+    assert time.monotonic() - start < 0.2
+    for future in futures:
+        future.result()
+
+def test_decisions_are_memoized_per_roll():
+    ai = AIPlayer(POLICY)
+    first = ai.decide([1, 2, 3, 4, 6, 6], 0, 0)
+    # Same multiset in a different order maps onto the new positions
+    assert ai.decide([6, 6, 4, 3, 2, 1], 0, 0) == ([5], first[1])
+    assert ai.cache.hits == 1
+
+def test_lru_cache_evicts_oldest():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
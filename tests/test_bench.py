@@ -0,0 +1,58 @@
+import asyncio
+import tempfile
+
+from zilch_dice_game.bench import load, micro, startup
+
+
+def test_load_harness_reports_every_endpoint():
+    report = asyncio.run(load.run_load(players=4, games_per_player=1, max_turns=4, seed=0))
+    assert report['errors'] == 0
+    assert report['requests'] == sum(e['count'] for e in report['endpoints'].values())
+    assert {'POST /game/new', 'POST /game/{id}/roll', 'POST /game/{id}/keep'} <= set(report['endpoints'])
+    stats = report['endpoints']['POST /game/new']
+    assert stats['count'] == 4
+    assert stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms']
+
+
+def test_regression_threshold():
+    baseline = {'throughput_rps': 1000.0, 'endpoints': {'POST /game/new': {'p95_ms': 10.0, 'p99_ms': 20.0}}}
+    same = {'throughput_rps': 950.0, 'endpoints': {'POST /game/new': {'p95_ms': 11.0, 'p99_ms': 21.0}}}
+    worse = {'throughput_rps': 700.0, 'endpoints': {'POST /game/new': {'p95_ms': 10.0, 'p99_ms': 30.0}}}
+    assert load.regressions(same, baseline, 0.2) == []
+    assert len(load.regressions(worse, baseline, 0.2)) == 2
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+    assert load.percentile(values, 50) == 50.0
+    assert load.percentile(values, 99) == 99.0
+    assert load.percentile([], 50) == 0.0
+
+
+def test_micro_benchmark_report():
+    report = micro.run('scoring.s', warmup=0.0, repeat=2, min_time=0.001)
+    assert set(report['results']) == {'scoring.score', 'scoring.scoring_mask', 'scoring.score_many'}
+    result = report['results']['scoring.score_many']
+    assert result['best_ops_per_sec'] >= result['median_ops_per_sec'] > 0
+    assert result['best_items_per_sec'] == result['best_ops_per_sec'] * 1024
+    assert result['peak_bytes_per_call'] > 0
+
+
+def test_micro_benchmark_removes_its_model_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    report = micro.run('agent.load', warmup=0.0, repeat=1, min_time=0.001, allocations=False)
+    assert set(report['results']) == {'agent.load[json]', 'agent.load[binary]'}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_startup_benchmark_report():
+    report = startup.run(runs=1)
+    median = report['median']
+    assert set(median) == set(startup.TIMINGS)
+    assert 0 < median['import_ms'] <= median['ready_ms'] <= median['ai_ready_ms']
+    assert median['ready_ms'] < median['process_ms']
+    # NumPy and the AI load after the app is importable, not during
+    assert report['numpy_imported_by_app'] is False
+    slower = {'median': {key: 2 * value for key, value in median.items()}}
+    assert startup.regressions(report, report, 0.2) == []
+    assert len(startup.regressions(slower, report, 0.2)) == len(startup.TIMINGS)
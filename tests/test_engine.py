@@ -0,0 +1,122 @@
+import pytest
+
+from zilch_dice_game import engine, rng, scoring
+from zilch_dice_game.state import Game
+from zilch_dice_game.rl.env import ZilchEnv
+
+
+def _rolls(monkeypatch, *rolls):
+    pending = [list(r) for r in rolls]
+    monkeypatch.setattr(engine, 'roll_values', lambda game, n: pending.pop(0)[:n])
+
+
+def test_zilch_passes_turn(monkeypatch):
+    game = engine.new_game('g')
+    _rolls(monkeypatch, [2, 3, 4, 6, 6, 3])
+    assert engine.roll(game) is True
+    assert game.zilch
+    assert game.current_player == 1
+    assert game.turn_score == 0
+
+def test_hot_dice_rolls_all_six(monkeypatch):
+    game = engine.new_game('g')
+    _rolls(monkeypatch, [1, 2, 3, 4, 5, 6], [2, 2, 2, 3, 4, 6])
+    engine.roll(game)
+    assert engine.keep(game, [0, 1, 2, 3, 4, 5]) == 1500
+    assert game.dice == [0] * 6
+    engine.roll(game)
+    assert game.dice == [2, 2, 2, 3, 4, 6]
+    engine.keep(game, [0, 1, 2])
+    assert engine.bank(game) == 1700
+    assert game.total0 == 1700
+    assert game.current_player == 1
+
+def test_roll_only_rerolls_dice_left_on_table(monkeypatch):
+    game = engine.new_game('g')
+    _rolls(monkeypatch, [1, 2, 3, 4, 6, 6], [5, 5, 5, 5, 5])
+    engine.roll(game)
+    engine.keep(game, [0])
+    engine.roll(game)
+    assert game.dice == [0, 5, 5, 5, 5, 5]
+
+def test_env_runs_without_http():
+    env = ZilchEnv()
+    obs = env.reset()
+    assert obs.shape == (10,)
+    for _ in range(50):
+        # Keep the first legal subset and bank
+        legal = env.action_space.valid_actions(obs[:6])
+        obs, reward, done, info = env.step(legal[1])
+        assert reward > 0 and 'error' not in info
+        if done:
+            break
+
+def test_game_state_round_trips(monkeypatch):
+    game = engine.new_game('g')
+    _rolls(monkeypatch, [1, 5, 3, 4, 6, 6])
+    engine.roll(game)
+    engine.keep(game, [0, 1])
+    game.total1 = 4250
+    game.version = 7
+    copy = Game.from_bytes(game.to_bytes())
+    assert copy.to_model() == game.to_model()
+    assert (copy.seed, copy.rng_pos) == (game.seed, game.rng_pos)
+    model = game.to_model()
+    assert model.dice == [0, 0, 3, 4, 6, 6]
+    assert model.kept == [1, 5]
+    assert model.players[1].total_score == 4250
+
+def test_binary_form_refuses_lengths_its_header_cannot_hold():
+    with pytest.raises(ValueError):
+        engine.new_game('g' * 256).to_bytes()
+    assert Game.from_bytes(engine.new_game('g' * 255).to_bytes()).game_id == 'g' * 255
+
+def test_dice_stream_is_seeded_and_random_access():
+    seed = rng.new_seed()
+    stream = rng.DiceRNG(seed)
+    bulk = stream.dice(500)
+    position, drawn = 0, []
+    for _ in range(100):
+        dice, position = rng.draw(seed, position, 5)
+        drawn += dice
+    assert drawn == bulk
+    assert stream.position == position
+    # Jumping straight to a position gives the same dice as drawing up to it
+    assert rng.DiceRNG(seed, position).dice(6) == rng.draw(seed, position, 6)[0]
+    assert set(bulk) == {1, 2, 3, 4, 5, 6}
+    assert rng.DiceRNG(rng.new_seed()).dice(50) != rng.DiceRNG(rng.new_seed()).dice(50)
+
+def test_replay_from_seed_and_moves():
+    seed = rng.new_seed()
+    game = engine.new_game('g', seed)
+    moves = []
+    for _ in range(40):
+        if game.finished:
+            break
+        if engine.roll(game):
+            moves.append(('roll', ()))
+            continue
+        moves.append(('roll', ()))
+        mask = scoring.scoring_mask(game.dice)
+        keep = [i for i in range(6) if mask >> i & 1]
+        engine.keep(game, keep)
+        moves.append(('keep', keep))
+        engine.bank(game)
+        moves.append(('bank', ()))
+    replayed = engine.replay('g', seed, moves)
+    assert replayed.to_bytes() == game.to_bytes()
+
+def test_rng_state_survives_binary_round_trip():
+    game = engine.new_game('g')
+    engine.roll(game)
+    restored = Game.from_bytes(game.to_bytes())
+    assert (restored.seed, restored.rng_pos) == (game.seed, game.rng_pos)
+    assert engine.roll_values(restored, 6) == engine.roll_values(game, 6)
+
+def test_seeded_env_is_reproducible():
+    first, second = ZilchEnv(seed=7), ZilchEnv(seed=7)
+    for action in [1, 0, 1, 1, 0] * 4:
+        a, b = first.step(action), second.step(action)
+        assert (a[0] == b[0]).all() and a[1:3] == b[1:3]
+        if a[2]:
+            first.reset(), second.reset()
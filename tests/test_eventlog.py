@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from zilch_dice_game import app, engine, eventlog, main, scoring
+from zilch_dice_game.eventlog import EventLog
+
+
+def _play(log, game, turns):
+    """Play `turns` turns keeping every scoring die and banking, logging each move."""
+    for _ in range(turns):
+        if game.finished:
+            return
+        player = game.current_player
+        engine.roll(game)
+        log.append(eventlog.encode_move(game, 'roll', player=player))
+        if game.zilch:
+            continue
+        indices = [i for i in range(6) if scoring.scoring_mask(game.dice) >> i & 1]
+        engine.keep(game, indices)
+        log.append(eventlog.encode_move(game, 'keep', eventlog.mask_of(indices), player))
+        engine.bank(game)
+        log.append(eventlog.encode_move(game, 'bank', player=player))
+
+
+def _state(game):
+    return (game.game_id, game.packed_dice, game.kept_bytes, game.turn_score, game.totals,
+            game.current_player, game.finished, game.seed, game.rng_pos)
+
+
+def test_rebuild_from_log(tmp_path):
+    log = EventLog(str(tmp_path / 'games.log'))
+    games = [engine.new_game(f'g{i}') for i in range(5)]
+    for game in games:
+        log.append(eventlog.encode_create(game))
+    for game in games:
+        _play(log, game, 10)
+    log.close()
+    rebuilt, offset = eventlog.rebuild(log.path)
+    assert offset == os.path.getsize(log.path)
+    assert {_state(g) for g in games} == {_state(g) for g in rebuilt.values()}
+    records = eventlog.load_records(log.path)
+    assert len(records) == offset // eventlog.RECORD_SIZE
+    assert (records['type'][:5] == eventlog.CREATE).all()
+
+
+def test_snapshot_plus_tail(tmp_path):
+    path = str(tmp_path / 'games.log')
+    log = EventLog(path)
+    game = engine.new_game('7c4f2a80-4d8a-4e0e-9d51-5e5b0a1f6c11')
+    log.append(eventlog.encode_create(game))
+    _play(log, game, 6)
+    log.snapshot()
+    _play(log, game, 6)
+    log.close()
+    snapshot_games, snapshot_offset = eventlog.read_snapshot(log.snapshot_path)
+    assert 0 < snapshot_offset < os.path.getsize(path)
+    # Recovery only replays the records after the snapshot
+    tail = list(eventlog.iter_records(path, snapshot_offset))
+    assert len(tail) < len(list(eventlog.iter_records(path)))
+    rebuilt, _ = eventlog.rebuild(path, log.snapshot_path)
+    assert _state(rebuilt[game.game_id]) == _state(game)
+    assert _state(eventlog.rebuild_game(path, game.game_id, log.snapshot_path)) == _state(game)
+
+
+def test_torn_record_is_dropped(tmp_path):
+    path = str(tmp_path / 'games.log')
+    log = EventLog(path)
+    game = engine.new_game('g')
+    log.append(eventlog.encode_create(game))
+    _play(log, game, 3)
+    log.close()
+    size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(b'\x02' * 20)  # a write cut short by a crash
+    assert _state(eventlog.rebuild(path)[0]['g']) == _state(game)
+    reopened = EventLog(path)
+    assert reopened.offset == size
+    reopened.close()
+
+
+def test_append_does_not_wait_for_fsync(tmp_path, monkeypatch):
+    log = EventLog(str(tmp_path / 'games.log'), flush_interval=60)
+    game = engine.new_game('g')
+    log.append(eventlog.encode_create(game))
+    syncing, release = threading.Event(), threading.Event()
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        syncing.set()
+        release.wait(5)
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, 'fsync', slow_fsync)
+    flusher = threading.Thread(target=log.flush)
+    flusher.start()
+    assert syncing.wait(5)
+    appender = threading.Thread(target=log.append, args=(eventlog.encode_create(engine.new_game('h')),))
+    appender.start()
+    appender.join(1)
+    stuck = appender.is_alive()
+    release.set()
+    flusher.join()
+    appender.join()
+    assert not stuck
+    log.close()
+    assert log.records_total == 2
+
+
+def test_idle_games_leave_snapshots_and_recovery(tmp_path, monkeypatch):
+    path = str(tmp_path / 'games.log')
+    log = EventLog(path, flush_interval=60, max_idle=3600)
+    old, new = engine.new_game('old'), engine.new_game('new')
+    real_time = time.time
+    monkeypatch.setattr(time, 'time', lambda: real_time() - 7200)
+    log.append(eventlog.encode_create(old))
+    _play(log, old, 2)
+    monkeypatch.setattr(time, 'time', real_time)
+    log.append(eventlog.encode_create(new))
+    _play(log, new, 2)
+    log.snapshot()
+    assert set(eventlog.read_snapshot(log.snapshot_path)[0]) == {'new'}
+    assert set(log.recover()) == {'new'}
+    # The log itself keeps the abandoned game
+    assert _state(eventlog.rebuild_game(path, 'old', log.snapshot_path)) == _state(old)
+    assert set(eventlog.rebuild(path)[0]) == {'old', 'new'}
+    log.close()
+
+
+def test_app_moves_are_logged_and_recovered(tmp_path, monkeypatch):
+    log = EventLog(str(tmp_path / 'api.log'))
+    monkeypatch.setattr(main, 'event_log', log)
+    client = TestClient(app)
+    game_id = client.post('/game/new').json()['game_id']
+    for _ in range(5):
+        game = client.post(f'/game/{game_id}/roll').json()
+        if not game['zilch']:
+            mask = scoring.scoring_mask(game['dice'])
+            client.post(f'/game/{game_id}/keep', json={'indices': [i for i in range(6) if mask >> i & 1]})
+            client.post(f'/game/{game_id}/bank')
+        client.post(f'/game/{game_id}/ai-turn')
+    log.flush()
+    rebuilt = eventlog.rebuild(log.path)[0][game_id]
+    assert _state(rebuilt) == _state(main.store.get(game_id))
+
+    main.store.delete(game_id)
+    assert main.recover_games() >= 1
+    assert _state(main.store.get(game_id)) == _state(rebuilt)
+    log.close()
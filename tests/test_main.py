@@ -1,11 +1,21 @@
+import asyncio
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 
-from zilch_dice_game import app
+from zilch_dice_game import app, engine, main, serialization
+from zilch_dice_game.locks import GameLocks
 
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def fixed_dice(monkeypatch):
+    """Pin rolls to [1, 2, 3, 4, 6, 6] so die 0 always scores and no roll zilches."""
+    monkeypatch.setattr(engine, 'roll_values', lambda game, n: [1, 2, 3, 4, 6, 6][:n])
+
+
 def test_create_game():
     response = client.post('/game/new')
     assert response.status_code == 200
@@ -69,4 +79,227 @@ def test_bank_points_switches_to_ai():
     assert game['kept'] == []
     assert game['players'][0]['total_score'] >= 0
     assert game['players'][1]['total_score'] == 0
-    assert game['winner'] is None 
\ No newline at end of file
+    assert game['winner'] is None 
+def test_keep_non_scoring_dice_rejected():
+    game_id = client.post('/game/new').json()['game_id']
+    client.post(f'/game/{game_id}/roll')
+    response = client.post(f'/game/{game_id}/keep', json={'indices': [1]})
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'Selected dice do not score'
+
+def test_must_keep_before_rolling_again():
+    game_id = client.post('/game/new').json()['game_id']
+    client.post(f'/game/{game_id}/roll')
+    response = client.post(f'/game/{game_id}/roll')
+    assert response.status_code == 400
+
+def test_ai_turn_hands_back_to_human():
+    game_id = client.post('/game/new').json()['game_id']
+    response = client.post(f'/game/{game_id}/ai-turn')
+    assert response.status_code == 400
+    assert response.json()['detail'] == "It's not the AI's turn"
+
+    client.post(f'/game/{game_id}/roll')
+    client.post(f'/game/{game_id}/keep', json={'indices': [0]})
+    client.post(f'/game/{game_id}/bank')
+    response = client.post(f'/game/{game_id}/ai-turn')
+    assert response.status_code == 200
+    game = response.json()
+    assert game['current_player'] == 0
+    assert game['players'][1]['total_score'] > 0
+
+def test_auto_ai_turn_after_bank(monkeypatch):
+    monkeypatch.setattr(main.server_config, 'auto_ai_turn', True)
+    game_id = client.post('/game/new').json()['game_id']
+    client.post(f'/game/{game_id}/roll')
+    client.post(f'/game/{game_id}/keep', json={'indices': [0]})
+    game = client.post(f'/game/{game_id}/bank').json()
+    assert game['current_player'] == 0
+    assert game['players'][1]['total_score'] > 0
+
+def test_responses_match_pydantic_model():
+    game_id = client.post('/game/new').json()['game_id']
+    client.post(f'/game/{game_id}/roll')
+    client.post(f'/game/{game_id}/keep', json={'indices': [0]})
+    body = client.get(f'/game/{game_id}').json()
+    game = main.store.get(game_id)
+    assert body == game.to_model().model_dump()
+
+def test_delta_responses():
+    data = client.post('/game/new').json()
+    game_id, version = data['game_id'], data['game']['version']
+    delta = client.post(f'/game/{game_id}/roll', params={'since': version}).json()
+    assert delta['delta'] is True
+    assert delta['since'] == version
+    assert delta['dice'] == [1, 2, 3, 4, 6, 6]
+    assert delta['awaiting_keep'] is True
+    assert 'players' not in delta and 'turn_score' not in delta
+    # Unknown versions fall back to the full state
+    full = client.get(f'/game/{game_id}', params={'since': 999}).json()
+    assert 'delta' not in full
+    assert full['dice'] == [1, 2, 3, 4, 6, 6]
+
+def test_delta_versions_live_on_the_game():
+    game = engine.new_game('delta')
+    first = game.version
+    serialization.render_game(game)
+    for _ in range(serialization.DELTA_VERSIONS):
+        game.version += 1
+        serialization.render_game(game)
+    assert len(game.rendered) == serialization.DELTA_VERSIONS
+    # The oldest version has been let go; the newer ones still give deltas
+    assert serialization.render_delta(game, first) is None
+    assert serialization.render_delta(game, first + 1) is not None
+
+def test_websocket_commands_and_ai_push():
+    game_id = client.post('/game/new').json()['game_id']
+    with client.websocket_connect(f'/game/{game_id}/ws') as ws:
+        assert ws.receive_json()['event'] == 'state'
+        ws.send_json({'action': 'keep', 'indices': [0]})
+        assert ws.receive_json()['error'] == 'Roll before keeping dice'
+        ws.send_json({'action': 'roll'})
+        message = ws.receive_json()
+        assert message['event'] == 'roll'
+        assert message['game']['dice'] == [1, 2, 3, 4, 6, 6]
+        ws.send_json({'action': 'keep', 'indices': [0]})
+        assert ws.receive_json()['game']['turn_score'] == 100
+        ws.send_json({'action': 'bank'})
+        assert ws.receive_json()['event'] == 'bank'
+        ws.send_json({'action': 'ai-turn'})
+        steps = []
+        while True:
+            message = ws.receive_json()
+            assert message['player'] == 1
+            steps.append(message['event'])
+            if message['game']['current_player'] == 0:
+                break
+        assert steps[:2] == ['roll', 'keep']
+        assert steps[-1] == 'bank'
+
+def test_websocket_receives_http_moves():
+    game_id = client.post('/game/new').json()['game_id']
+    with client.websocket_connect(f'/game/{game_id}/ws') as ws:
+        ws.receive_json()
+        client.post(f'/game/{game_id}/roll')
+        message = ws.receive_json()
+        assert message['event'] == 'roll'
+        assert message['game']['awaiting_keep'] is True
+
+def test_websocket_sender_failure_is_logged(caplog):
+    class BrokenSocket:
+        async def send_text(self, text):
+            raise RuntimeError('socket went away')
+
+    async def pump_once():
+        sub = main.hub.subscribe('logged')
+        try:
+            sub.offer(b'{}')
+            sender = asyncio.create_task(main._pump(BrokenSocket(), sub))
+            sender.add_done_callback(main._pump_done)
+            await asyncio.gather(sender, return_exceptions=True)
+            await asyncio.sleep(0)  # done callbacks run on the next loop iteration
+        finally:
+            main.hub.unsubscribe(sub)
+
+    asyncio.run(pump_once())
+    assert 'Sending game updates to a WebSocket failed' in caplog.text
+    assert 'socket went away' in caplog.text
+
+def test_batch_create_games():
+    response = client.post('/games/batch', json={'count': 3})
+    assert response.status_code == 200
+    games = response.json()['games']
+    assert len({g['game_id'] for g in games}) == 3
+    for g in games:
+        assert client.get(f"/game/{g['game_id']}").json() == g
+    assert client.post('/games/batch', json={'count': 0}).status_code == 400
+
+def test_action_sequence():
+    game_id = client.post('/game/new').json()['game_id']
+    game = client.post(f'/game/{game_id}/actions', json={'actions': [{'action': 'roll'}]}).json()
+    assert game['dice'] == [1, 2, 3, 4, 6, 6]
+    actions = [{'action': 'keep', 'indices': [0]}, {'action': 'roll'}]
+    game = client.post(f'/game/{game_id}/actions', json={'actions': actions}).json()
+    assert game['turn_score'] == 100
+    actions = [
+        # Kept dice stay in place as 0s, so the new 1 is die 1
+        {'action': 'keep', 'indices': [1]},
+        {'action': 'bank'},
+    ]
+    game = client.post(f'/game/{game_id}/actions', json={'actions': actions}).json()
+    assert game['players'][0]['total_score'] == 200
+    assert game['current_player'] == 1
+
+def test_action_sequence_cannot_act_after_a_roll():
+    game_id = client.post('/game/new').json()['game_id']
+    before = main.store.get(game_id).rng_pos
+    actions = [{'action': 'roll'}, {'action': 'keep', 'indices': [0]}]
+    response = client.post(f'/game/{game_id}/actions', json={'actions': actions})
+    assert response.status_code == 400
+    assert response.json()['detail'] == {'index': 1, 'detail': 'A roll must be the last action'}
+    # Nothing was rolled, so the dice stream hasn't moved
+    assert main.store.get(game_id).rng_pos == before
+    # Clients can read the rule in the API docs
+    openapi = client.get('/openapi.json').json()
+    assert 'A roll can only be the last action' in openapi['paths']['/game/{game_id}/actions']['post']['description']
+    assert 'only be the last action' in openapi['components']['schemas']['ActionsRequest']['properties']['actions']['description']
+
+def test_action_sequence_is_all_or_nothing():
+    game_id = client.post('/game/new').json()['game_id']
+    client.post(f'/game/{game_id}/roll')
+    before = client.get(f'/game/{game_id}').json()
+    actions = [
+        {'action': 'keep', 'indices': [0]},
+        {'action': 'keep', 'indices': [1]},
+    ]
+    response = client.post(f'/game/{game_id}/actions', json={'actions': actions})
+    assert response.status_code == 400
+    assert response.json()['detail'] == {'index': 1, 'detail': 'Roll before keeping dice'}
+    assert client.get(f'/game/{game_id}').json() == before
+
+def test_game_locks_serialize_one_game_only():
+    locks = GameLocks()
+    order = []
+
+    async def hold(key, name):
+        async with locks.hold(key):
+            order.append(f'{name} in')
+            await asyncio.sleep(0.01)
+            order.append(f'{name} out')
+
+    async def run():
+        await asyncio.gather(hold('g', 'a'), hold('g', 'b'), hold('h', 'c'))
+
+    asyncio.run(run())
+    # b waits for a; c, on another game, doesn't wait at all
+    assert order.index('a out') < order.index('b in')
+    assert order.index('c in') < order.index('a out')
+    assert len(locks) == 0
+    assert locks.metrics()['contended_total'] == 1
+
+def test_concurrent_ai_turns_on_one_game_apply_in_turn(monkeypatch):
+    from zilch_dice_game.utils.cache import LRUCache
+    # An empty decision cache makes every AI step wait on the batcher, so
+    # unlocked requests would interleave their moves on the same game
+    monkeypatch.setattr(main.get_ai(), 'cache', LRUCache(1024))
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://zilch') as http:
+            game_id = (await http.post('/game/new')).json()['game_id']
+            for action, body in (('roll', None), ('keep', {'indices': [0]}), ('bank', None)):
+                await http.post(f'/game/{game_id}/{action}', json=body)
+            turns = await asyncio.gather(*(http.post(f'/game/{game_id}/ai-turn') for _ in range(10)))
+            return turns, (await http.get(f'/game/{game_id}')).json()
+
+    turns, game = asyncio.run(run())
+    # The first request plays the whole turn; the rest find it is no longer the AI's
+    assert [r.status_code for r in turns].count(200) == 1
+    assert game['current_player'] == 0
+    assert game['players'][1]['total_score'] > 0
+
+
+def test_ai_warms_up_in_the_background(monkeypatch):
+    monkeypatch.setattr(main, '_ai', None)
+    asyncio.run(main.warm_up_ai())
+    assert main._ai is not None
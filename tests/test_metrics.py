@@ -0,0 +1,69 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from zilch_dice_game import app, main
+from zilch_dice_game.metrics import Registry, SamplingProfiler
+
+client = TestClient(app)
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    hist = registry.histogram('latency_seconds', 'test', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        hist.observe(value, ('/a',))
+    text = registry.render()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{route="/a"} 4' in text
+    assert hist.count(('/a',)) == 4
+
+
+def test_metrics_endpoint():
+    game_id = client.post('/game/new').json()['game_id']
+    client.get(f'/game/{game_id}')
+    text = client.get('/metrics').text
+    # Labelled by route template, not by game id
+    assert 'zilch_http_requests_total{method="GET",route="/game/{game_id}",status="200"}' in text
+    assert game_id not in text
+    assert 'zilch_http_request_duration_seconds_bucket{method="POST",route="/game/new",le="+Inf"}' in text
+    assert '# TYPE zilch_store_games gauge' in text
+
+
+def test_profiler_endpoint(monkeypatch):
+    assert client.post('/debug/profile').status_code == 404
+    monkeypatch.setattr(main.server_config, 'profiling_enabled', True)
+    assert client.post('/debug/profile', params={'seconds': 5, 'interval_ms': 1}).json()['running']
+    assert client.post('/debug/profile').status_code == 409
+    time.sleep(0.05)
+    assert client.delete('/debug/profile').json()['running'] is False
+    response = client.get('/debug/profile')
+    assert int(response.headers['X-Profile-Samples']) > 0
+    assert response.text.strip()
+
+
+def test_profiler_samples_other_threads():
+    profiler = SamplingProfiler()
+    profiler.start(0.05, 0.001)
+    deadline = time.monotonic() + 0.05
+    while time.monotonic() < deadline:
+        sum(range(1000))
+    profiler.stop()
+    assert 'test_profiler_samples_other_threads' in profiler.folded()
+
+
+def test_profiler_reads_the_tally_under_its_lock():
+    profiler = SamplingProfiler()
+    profiler._stacks['a;b'] += 1
+    results = []
+    # The sampler holds this lock while it updates the tally
+    with profiler._lock:
+        reader = threading.Thread(target=lambda: results.append(profiler.folded()))
+        reader.start()
+        reader.join(0.05)
+        assert reader.is_alive()
+    reader.join()
+    assert results == ['a;b 1\n']
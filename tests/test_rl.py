@@ -0,0 +1,427 @@
+import numpy as np
+import pytest
+
+from zilch_dice_game.config.rl_config import RLConfig
+from zilch_dice_game.rl.agent import ZilchRLAgent, _discretize_state
+from zilch_dice_game.rl.checkpoint import Checkpointer, load_checkpoint
+from zilch_dice_game.rl.qtable import DenseQTable, decode_keys, encode_keys, load_binary, sample_valid, save_binary
+from zilch_dice_game.rl.replay import ReplayBuffer
+from zilch_dice_game.rl.solver import TurnPolicy
+from zilch_dice_game.rl.tournament import make_policy, passes_gate, play_games, play_match, wilson_interval
+from zilch_dice_game.rl.trainer import _learn, _visits, collect_episodes, train, train_parallel
+from zilch_dice_game.rl.vec_env import VecZilchEnv
+from zilch_dice_game import scoring
+from zilch_dice_game.utils.state_utils import (
+    ActionSpace, basic_valid_actions, encode_state, legal_keep_table, valid_action_masks,
+)
+
+
+def test_vec_env_observations_match_encode_state():
+    env = VecZilchEnv(64, seed=0)
+    obs = env.reset()
+    assert obs.shape == (64, 10)
+    i = 5
+    expected = encode_state(env.dice[i].tolist(), int(env.turn_score[i]), int(env.totals[i, 0]),
+                            int(env.totals[i, 1]), int(env.current_player[i]))
+    np.testing.assert_array_equal(obs[i], expected)
+    # Every observation is a fresh roll with something to score
+    assert (obs[:, :6] > 0).all()
+
+def test_vec_env_bank_and_illegal_keep():
+    env = VecZilchEnv(256, seed=1)
+    env.reset()
+    env.turn_score[:] = 300
+    # Keep a single 1 or 5, then bank it together with the turn so far
+    ones_fives = np.isin(env.dice, (1, 5))
+    single = ones_fives.any(axis=1)
+    die = np.argmax(ones_fives, axis=1)
+    actions = np.array([ActionSpace.encode([i], True) for i in die])
+    expected = 300 + np.where(env.dice[np.arange(256), die] == 1, 100, 50)
+    _, rewards, dones, info = env.step(actions)
+    assert (rewards[single] == expected[single]).all()
+    assert not dones[single].any()
+    assert (env.totals[single].sum(axis=1) == expected[single]).all()
+
+    env.reset()
+    scoring_first = np.isin(env.dice[:, 0], (1, 5))
+    _, rewards, dones, info = env.step(np.full(256, ActionSpace.encode([0], False)))
+    assert (info['illegal'] == ~scoring_first).all()
+    assert (rewards[~scoring_first] == -10).all()
+    assert (dones == ~scoring_first).all()
+    # Illegal games were reset in place
+    assert (env.totals[dones] == 0).all()
+
+def test_state_keys_round_trip():
+    env = VecZilchEnv(128, seed=2)
+    obs = env.reset()
+    obs[:, 6] = 1250
+    obs[:, 7] = 9950
+    np.testing.assert_array_equal(decode_keys(encode_keys(obs)), obs)
+    assert len(np.unique(encode_keys(obs))) == len(np.unique(obs, axis=0))
+
+def test_dense_table_matches_dict_agent():
+    space = ActionSpace()
+    dict_agent = ZilchRLAgent(space, epsilon=0.0)
+    dense_agent = ZilchRLAgent(space, epsilon=0.0, q_backend='dense')
+    env = VecZilchEnv(32, seed=3)
+    obs = env.reset()
+    for _ in range(20):
+        actions = np.random.randint(0, space.size(), size=32)
+        next_obs, rewards, dones, _ = env.step(actions)
+        for i in range(32):
+            for agent in (dict_agent, dense_agent):
+                agent.update(obs[i], int(actions[i]), float(rewards[i]), next_obs[i], bool(dones[i]))
+        obs = next_obs
+    assert len(dense_agent.q_table) == len(dict_agent.q_table)
+    for state, q in dense_agent.q_table.items():
+        np.testing.assert_allclose(q, dict_agent.q_table[state], rtol=1e-5)
+    assert dense_agent.choose_actions(obs).tolist() == [dict_agent.choose_action(s) for s in obs]
+
+def test_q_values_of_a_new_state_grow_the_table():
+    table = DenseQTable(4, capacity=1)
+    for turn in range(5):
+        assert table.q_values(np.array([1, 2, 3, 4, 5, 6, 50 * turn, 0, 0, 0])).tolist() == [0.0] * 4
+    assert len(table) == 5
+
+
+def test_dense_update_batch():
+    table = DenseQTable(2)
+    states = np.zeros((4, 10), dtype=np.float32)
+    states[:, 0] = [1, 2, 3, 1]
+    table.update_batch(states, np.array([0, 1, 0, 0]), np.array([100, 50, 0, 100]),
+                       states, np.ones(4, dtype=bool), alpha=0.5, gamma=0.9)
+    assert len(table) == 3
+    # The two copies of (state 1, action 0) count once, as their mean
+    assert table.q_values(states[0]).tolist() == [50.0, 0.0]
+
+def test_binary_model_round_trip(tmp_path):
+    space = ActionSpace()
+    agent = ZilchRLAgent(space, epsilon=0.25, q_backend='dense')
+    env = VecZilchEnv(64, seed=4)
+    obs = env.reset()
+    agent.q_table.update_batch(obs, np.ones(64, dtype=np.int64), np.full(64, 50.0), obs,
+                               np.ones(64, dtype=bool), alpha=1.0, gamma=0.9)
+    path = str(tmp_path / 'model.qtb')
+    agent.save(path)
+
+    loaded = ZilchRLAgent(space, q_backend='dense')
+    loaded.load(path)
+    assert isinstance(loaded.q_table.values, np.memmap)
+    assert loaded.epsilon == 0.25
+    assert len(loaded.q_table) == len(agent.q_table)
+    np.testing.assert_array_equal(loaded.q_table.q_values(obs[0]), agent.q_table.q_values(obs[0]))
+    # New states can still be added to a mapped table
+    loaded.update(obs[0], 0, 10.0, obs[0], True)
+    assert loaded.q_table.q_values(obs[0])[0] == 1.0
+
+    # The JSON format stays importable and exportable alongside the binary one
+    json_path = str(tmp_path / 'model.json')
+    loaded.save(json_path)
+    legacy = ZilchRLAgent(space)
+    legacy.load(json_path)
+    assert len(legacy.q_table) == len(agent.q_table)
+
+def test_load_refuses_other_action_space(tmp_path):
+    old_space = ActionSpace()
+    old_space._actions = old_space._actions[:2]
+    old = ZilchRLAgent(old_space, q_backend='dense')
+    old.update(np.zeros(10), 1, 50.0, np.zeros(10), True)
+    for name in ('old.zqtb', 'old.json'):
+        path = str(tmp_path / name)
+        old.save(path)
+        for backend in ('dict', 'dense'):
+            agent = ZilchRLAgent(ActionSpace(), q_backend=backend)
+            with pytest.raises(ValueError, match='2 actions, but the action space has 126'):
+                agent.load(path)
+    with pytest.raises(ValueError, match='2 actions'):
+        make_policy(f"qtable:{tmp_path / 'old.zqtb'}")
+
+
+def test_replay_buffer_wraps_around():
+    buffer = ReplayBuffer(5, obs_dim=2, seed=0)
+    for i in range(3):
+        buffer.add(np.full(2, i), i, float(i), np.full(2, i + 1), False)
+    ids = np.arange(3, 7)
+    buffer.add_batch(np.repeat(ids[:, None], 2, axis=1), ids, ids.astype(float),
+                     np.repeat(ids[:, None] + 1, 2, axis=1), ids == 6)
+    assert len(buffer) == 5 and buffer.position == 2 and buffer.added_total == 7
+    # 0 and 1 were overwritten by 5 and 6
+    assert sorted(buffer.actions.tolist()) == [2, 3, 4, 5, 6]
+    batch = buffer.sample(100)
+    assert set(batch['actions'].tolist()) == {2, 3, 4, 5, 6}
+    np.testing.assert_array_equal(batch['next_states'][:, 0], batch['actions'] + 1)
+    np.testing.assert_array_equal(batch['dones'], batch['actions'] == 6)
+    # A batch larger than the buffer keeps its newest transitions
+    ids = np.arange(10, 22)
+    buffer.add_batch(np.zeros((12, 2)), ids, ids.astype(float), np.zeros((12, 2)), np.zeros(12, bool))
+    assert sorted(buffer.actions.tolist()) == list(range(17, 22))
+
+def test_update_batch_matches_across_backends():
+    space = ActionSpace()
+    agents = [ZilchRLAgent(space), ZilchRLAgent(space, q_backend='dense')]
+    env = VecZilchEnv(64, seed=8)
+    buffer = ReplayBuffer(1000)
+    obs = env.reset()
+    rng = np.random.default_rng(9)
+    for _ in range(10):
+        actions = rng.integers(0, space.size(), size=64)
+        next_obs, rewards, dones, _ = env.step(actions)
+        buffer.add_batch(obs, actions, rewards, next_obs, dones)
+        obs = next_obs
+    for _ in range(5):
+        batch = buffer.sample(256, np.random.default_rng(len(buffer)))
+        for agent in agents:
+            agent.update_batch(batch['states'], batch['actions'], batch['rewards'],
+                               batch['next_states'], batch['dones'])
+    dict_agent, dense_agent = agents
+    assert len(dense_agent.q_table) == len(dict_agent.q_table)
+    for state, q in dense_agent.q_table.items():
+        np.testing.assert_allclose(q, dict_agent.q_table[state], rtol=1e-4, atol=1e-3)
+    assert dict_agent.epsilon == 1.0
+
+def test_update_batch_averages_repeated_pairs():
+    space = ActionSpace()
+    env = VecZilchEnv(1, seed=3)
+    state = env.reset()[0]
+    action = int(np.flatnonzero(space.valid_action_masks(state[None, :6])[0])[0])
+    states = np.repeat(state[None], 30, axis=0)
+    for backend in ('dict', 'dense'):
+        agent = ZilchRLAgent(space, alpha=0.1, q_backend=backend)
+        agent.update_batch(states, np.full(30, action), np.full(30, 100.0), states, np.ones(30, dtype=bool))
+        q = agent.q_table.q_values(state) if backend == 'dense' else agent.q_table[_discretize_state(state)]
+        assert q[action] == pytest.approx(10.0)
+
+
+def test_replay_training(tmp_path):
+    cfg = RLConfig(episodes=30, q_backend='dense', buffer_size=2000, batch_size=128,
+                   max_steps_per_episode=50, model_path=str(tmp_path / 'q.zqtb'))
+    agent = train(cfg=cfg)
+    assert len(agent.q_table) > 0
+    assert agent.epsilon < cfg.epsilon_start
+    assert np.abs(agent.q_table.values[:len(agent.q_table)]).sum() > 0
+
+def test_checkpoints_full_and_incremental(tmp_path):
+    space = ActionSpace()
+    agent = ZilchRLAgent(space, epsilon=0.5, q_backend='dense')
+    env = VecZilchEnv(64, seed=5)
+    obs = env.reset()
+    agent.q_table.update_batch(obs, np.zeros(64, dtype=np.int64), np.full(64, 50.0), obs,
+                               np.ones(64, dtype=bool), alpha=1.0, gamma=0.9)
+    checkpoints = Checkpointer(str(tmp_path), full_every=3)
+    checkpoints.save(agent, 100)
+    checkpoints.flush()
+    # One changed row and some new ones
+    next_obs, _, _, _ = env.step(np.ones(64, dtype=np.int64))
+    agent.update(obs[0], 3, 10.0, obs[0], True)
+    agent.q_table.update_batch(next_obs, np.ones(64, dtype=np.int64), np.full(64, 20.0), next_obs,
+                               np.ones(64, dtype=bool), alpha=1.0, gamma=0.9)
+    agent.epsilon = 0.25
+    checkpoints.save(agent, 200, {'env': env.rng.bit_generator.state})
+    checkpoints.close()
+
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert files == ['checkpoint.json', 'full-000001.zqtb', 'inc-000002.zqtb']
+    delta, _ = load_binary(str(tmp_path / 'inc-000002.zqtb'))
+    assert 0 < len(delta) < len(agent.q_table)
+
+    table, meta = load_checkpoint(str(tmp_path))
+    assert meta['episodes'] == 200 and meta['epsilon'] == 0.25
+    assert meta['rng']['env'] == env.rng.bit_generator.state
+    assert len(table) == len(agent.q_table)
+    for state, q in agent.q_table.items():
+        np.testing.assert_array_equal(table.q_values(np.array(state)), q)
+
+    # The third checkpoint is a full one and replaces the other two
+    checkpoints = Checkpointer(str(tmp_path), full_every=3)
+    checkpoints.save(agent, 300)
+    checkpoints.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['checkpoint.json', 'full-000003.zqtb']
+
+
+def test_training_resumes_from_checkpoint(tmp_path):
+    checkpoint_dir = str(tmp_path / 'ckpt')
+    cfg = RLConfig(episodes=30, q_backend='dense', buffer_size=2000, batch_size=128,
+                   max_steps_per_episode=50, model_path=str(tmp_path / 'q.zqtb'),
+                   checkpoint_dir=checkpoint_dir, checkpoint_every=10, checkpoint_full_every=2)
+    first = train(cfg=cfg)
+    _, meta = load_checkpoint(checkpoint_dir)
+    assert meta['episodes'] == 30 and meta['epsilon'] == first.epsilon
+    sequence = meta['sequence']
+
+    cfg.episodes, cfg.resume_from = 60, checkpoint_dir
+    resumed = train(cfg=cfg)
+    assert resumed.epsilon < first.epsilon
+    assert len(resumed.q_table) >= len(first.q_table)
+    _, meta = load_checkpoint(checkpoint_dir)
+    assert meta['episodes'] == 60 and meta['sequence'] > sequence
+
+
+@pytest.mark.parametrize('run', [train, train_parallel])
+def test_resumed_training_matches_an_uninterrupted_run(tmp_path, run):
+    def config(name, episodes, resume_from=''):
+        return RLConfig(episodes=episodes, q_backend='dense', seed=11, num_workers=1, sync_interval=10,
+                        max_steps_per_episode=50, model_path=str(tmp_path / f'{name}.zqtb'),
+                        checkpoint_dir=str(tmp_path / name), checkpoint_every=10, resume_from=resume_from)
+
+    whole = run(cfg=config('whole', 30))
+    run(cfg=config('first', 10))
+    resumed = run(cfg=config('rest', 30, resume_from=str(tmp_path / 'first')))
+    assert resumed.epsilon == whole.epsilon
+    assert len(resumed.q_table) == len(whole.q_table)
+    for state, q in whole.q_table.items():
+        np.testing.assert_array_equal(resumed.q_table.q_values(np.array(state)), q)
+
+
+def test_parallel_training(tmp_path):
+    cfg = RLConfig(episodes=40, num_workers=2, sync_interval=10, max_steps_per_episode=50,
+                   model_path=str(tmp_path / 'q.qtb'))
+    agent = train(cfg=cfg)
+    assert agent.q_backend == 'dense'
+    assert len(agent.q_table) > 0
+    assert agent.epsilon < cfg.epsilon_start
+    loaded = ZilchRLAgent(ActionSpace(), q_backend='dense')
+    loaded.load(cfg.model_path)
+    assert len(loaded.q_table) == len(agent.q_table)
+
+
+def test_parallel_learner_matches_serial_updates(tmp_path):
+    # One actor's round, applied by the learner and one transition at a time
+    # as train() does; with gamma=0 every pair's value depends only on how
+    # many times, and with which rewards, it was updated
+    learner = ZilchRLAgent(ActionSpace(), gamma=0.0, q_backend='dense')
+    serial = ZilchRLAgent(ActionSpace(), gamma=0.0, q_backend='dense')
+    snapshot = str(tmp_path / 'policy.qtb')
+    save_binary(learner.q_table, snapshot, 1.0)
+    batch, _ = collect_episodes(snapshot, 1.0, 50, 50, seed=0)
+    # Play the round twice over so every pair is visited more than once
+    batch = {name: np.concatenate([values, values]) for name, values in batch.items()}
+    assert _visits(batch).max() == 1
+
+    _learn(learner, batch)
+    for state, action, reward, next_state, done in zip(
+            batch['states'], batch['actions'], batch['rewards'], batch['next_states'], batch['dones']):
+        serial.update(state, int(action), float(reward), next_state, bool(done))
+    assert len(learner.q_table) == len(serial.q_table)
+    for state, q in serial.q_table.items():
+        np.testing.assert_allclose(learner.q_table.q_values(np.array(state)), q, rtol=1e-5, atol=1e-4)
+
+def test_solver_policy(tmp_path):
+    policy = TurnPolicy.solve()
+    assert policy.zilch_probability[1] == pytest.approx(2 / 3)
+    assert policy.zilch_probability[6] == pytest.approx(0.0231, abs=1e-4)
+    assert 500 < policy.expected_turn_score() < 700
+    # A single 1 as the last die is worth chasing hot dice early in a turn
+    assert policy.decide([0, 0, 1, 0, 0, 0], 300) == ([2], False)
+    # Three 1s leaving three dice: bank the 1000
+    assert policy.decide([1, 1, 1, 3, 4, 6], 0) == ([0, 1, 2], True)
+    # Banking wins the game regardless of the expected-points decision
+    assert policy.decide([1, 2, 2, 3, 4, 6], 0, my_total=9950) == ([0], True)
+
+    path = str(tmp_path / 'policy.npz')
+    policy.save(path)
+    loaded = TurnPolicy.load(path)
+    np.testing.assert_array_equal(loaded.decisions, policy.decisions)
+
+def test_action_space_layout():
+    space = ActionSpace()
+    assert space.size() == 126
+    for a in (0, 1, 77, 125):
+        indices, bank = space.decode(a)
+        assert ActionSpace.encode(indices, bank) == a
+    assert space.decode(ActionSpace.encode([0, 4], True)) == ([0, 4], True)
+
+def test_valid_action_masks_match_keep_score():
+    rng = np.random.default_rng(4)
+    dice = rng.integers(1, 7, size=(500, 6))
+    dice[rng.random((500, 6)) < 0.3] = 0
+    masks = valid_action_masks(dice)
+    assert masks.shape == (500, 126)
+    space = ActionSpace()
+    for row, mask in zip(dice.tolist(), masks):
+        expected = [
+            a for a, (indices, _) in enumerate(space.all_actions())
+            if all(row[i] for i in indices) and scoring.keep_score([row[i] for i in indices]) > 0
+        ]
+        assert np.flatnonzero(mask).tolist() == expected
+        # Keep and keep-then-bank are legal together
+        assert (mask[0::2] == mask[1::2]).all()
+    assert legal_keep_table().shape == (7 ** 6,)
+    assert basic_valid_actions([2, 3, 4, 6, 2, 3]) == []
+    assert basic_valid_actions([1, 0, 0, 0, 0, 5]) == [[0], [5], [0, 5]]
+
+def test_agent_only_picks_legal_actions():
+    env = VecZilchEnv(64, seed=5)
+    obs = env.reset()
+    for backend in ('dict', 'dense'):
+        for epsilon in (0.0, 1.0):
+            agent = ZilchRLAgent(ActionSpace(), epsilon=epsilon, q_backend=backend)
+            legal = agent.valid_masks(obs)
+            actions = agent.choose_actions(obs)
+            assert legal[np.arange(64), actions].all()
+            single = [agent.choose_action(s) for s in obs]
+            assert legal[np.arange(64), single].all()
+
+def test_vec_env_reports_finished_games():
+    env = VecZilchEnv(64, seed=6, max_episode_steps=400)
+    obs = env.reset()
+    greedy = make_policy('greedy')
+    rng = np.random.default_rng(0)
+    for _ in range(400):
+        obs, _, dones, info = env.step(greedy(obs, rng))
+        won = info['winner'] >= 0
+        if won.any():
+            break
+    rows = np.flatnonzero(won)
+    assert (info['final_totals'][rows, info['winner'][rows]] >= 10000).all()
+    assert (info['turns'][rows] > 0).all()
+    assert (info['turns'][~dones] == 0).all()
+
+def test_vec_env_truncation_keeps_the_final_observation():
+    env = VecZilchEnv(64, seed=7, max_episode_steps=2)
+    obs = env.reset()
+    rng = np.random.default_rng(0)
+    for _ in range(2):
+        # Keep legal dice and roll on, so no game ends by itself
+        valid = env.action_space.valid_action_masks(obs[:, :6])
+        valid[:, 1::2] = False
+        obs, _, dones, info = env.step(sample_valid(valid, rng))
+    truncated = info['truncated']
+    assert truncated.any() and (dones == truncated).all()
+    final = info['final_observation']
+    # The cut-off games are reset, but the final observation is where they stood
+    assert (obs[truncated, 6] == 0).all()
+    assert (final[truncated, 6] > 0).any()
+    np.testing.assert_array_equal(final[~dones], obs[~dones])
+
+
+def test_policies_play_legal_actions():
+    env = VecZilchEnv(128, seed=7)
+    obs = env.reset()
+    rng = np.random.default_rng(1)
+    legal = valid_action_masks(obs[:, :6])
+    for spec in ('random', 'greedy', 'greedy:1000', 'solver'):
+        actions = make_policy(spec)(obs, rng)
+        assert legal[np.arange(128), actions].all(), spec
+    with pytest.raises(ValueError):
+        make_policy('nonsense')
+
+def test_match_stops_once_the_winner_is_clear():
+    sums = play_games(make_policy('greedy'), make_policy('random'), 50, seed=0)
+    assert sums['games'] == 50
+    assert sums['a_wins'] + sums['b_wins'] + sums['draws'] == 50
+
+    progress = []
+    result = play_match('solver', 'random', games=5000, workers=1, batch_games=200,
+                        min_games=200, seed=1, on_progress=progress.append)
+    assert result['verdict'] == 'a'
+    assert result['stopped_early'] and result['games'] < 5000
+    assert len(progress) == result['games'] // 200
+    low, high = result['a_win_rate_ci']
+    assert 0.5 < low <= result['a_win_rate'] <= high + 1e-9
+    assert result['a_mean_score'] > result['b_mean_score']
+    assert passes_gate([result], 'solver') and not passes_gate([result], 'random')
+
+def test_wilson_interval():
+    low, high = wilson_interval(50, 100, 1.96)
+    assert low == pytest.approx(0.4038, abs=1e-3) and high == pytest.approx(0.5962, abs=1e-3)
+    assert wilson_interval(0, 0, 1.96) == (0.0, 1.0)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from zilch_dice_game import scoring
+
+
+def test_all_multisets_are_tabled():
+    assert len(scoring.MULTISETS) == 923
+    assert len({scoring.dice_key(d) for d in scoring.MULTISETS}) == 923
+
+@pytest.mark.parametrize('dice, expected', [
+    ([1], 100),
+    ([5], 50),
+    ([1, 5, 2, 3, 3, 6], 150),
+    ([2, 2, 2], 200),
+    ([1, 1, 1], 1000),
+    ([4, 4, 4, 4], 800),
+    ([3, 3, 3, 3, 3], 900),
+    ([6, 6, 6, 6, 6, 6], 2400),
+    ([6, 5, 4, 3, 2, 1], 1500),
+    ([2, 2, 3, 3, 4, 4], 1500),
+    ([2, 2, 2, 5, 5, 5], 2500),
+    ([1, 1, 1, 1, 5, 5], 2100),
+    ([2, 3, 4, 6, 6, 3], 0),
+])
+def test_best_score(dice, expected):
+    assert scoring.score(dice) == expected
+
+def test_zeros_are_ignored():
+    assert scoring.score([0, 1, 0, 5, 0, 0]) == 150
+
+def test_scoring_mask_and_keep_score():
+    dice = [2, 1, 3, 2, 5, 2]
+    assert scoring.scoring_mask(dice) == 0b111011
+    assert scoring.keep_score([2, 2, 2, 1]) == 300
+    assert scoring.keep_score([2, 2, 1]) == 0
+
+def test_score_many_matches_scalar():
+    batch = np.random.randint(0, 7, size=(500, 6))
+    expected = [scoring.score(row.tolist()) for row in batch]
+    assert scoring.score_many(batch).tolist() == expected
+    expected_keep = [scoring.keep_score(row.tolist()) for row in batch]
+    assert scoring.keep_score_many(batch).tolist() == expected_keep
+
+def test_score_many_accepts_sequences():
+    assert scoring.score_many(((1, 5, 2), (1, 1, 1))).tolist() == [150, 1000]
@@ -0,0 +1,128 @@
+import pytest
+
+from zilch_dice_game import engine
+from zilch_dice_game.config.server_config import ServerConfig
+from zilch_dice_game.store import InMemoryGameStore, SQLiteGameStore, StaleGameError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_idle_games_expire():
+    clock = FakeClock()
+    store = InMemoryGameStore(ttl=10, clock=clock)
+    store.put(engine.new_game('a'))
+    store.put(engine.new_game('b'))
+    clock.now = 5
+    assert store.get('a') is not None
+    clock.now = 12
+    # 'b' is idle past the TTL; 'a' was touched at t=5
+    assert store.get('b') is None
+    assert store.get('a') is not None
+    assert store.metrics()['expired_total'] == 1
+
+def test_lru_eviction_by_count_and_bytes():
+    store = InMemoryGameStore(max_games=2)
+    for game_id in 'abc':
+        store.put(engine.new_game(game_id))
+        store.get('a')
+    assert store.get('b') is None
+    assert len(store) == 2
+
+    one = InMemoryGameStore()
+    one.put(engine.new_game('x'))
+    per_game = one.metrics()['bytes']
+    store = InMemoryGameStore(max_bytes=int(per_game * 2.5))
+    for game_id in 'abcd':
+        store.put(engine.new_game(game_id))
+    assert len(store) == 2
+    assert store.metrics()['evicted_total'] == 2
+
+def test_finished_games_have_a_grace_period():
+    clock = FakeClock()
+    store = InMemoryGameStore(ttl=1000, finished_ttl=5, clock=clock)
+    game = engine.new_game('a')
+    store.put(game)
+    game.finished = True
+    store.put(game)
+    assert store.metrics()['finished_games'] == 1
+    clock.now = 6
+    store.put(engine.new_game('b'))
+    assert store.get('a') is None
+
+def test_sqlite_store_write_behind_and_restart(tmp_path):
+    path = str(tmp_path / 'games.db')
+    store = SQLiteGameStore(path, flush_interval=60)
+    game = engine.new_game('a')
+    store.put(game)
+    assert store.get('a') is game
+    assert store.metrics()['pending_writes'] == 1
+    game.turn_score = 350
+    store.put(game)
+    store.flush()
+    assert store.metrics()['flushes_total'] == 1
+    store.close()
+
+    reopened = SQLiteGameStore(path)
+    loaded = reopened.get('a')
+    assert loaded.turn_score == 350
+    assert loaded.version == 2
+    reopened.close()
+
+def test_sqlite_store_version_conflicts(tmp_path):
+    path = str(tmp_path / 'games.db')
+    worker_a = SQLiteGameStore(path, flush_interval=60)
+    worker_b = SQLiteGameStore(path, flush_interval=60)
+    worker_a.put(engine.new_game('g'))
+    worker_a.flush()
+
+    game_a = worker_a.get('g')
+    game_b = worker_b.get('g')
+    game_b.turn_score = 100
+    worker_b.put(game_b)
+    worker_b.flush()
+    # Worker A's cached copy is revalidated and reloaded
+    fresh = worker_a.get('g')
+    assert fresh.turn_score == 100
+    with pytest.raises(StaleGameError):
+        worker_a.put(game_a)
+
+    # Both read the same version before either flushed: the second put()
+    # is refused at once, not dropped at flush time after being acknowledged
+    game_a = worker_a.get('g')
+    game_b = worker_b.get('g')
+    game_a.turn_score = 200
+    game_b.turn_score = 300
+    worker_a.put(game_a)
+    with pytest.raises(StaleGameError):
+        worker_b.put(game_b)
+    assert worker_b.metrics()['conflicts_total'] == 1
+    # Further writes by the winner before its flush need no new claim
+    game_a.turn_score = 250
+    worker_a.put(game_a)
+    worker_a.flush()
+    worker_b.flush()
+    assert worker_b.get('g').turn_score == 250
+    assert worker_a.metrics()['conflicts_total'] == 0
+    worker_a.close()
+    worker_b.close()
+
+def test_app_runs_on_sqlite_store(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from zilch_dice_game import app, main
+    monkeypatch.setattr(engine, 'roll_values', lambda game, n: [1, 2, 3, 4, 6, 6][:n])
+    cfg = ServerConfig(store_backend='sqlite', store_path=str(tmp_path / 'api.db'))
+    monkeypatch.setattr(main, 'store', main.make_store(cfg))
+    client = TestClient(app)
+    game_id = client.post('/game/new').json()['game_id']
+    client.post(f'/game/{game_id}/roll')
+    game = client.post(f'/game/{game_id}/keep', json={'indices': [0]}).json()
+    assert game['turn_score'] == 100
+    main.store.flush()
+    assert client.get(f'/game/{game_id}').json()['version'] == 3
+    main.store.close()
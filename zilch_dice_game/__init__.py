@@ -1 +1,7 @@
-from .main import app
+def __getattr__(name):
+    # Import the app on first access only, so `zilch_dice_game.rl` and the
+    # other subpackages can be used without loading FastAPI
+    if name == 'app':
+        from .main import app
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,177 @@
+"""
+Server-side AI player.
+
+Decisions come from a solved TurnPolicy (rl/solver.py). Two things keep the
+cost per decision low when many games hand their turn to the AI at once:
+  - DecisionBatcher queues decisions from concurrent requests and evaluates
+    them with one vectorized TurnPolicy.decide_many call per batch,
+  - AIPlayer memoizes decisions per (rolled dice, turn score, AI total) in a
+    bounded LRU cache, so repeated situations skip the policy entirely.
+"""
+from concurrent.futures import Future
+import asyncio
+import queue
+import threading
+import time
+from typing import AsyncIterator, Dict, Hashable, List, Optional, Tuple
+
+from . import engine, scoring
+from .metrics import AI_DECISION_LATENCY
+from .state import Game
+from .utils.cache import LRUCache
+
+# Kept faces (sorted) and whether to bank afterwards
+Decision = Tuple[Tuple[int, ...], bool]
+
+
+class DecisionBatcher:
+    """
+    Micro-batches policy evaluations across threads.
+
+    Callers get a Future; a single worker thread takes the first queued
+    request, collects up to `max_batch` more until `max_wait` seconds after
+    it, and answers them all with one decide_many call.
+    """
+
+    def __init__(self, policy, max_batch: int = 256, max_wait: float = 0.001) -> None:
+        self.policy = policy
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.decisions = 0
+        self._queue: "queue.Queue[Tuple[List[int], int, int, Future]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="zilch-ai-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, dice: List[int], turn_score: int, my_total: int) -> Future:
+        future: Future = Future()
+        self._queue.put((list(dice), turn_score, my_total, future))
+        return future
+
+    def _next_batch(self) -> List[Tuple[List[int], int, int, Future]]:
+        batch = [self._queue.get()]
+        # One deadline for the whole batch, so steady arrivals can't keep extending it
+        deadline = time.monotonic() + self.max_wait
+        try:
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self) -> None:
+        # Imported here so the API process only loads NumPy once the AI plays
+        import numpy as np
+
+        while True:
+            # Drop requests whose caller gave up (an async caller cancelled
+            # while awaiting); the rest can no longer be cancelled
+            batch = [b for b in self._next_batch() if b[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                keep, bank = self.policy.decide_many(
+                    np.array([b[0] for b in batch]),
+                    np.array([b[1] for b in batch]),
+                    np.array([b[2] for b in batch]),
+                )
+            except Exception as exc:  # hand the failure to every waiting caller
+                for *_, future in batch:
+                    future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.decisions += len(batch)
+            for i, (*_, future) in enumerate(batch):
+                future.set_result((np.flatnonzero(keep[i]).tolist(), bool(bank[i])))
+
+
+def _kept_faces(dice: List[int], indices: List[int]) -> Tuple[int, ...]:
+    return tuple(sorted(dice[i] for i in indices))
+
+
+def _indices_for(dice: List[int], faces: Tuple[int, ...]) -> List[int]:
+    """Positions in `dice` holding the given faces (each position used once)."""
+    wanted = list(faces)
+    indices = []
+    for i, d in enumerate(dice):
+        if d and d in wanted:
+            wanted.remove(d)
+            indices.append(i)
+    return indices
+
+
+class AIPlayer:
+    """Keep/bank decisions for the AI, batched and memoized."""
+
+    def __init__(self, policy, cache_size: int = 65536, max_batch: int = 256, max_wait: float = 0.001) -> None:
+        self.policy = policy
+        self.cache = LRUCache(cache_size)
+        self.batcher = DecisionBatcher(policy, max_batch=max_batch, max_wait=max_wait)
+
+    @staticmethod
+    def _key(dice: List[int], turn_score: int, my_total: int) -> Hashable:
+        # The total only matters when banking could win, so leave it out of
+        # the key otherwise and share the entry across games
+        reachable = my_total + turn_score + scoring.score(dice) >= engine.WINNING_SCORE
+        return (scoring.dice_key(dice), turn_score, my_total if reachable else None)
+
+    def _answer(self, dice: List[int], key: Hashable, decision: Optional[Decision],
+                computed: Optional[Tuple[List[int], bool]], start: float) -> Tuple[List[int], bool]:
+        if decision is None:
+            indices, bank = computed
+            decision = (_kept_faces(dice, indices), bank)
+            self.cache.put(key, decision)
+        faces, bank = decision
+        AI_DECISION_LATENCY.observe(time.perf_counter() - start)
+        return _indices_for(dice, faces), bank
+
+    def decide(self, dice: List[int], turn_score: int, my_total: int) -> Tuple[List[int], bool]:
+        """(indices of the dice to keep, bank afterwards?) for the AI's current roll."""
+        start = time.perf_counter()
+        key = self._key(dice, turn_score, my_total)
+        decision: Optional[Decision] = self.cache.get(key)
+        computed = None
+        if decision is None:
+            computed = self.batcher.submit(dice, turn_score, my_total).result()
+        return self._answer(dice, key, decision, computed, start)
+
+    async def decide_async(self, dice: List[int], turn_score: int, my_total: int) -> Tuple[List[int], bool]:
+        """decide() for event-loop callers: waits for the batcher without blocking the loop."""
+        start = time.perf_counter()
+        key = self._key(dice, turn_score, my_total)
+        decision: Optional[Decision] = self.cache.get(key)
+        computed = None
+        if decision is None:
+            computed = await asyncio.wrap_future(self.batcher.submit(dice, turn_score, my_total))
+        return self._answer(dice, key, decision, computed, start)
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            'cache_entries': len(self.cache),
+            'cache_hit_rate': self.cache.hit_rate(),
+            'cache_hits_total': self.cache.hits,
+            'cache_misses_total': self.cache.misses,
+            'batches_total': self.batcher.batches,
+            'policy_decisions_total': self.batcher.decisions,
+        }
+
+
+async def play_turn_async(game: Game, ai: AIPlayer) -> AsyncIterator[str]:
+    """
+    Play the current player's whole turn with `ai`, yielding the name of each
+    move ('roll', 'keep', 'bank' or 'zilch') right after it is applied.
+    """
+    player = game.current_player
+    while not game.finished and game.current_player == player:
+        if engine.roll(game):
+            yield 'zilch'
+            return
+        yield 'roll'
+        indices, bank = await ai.decide_async(game.dice, game.turn_score, game.total(player))
+        engine.keep(game, indices)
+        yield 'keep'
+        if bank:
+            engine.bank(game)
+            yield 'bank'
+            return
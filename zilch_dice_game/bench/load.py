@@ -0,0 +1,196 @@
+"""
+In-process load test for the game API.
+
+Simulated players each play whole games against zilch_dice_game.main:app
+over httpx's ASGI transport: create a game, then roll / keep the scoring
+dice / bank, handing over to the AI after every turn. Every request is
+timed and grouped by endpoint; the report gives throughput plus p50, p95
+and p99 latency per endpoint and can be written as JSON.
+
+    python -m zilch_dice_game.bench.load --players 200 --games 2 --output run.json
+    python -m zilch_dice_game.bench.load --baseline run.json --max-regression 0.2
+
+With --baseline the run fails (exit status 1) when throughput drops, or a
+p95/p99 latency rises, by more than --max-regression relative to the
+baseline report.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .. import scoring
+
+Report = Dict[str, Any]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class Recorder:
+    """Collects per-endpoint latencies."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        response = await client.post(url, **kwargs)
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+        if response.status_code != 200:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        return response
+
+    def report(self, wall_seconds: float) -> Report:
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            endpoints[endpoint] = {
+                'count': len(values),
+                'errors': self.errors.get(endpoint, 0),
+                'rps': len(values) / wall_seconds,
+                'mean_ms': 1000 * sum(values) / len(values),
+                'p50_ms': 1000 * percentile(values, 50),
+                'p95_ms': 1000 * percentile(values, 95),
+                'p99_ms': 1000 * percentile(values, 99),
+            }
+        total = sum(e['count'] for e in endpoints.values())
+        return {
+            'wall_seconds': wall_seconds,
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'throughput_rps': total / wall_seconds,
+            'endpoints': endpoints,
+        }
+
+
+async def play_game(client: httpx.AsyncClient, rec: Recorder, bank_at: int, max_turns: int) -> None:
+    """One game: the human keeps every scoring die and banks at `bank_at` or with two dice left."""
+    game = (await rec.request(client, 'POST /game/new', '/game/new')).json()['game']
+    game_id = game['game_id']
+    turns = 0
+    while not game['finished'] and turns < max_turns:
+        if game['current_player'] != 0:
+            game = (await rec.request(client, 'POST /game/{id}/ai-turn', f'/game/{game_id}/ai-turn')).json()
+            turns += 1
+            continue
+        game = (await rec.request(client, 'POST /game/{id}/roll', f'/game/{game_id}/roll')).json()
+        if game['zilch'] or game['current_player'] != 0:
+            continue
+        mask = scoring.scoring_mask(game['dice'])
+        indices = [i for i in range(len(game['dice'])) if mask >> i & 1]
+        game = (await rec.request(client, 'POST /game/{id}/keep', f'/game/{game_id}/keep',
+                                  json={'indices': indices})).json()
+        left = sum(1 for d in game['dice'] if d)
+        if left and (game['turn_score'] >= bank_at or left <= 2):
+            game = (await rec.request(client, 'POST /game/{id}/bank', f'/game/{game_id}/bank')).json()
+            turns += 1
+
+
+async def run_load(
+    players: int = 100,
+    games_per_player: int = 1,
+    bank_at: int = 350,
+    max_turns: int = 200,
+    seed: Optional[int] = None,
+    app=None,
+) -> Report:
+    """Run `players` concurrent players, each playing `games_per_player` games in a row."""
+    from .. import main as server
+    if app is None:
+        app = server.app
+    if seed is not None:
+        # Game seeds follow creation order, which concurrency can shuffle,
+        # so runs are repeatable in aggregate rather than game by game
+        server.seed_games(seed)
+    rec = Recorder()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://zilch') as client:
+
+        async def player() -> None:
+            for _ in range(games_per_player):
+                await play_game(client, rec, bank_at, max_turns)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(player() for _ in range(players)))
+        wall = time.perf_counter() - start
+    report = rec.report(wall)
+    report['config'] = {
+        'players': players,
+        'games_per_player': games_per_player,
+        'bank_at': bank_at,
+        'max_turns': max_turns,
+        'seed': seed,
+    }
+    return report
+
+
+def regressions(report: Report, baseline: Report, max_regression: float) -> List[str]:
+    """Ways `report` is worse than `baseline` by more than the allowed fraction."""
+    found = []
+    if report['throughput_rps'] < baseline['throughput_rps'] * (1 - max_regression):
+        found.append(f"throughput {report['throughput_rps']:.0f} rps < baseline {baseline['throughput_rps']:.0f} rps")
+    for endpoint, old in baseline['endpoints'].items():
+        new = report['endpoints'].get(endpoint)
+        if new is None:
+            continue
+        for key in ('p95_ms', 'p99_ms'):
+            if new[key] > old[key] * (1 + max_regression):
+                found.append(f'{endpoint} {key} {new[key]:.2f} > baseline {old[key]:.2f}')
+    return found
+
+
+def format_report(report: Report) -> str:
+    lines = [
+        f"{report['requests']} requests in {report['wall_seconds']:.2f}s "
+        f"= {report['throughput_rps']:.0f} req/s, {report['errors']} errors",
+        f"{'endpoint':28} {'count':>7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}",
+    ]
+    for endpoint, e in report['endpoints'].items():
+        lines.append(
+            f"{endpoint:28} {e['count']:7d} {e['rps']:8.0f} {e['p50_ms']:8.2f} {e['p95_ms']:8.2f} {e['p99_ms']:8.2f}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Load test the Zilch API in process.')
+    parser.add_argument('--players', type=int, default=100, help='concurrent simulated players')
+    parser.add_argument('--games', type=int, default=1, help='games each player plays')
+    parser.add_argument('--bank-at', type=int, default=350, help='turn score at which players bank')
+    parser.add_argument('--max-turns', type=int, default=200, help='stop a game after this many turns')
+    parser.add_argument('--seed', type=int, default=None, help='derive game seeds from this for repeatable runs')
+    parser.add_argument('--output', help='write the report here as JSON')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='allowed fractional slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args.players, args.games, args.bank_at, args.max_turns, args.seed))
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(report, baseline, args.max_regression)
+        for problem in found:
+            print(f'REGRESSION: {problem}', file=sys.stderr)
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
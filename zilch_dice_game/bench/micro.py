@@ -0,0 +1,346 @@
+"""
+Micro-benchmarks for the hot paths of scoring, the RL state helpers, the
+agent and the environments.
+
+Every case is run the same way: a setup builds its inputs outside the
+timing, a warmup runs it for --warmup seconds, then --repeat repetitions
+each time a loop sized so one repetition lasts about --min-time seconds.
+The report gives the best and median calls per second (and items per
+second for batch calls), plus allocations measured with tracemalloc over
+separate calls: the peak bytes a single call allocates and the bytes each
+call leaves behind.
+
+    python -m zilch_dice_game.bench.micro --output micro.json
+    python -m zilch_dice_game.bench.micro --filter agent --repeat 10
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from .. import scoring
+from ..utils.state_utils import ActionSpace, basic_valid_actions, encode_state, valid_action_masks
+
+Call = Callable[[], Any]
+
+
+class Case(NamedTuple):
+    name: str
+    # Builds inputs and returns the function to time, or a context manager
+    # giving it when the case has something to clean up afterwards
+    setup: Callable[[], Any]
+    items: int = 1             # units of work per call, for batch operations
+
+
+def _rolls(count: int = 1024, seed: int = 0) -> List[List[int]]:
+    rng = np.random.default_rng(seed)
+    dice = rng.integers(1, 7, size=(count, 6))
+    # Mix in set-aside dice the way mid-turn rolls look
+    dice[rng.random((count, 6)) < 0.2] = 0
+    return dice.tolist()
+
+
+def _cycle(values: List[Any]) -> Callable[[], Any]:
+    """A cheap endless iterator over `values` (the same cost for every case)."""
+    state = {'i': 0}
+    n = len(values)
+
+    def next_value() -> Any:
+        i = state['i']
+        state['i'] = (i + 1) % n
+        return values[i]
+
+    return next_value
+
+
+def _observations(count: int = 1024, seed: int = 0) -> np.ndarray:
+    from ..rl.qtable import sample_valid
+    from ..rl.vec_env import VecZilchEnv
+    env = VecZilchEnv(count, seed=seed)
+    obs = env.reset()
+    rng = np.random.default_rng(seed)
+    for _ in range(5):
+        obs, _, _, _ = env.step(sample_valid(valid_action_masks(env.dice), rng))
+    return obs
+
+
+def _agent(backend: str, states: int = 0):
+    from ..rl.agent import ZilchRLAgent
+    agent = ZilchRLAgent(ActionSpace(), epsilon=0.1, q_backend=backend)
+    obs = _observations(max(states, 2))
+    for i in range(states):
+        agent.update(obs[i], i % agent.action_space.size(), 1.0, obs[(i + 1) % len(obs)], False)
+    return agent, obs
+
+
+# --- cases ---
+
+def _score():
+    rolls = _cycle(_rolls())
+    return lambda: scoring.score(rolls())
+
+
+def _keep_score():
+    rolls = _cycle(_rolls())
+    return lambda: scoring.keep_score(rolls())
+
+
+def _scoring_mask():
+    rolls = _cycle(_rolls())
+    return lambda: scoring.scoring_mask(rolls())
+
+
+def _score_many():
+    batch = np.array(_rolls())
+    return lambda: scoring.score_many(batch)
+
+
+def _encode_state():
+    rolls = _cycle(_rolls())
+    return lambda: encode_state(rolls(), 350, 2500, 4000, 1)
+
+
+def _basic_valid_actions():
+    rolls = _cycle(_rolls())
+    return lambda: basic_valid_actions(rolls())
+
+
+def _valid_action_masks():
+    batch = np.array(_rolls())
+    return lambda: valid_action_masks(batch)
+
+
+def _choose_action(backend: str) -> Callable[[], Call]:
+    def setup():
+        agent, obs = _agent(backend, 1024)
+        states = _cycle(list(obs))
+        return lambda: agent.choose_action(states())
+    return setup
+
+
+def _update(backend: str) -> Callable[[], Call]:
+    def setup():
+        agent, obs = _agent(backend, 1024)
+        n = len(obs)
+        i = _cycle(list(range(n)))
+
+        def update():
+            k = i()
+            agent.update(obs[k], k & 1, 1.0, obs[(k + 1) % n], False)
+        return update
+    return setup
+
+
+REPLAY_BATCH = 512
+
+
+def _update_batch(backend: str) -> Callable[[], Call]:
+    def setup():
+        from ..rl.replay import ReplayBuffer
+        agent, obs = _agent(backend, 1024)
+        buffer = ReplayBuffer(len(obs), seed=0)
+        n = len(obs)
+        buffer.add_batch(obs, np.arange(n) & 1, np.ones(n), np.roll(obs, -1, axis=0), np.zeros(n, dtype=bool))
+
+        def update():
+            batch = buffer.sample(REPLAY_BATCH)
+            agent.update_batch(batch['states'], batch['actions'], batch['rewards'],
+                               batch['next_states'], batch['dones'])
+        return update
+    return setup
+
+
+def _save(suffix: str) -> Callable[[], Any]:
+    @contextlib.contextmanager
+    def setup():
+        agent, _ = _agent('dict', 1024)
+        with tempfile.TemporaryDirectory(prefix='zilch-bench-') as directory:
+            path = os.path.join(directory, 'model' + suffix)
+            yield lambda: agent.save(path)
+    return setup
+
+
+def _load(suffix: str) -> Callable[[], Any]:
+    @contextlib.contextmanager
+    def setup():
+        agent, _ = _agent('dict', 1024)
+        with tempfile.TemporaryDirectory(prefix='zilch-bench-') as directory:
+            path = os.path.join(directory, 'model' + suffix)
+            agent.save(path)
+            yield lambda: agent.load(path)
+    return setup
+
+
+def _env_step():
+    from ..rl.env import ZilchEnv
+    env = ZilchEnv(seed=0)
+    env.reset()
+    # A random legal action each step, looked up per roll so choosing it costs little
+    legal: Dict[tuple, List[int]] = {}
+    draws = _cycle(np.random.default_rng(0).random(1024).tolist())
+
+    def step():
+        dice = tuple(env.game_state.dice)
+        actions = legal.get(dice)
+        if actions is None:
+            actions = legal[dice] = env.action_space.valid_actions(dice)
+        # Resetting finished games is part of the cost of stepping
+        if env.step(actions[int(draws() * len(actions))])[2]:
+            env.reset()
+    return step
+
+
+VEC_ENVS = 1024
+
+
+def _vec_env_step():
+    from ..rl.vec_env import VecZilchEnv
+    env = VecZilchEnv(VEC_ENVS, seed=0)
+    env.reset()
+    # New random legal actions every call: the highest-weighted legal action per
+    # game, with the weights cycled from a precomputed pool
+    rng = np.random.default_rng(0)
+    weights = _cycle([rng.random((VEC_ENVS, env.action_space.size())) for _ in range(16)])
+    return lambda: env.step(np.argmax(valid_action_masks(env.dice) * weights(), axis=1))
+
+
+CASES = [
+    Case('scoring.score', _score),
+    Case('scoring.keep_score', _keep_score),
+    Case('scoring.scoring_mask', _scoring_mask),
+    Case('scoring.score_many', _score_many, items=1024),
+    Case('state_utils.encode_state', _encode_state),
+    Case('state_utils.basic_valid_actions', _basic_valid_actions),
+    Case('state_utils.valid_action_masks', _valid_action_masks, items=1024),
+    Case('agent.choose_action[dict]', _choose_action('dict')),
+    Case('agent.choose_action[dense]', _choose_action('dense')),
+    Case('agent.update[dict]', _update('dict')),
+    Case('agent.update[dense]', _update('dense')),
+    Case('agent.update_batch[dict]', _update_batch('dict'), items=REPLAY_BATCH),
+    Case('agent.update_batch[dense]', _update_batch('dense'), items=REPLAY_BATCH),
+    Case('agent.save[json]', _save('.json')),
+    Case('agent.save[binary]', _save('.zqtb')),
+    Case('agent.load[json]', _load('.json')),
+    Case('agent.load[binary]', _load('.zqtb')),
+    Case('env.step', _env_step),
+    Case('vec_env.step', _vec_env_step, items=VEC_ENVS),
+]
+
+
+# --- runner ---
+
+def _time_loop(fn: Call, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return time.perf_counter() - start
+
+
+def _allocations(fn: Call, calls: int) -> Dict[str, float]:
+    tracemalloc.start()
+    try:
+        fn()  # let caches and lazily built state settle first
+        peak = 0
+        for _ in range(min(calls, 100)):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(calls):
+            fn()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_bytes_per_call': peak, 'retained_bytes_per_call': (after - before) / calls}
+
+
+def run_case(case: Case, warmup: float = 0.1, repeat: int = 5, min_time: float = 0.2,
+             allocations: bool = True) -> Dict[str, Any]:
+    setup = case.setup()
+    if not hasattr(setup, '__enter__'):
+        setup = contextlib.nullcontext(setup)
+    with setup as fn:
+        return _measure(case, fn, warmup, repeat, min_time, allocations)
+
+
+def _measure(case: Case, fn: Call, warmup: float, repeat: int, min_time: float,
+             allocations: bool) -> Dict[str, Any]:
+    # Warm up, and size the loop so a repetition takes about min_time
+    number, elapsed, deadline = 1, 0.0, time.perf_counter() + warmup
+    while True:
+        elapsed = _time_loop(fn, number)
+        if elapsed >= min_time or (time.perf_counter() >= deadline and elapsed * 10 >= min_time):
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    rates = sorted(number / _time_loop(fn, number) for _ in range(repeat))
+    result = {
+        'calls_per_rep': number,
+        'repeat': repeat,
+        'best_ops_per_sec': rates[-1],
+        'median_ops_per_sec': statistics.median(rates),
+        'us_per_call': 1e6 / rates[-1],
+        'items_per_call': case.items,
+        'best_items_per_sec': rates[-1] * case.items,
+    }
+    if allocations:
+        result.update(_allocations(fn, min(number, 1000)))
+    return result
+
+
+def run(pattern: Optional[str] = None, **options) -> Dict[str, Any]:
+    results = {}
+    for case in CASES:
+        if pattern and pattern not in case.name:
+            continue
+        results[case.name] = run_case(case, **options)
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'options': options,
+        'results': results,
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{'case':34} {'ops/s':>12} {'us/call':>10} {'peak B':>9} {'kept B':>8}"]
+    for name, r in report['results'].items():
+        lines.append(
+            f"{name:34} {r['best_ops_per_sec']:12,.0f} {r['us_per_call']:10.2f} "
+            f"{r.get('peak_bytes_per_call', 0):9,.0f} {r.get('retained_bytes_per_call', 0):8.1f}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for Zilch hot paths.')
+    parser.add_argument('--filter', help='only run cases whose name contains this')
+    parser.add_argument('--warmup', type=float, default=0.1, help='seconds of warmup per case')
+    parser.add_argument('--repeat', type=int, default=5, help='timed repetitions per case')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per repetition')
+    parser.add_argument('--no-alloc', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', help='write the report here as JSON')
+    args = parser.parse_args(argv)
+
+    report = run(args.filter, warmup=args.warmup, repeat=args.repeat,
+                 min_time=args.min_time, allocations=not args.no_alloc)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Cold-start benchmark for the API process.
+
+Every run starts a fresh interpreter that imports zilch_dice_game.main,
+runs the app's startup (lifespan) and sends its first requests over
+httpx's ASGI transport, timing from just before the import:
+
+    import_ms         importing the app
+    ready_ms          the app started and answered its first request (GET /)
+    first_game_ms     the first POST /game/new on its own
+    first_ai_turn_ms  the first AI turn on its own (waits for the AI if it
+                      is still loading)
+    ai_ready_ms       the AI player built, by the warmup or the first AI turn
+    process_ms        the whole child process, interpreter start and exit included
+
+and whether importing the app loaded NumPy. The report gives the median of
+--runs runs and can be written as JSON.
+
+    python -m zilch_dice_game.bench.startup --runs 5 --output startup.json
+    python -m zilch_dice_game.bench.startup --runs 5 --baseline startup.json --max-regression 0.2
+    python -m zilch_dice_game.bench.startup --no-warmup
+
+The server itself (uvicorn) is not started, so its own start-up time is
+not included.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+Report = Dict[str, Any]
+
+TIMINGS = ('import_ms', 'ready_ms', 'first_game_ms', 'first_ai_turn_ms', 'ai_ready_ms', 'process_ms')
+
+# Run in the child; nothing is imported before the clock starts
+_CHILD = """
+import time
+start = time.perf_counter()
+import zilch_dice_game.main as main
+imported = time.perf_counter()
+from zilch_dice_game.bench.startup import first_requests
+print(first_requests(main, start, imported))
+"""
+
+
+async def _first_requests(main, start: float, imported: float) -> Dict[str, Any]:
+    numpy_imported = 'numpy' in sys.modules
+    before_client = time.perf_counter()
+    import httpx
+    # The client's import is not part of the app's start-up
+    offset = time.perf_counter() - before_client
+
+    def ms(t: float) -> float:
+        return 1000 * (t - start - offset)
+
+    async def ai_ready() -> float:
+        while main._ai is None:
+            await asyncio.sleep(0.001)
+        return time.perf_counter()
+
+    app = main.app
+    async with app.router.lifespan_context(app):
+        watcher = asyncio.create_task(ai_ready())
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://zilch') as client:
+            (await client.get('/')).raise_for_status()
+            ready = time.perf_counter()
+
+            t = time.perf_counter()
+            response = await client.post('/game/new')
+            first_game = time.perf_counter() - t
+            response.raise_for_status()
+            game = response.json()['game']
+            game_id = game['game_id']
+            # End the human's turn as cheaply as possible: bank the first roll's best keep
+            game = (await client.post(f'/game/{game_id}/roll')).json()
+            if not game['zilch'] and game['current_player'] == 0:
+                from zilch_dice_game import scoring
+                mask = scoring.scoring_mask(game['dice'])
+                indices = [i for i in range(len(game['dice'])) if mask >> i & 1]
+                await client.post(f'/game/{game_id}/keep', json={'indices': indices})
+                await client.post(f'/game/{game_id}/bank')
+
+            t = time.perf_counter()
+            response = await client.post(f'/game/{game_id}/ai-turn')
+            first_ai_turn = time.perf_counter() - t
+            response.raise_for_status()
+        ai_ready_at = await watcher
+    return {
+        'import_ms': 1000 * (imported - start),
+        'ready_ms': ms(ready),
+        'first_game_ms': 1000 * first_game,
+        'first_ai_turn_ms': 1000 * first_ai_turn,
+        'ai_ready_ms': ms(ai_ready_at),
+        'numpy_imported_by_app': numpy_imported,
+    }
+
+
+def first_requests(main, start: float, imported: float) -> str:
+    """Child side: time the app's first requests and return the result as JSON."""
+    return json.dumps(asyncio.run(_first_requests(main, start, imported)))
+
+
+def run_once(warmup: bool = True) -> Dict[str, Any]:
+    """One cold start in a fresh interpreter."""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, ZILCH_AI_WARMUP='1' if warmup else '0')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (root, env.get('PYTHONPATH'))))
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', _CHILD], env=env, capture_output=True, text=True)
+    process = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f'Start-up run failed:\n{proc.stderr}')
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['process_ms'] = 1000 * process
+    return result
+
+
+def run(runs: int = 5, warmup: bool = True) -> Report:
+    results = [run_once(warmup) for _ in range(runs)]
+    return {
+        'median': {key: statistics.median(r[key] for r in results) for key in TIMINGS},
+        'numpy_imported_by_app': any(r['numpy_imported_by_app'] for r in results),
+        'runs': results,
+        'config': {'runs': runs, 'warmup': warmup},
+    }
+
+
+def regressions(report: Report, baseline: Report, max_regression: float) -> List[str]:
+    """Median timings of `report` slower than `baseline` by more than the allowed fraction."""
+    found = []
+    for key in TIMINGS:
+        new, old = report['median'][key], baseline['median'].get(key)
+        if old is not None and new > old * (1 + max_regression):
+            found.append(f'{key} {new:.1f} > baseline {old:.1f}')
+    return found
+
+
+def format_report(report: Report) -> str:
+    median = report['median']
+    lines = [f"{'median of ' + str(report['config']['runs']) + ' runs':24} {'ms':>9}"]
+    lines += [f'{key:24} {median[key]:9.1f}' for key in TIMINGS]
+    lines.append(f"NumPy imported by the app: {'yes' if report['numpy_imported_by_app'] else 'no'}")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Measure the API cold-start time.')
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes to time')
+    parser.add_argument('--no-warmup', action='store_true', help='build the AI on its first turn, not at startup')
+    parser.add_argument('--output', help='write the report here as JSON')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='allowed fractional slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    report = run(args.runs, warmup=not args.no_warmup)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(report, baseline, args.max_regression)
+        for problem in found:
+            print(f'REGRESSION: {problem}', file=sys.stderr)
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
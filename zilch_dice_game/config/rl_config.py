@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
@@ -9,14 +10,35 @@ class RLConfig:
     epsilon_start: float = 1.0   # initial exploration
     epsilon_min: float = 0.01    # minimum exploration
     epsilon_decay: float = 0.999 # decay per step
+    q_backend: str = "dict"      # "dict" or "dense" (array-backed DenseQTable)
 
     # Training settings
     episodes: int = 1000
     max_steps_per_episode: int = 200
 
+    # Parallel training (used when num_workers > 1)
+    num_workers: int = 1         # actor processes generating episodes
+    sync_interval: int = 100     # episodes each actor plays per policy sync
+
+    # Experience replay (single process, used when buffer_size > 0): games
+    # are stepped in a VecZilchEnv and every step applies one update of
+    # batch_size transitions sampled from the buffer
+    buffer_size: int = 0         # transitions kept; 0 = update online after every step
+    batch_size: int = 512        # transitions per replay update
+
+    # Seeds the environments, exploration and actors; None draws a fresh
+    # one per run (checkpoints record the RNG state either way)
+    seed: Optional[int] = None
+
     # Persistence
     model_path: str = "./q_table.json"
 
+    # Checkpoints, written in the background (see rl/checkpoint.py)
+    checkpoint_dir: str = ""        # "" = no checkpoints
+    checkpoint_every: int = 1000    # episodes between checkpoints
+    checkpoint_full_every: int = 10 # every Nth checkpoint is a full snapshot, the rest incremental
+    resume_from: str = ""           # checkpoint directory to continue training from
+
 
 default_config = RLConfig()
 
@@ -0,0 +1,62 @@
+from dataclasses import dataclass, fields
+import os
+
+
+@dataclass
+class ServerConfig:
+    # Game store
+    store_backend: str = "memory"              # "memory" (per process) or "sqlite" (shared by workers)
+    store_path: str = "zilch_games.db"         # SQLite database file
+    store_flush_ms: float = 5.0                # SQLite write-behind interval
+    store_cache_size: int = 10_000             # SQLite per-worker hot cache
+    store_ttl_seconds: float = 3600.0          # idle games expire after this long
+    store_finished_ttl_seconds: float = 60.0   # finished games are kept this long
+    store_max_games: int = 100_000             # LRU eviction past this many games
+    store_max_bytes: int = 0                   # ... or past this many bytes (0 = no limit)
+
+    # AI player
+    auto_ai_turn: bool = False     # play the AI's turn as soon as the human's ends
+    ai_policy_path: str = ""       # solved TurnPolicy (.npz); solved in-process if unset/missing
+    ai_cache_size: int = 65536     # memoized decisions kept in the LRU cache
+    ai_batch_size: int = 256       # most decisions evaluated in one policy call
+    ai_batch_wait_ms: float = 1.0  # how long a batch waits for more decisions
+    ai_warmup: bool = True         # build the AI in the background at startup instead of on its first turn
+
+    # Dice
+    dice_seed: int = 0  # derive every game's seed from this, for repeatable runs (0 = random seeds)
+
+    # Event log
+    event_log_path: str = ""                    # append every move here (unset = no log)
+    event_log_flush_ms: float = 50.0            # write + fsync interval; a crash loses at most this
+    event_log_snapshot_seconds: float = 300.0   # fold the log tail into a snapshot this often
+    event_log_recover: bool = True              # rebuild games missing from the store at startup
+
+    # Observability
+    metrics_enabled: bool = True     # time requests and serve /metrics
+    profiling_enabled: bool = False  # expose the /debug/profile sampling profiler
+
+    # Batch endpoints
+    batch_max_games: int = 1000    # most games one POST /games/batch may create
+    batch_max_actions: int = 1000  # longest action list for POST /game/{id}/actions
+
+    @classmethod
+    def from_env(cls, prefix: str = "ZILCH_") -> "ServerConfig":
+        """Defaults overridden by environment variables, e.g. ZILCH_AUTO_AI_TURN=1."""
+        cfg = cls()
+        for f in fields(cls):
+            raw = os.environ.get(prefix + f.name.upper())
+            if raw is None:
+                continue
+            if f.type in (bool, "bool"):
+                value = raw.strip().lower() in ("1", "true", "yes", "on")
+            elif f.type in (int, "int"):
+                value = int(raw)
+            elif f.type in (float, "float"):
+                value = float(raw)
+            else:
+                value = raw
+            setattr(cfg, f.name, value)
+        return cfg
+
+
+default_config = ServerConfig.from_env()
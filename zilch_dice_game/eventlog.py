@@ -0,0 +1,359 @@
+"""
+Append-only binary event log of game moves, with snapshots and replay.
+
+Every game creation and every roll/keep/bank, by either player, is written
+as one fixed-width 48-byte record:
+
+    type       B   CREATE, ROLL, KEEP or BANK
+    flags      B   1: game id is a UUID, 2: player 1 moved,
+                   4: the roll was a zilch, 8: the game finished
+    mask       H   KEEP: bitmask of the dice positions kept
+    version    I   game version the move was made on
+    time       d   unix time
+    game_id    16s UUID bytes, or an ASCII id of up to 16 bytes
+    data       16s CREATE: the game's dice seed; moves: the state after
+                   the move (packed dice, turn score, total 0, total 1)
+
+Dice come from each game's seeded stream (rng.py), so (seed, moves) is
+enough to rebuild a game; the state stored with each move is there to
+verify the replay and to serve the log directly as training data
+(load_records maps the file as a NumPy structured array, no parsing;
+NumPy is only imported then, not by the server writing the log).
+
+Writes are appended to an in-memory buffer and a background thread writes
+and fsyncs everything buffered every `flush_interval` seconds, so a crash
+loses at most that window. Every `snapshot_interval` seconds the same
+thread writes a snapshot: every unfinished game, in Game.to_bytes form,
+plus the log offset it is valid at. Recovery loads the latest snapshot and
+replays only the records after that offset, so it takes time in
+proportion to the tail rather than the whole history. A finished game
+drops out of snapshots, and so does a game with no move for `max_idle`
+seconds (the server passes its store TTL, after which the store has
+forgotten the game too). rebuild_game() still finds either by scanning the
+log.
+"""
+import os
+import struct
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from . import engine
+from .state import Game
+
+if TYPE_CHECKING:
+    import numpy as np
+
+CREATE, ROLL, KEEP, BANK = 1, 2, 3, 4
+_ACTIONS = {'roll': ROLL, 'keep': KEEP, 'bank': BANK}
+
+FLAG_UUID, FLAG_PLAYER1, FLAG_ZILCH, FLAG_FINISHED = 1, 2, 4, 8
+
+RECORD = struct.Struct('<BBHId16s16s')
+RECORD_SIZE = RECORD.size  # 48
+_STATE = struct.Struct('<IIII')
+
+
+@lru_cache(maxsize=None)
+def record_dtype() -> 'np.dtype':
+    """NumPy structured dtype of one record."""
+    import numpy as np
+    dtype = np.dtype([
+        ('type', 'u1'), ('flags', 'u1'), ('mask', '<u2'), ('version', '<u4'), ('time', '<f8'),
+        ('game_id', 'V16'), ('dice', '<u4'), ('turn_score', '<u4'), ('total0', '<u4'), ('total1', '<u4'),
+    ])
+    assert dtype.itemsize == RECORD_SIZE
+    return dtype
+
+
+_SNAPSHOT = struct.Struct('<4sIQI')  # magic, format, log offset, game count
+_SNAPSHOT_GAME = struct.Struct('<Id')  # size of the game's bytes, unix time of its last move
+_SNAPSHOT_MAGIC = b'ZSNP'
+_SNAPSHOT_FORMAT = 2  # 1 had no last-move times
+
+
+class CorruptLogError(ValueError):
+    """A replayed move didn't reproduce the state recorded with it."""
+
+
+def encode_game_id(game_id: str) -> Tuple[bytes, int]:
+    """16 id bytes and the flag telling how to read them back."""
+    try:
+        parsed = uuid.UUID(game_id)
+        if str(parsed) == game_id:
+            return parsed.bytes, FLAG_UUID
+    except ValueError:
+        pass
+    raw = game_id.encode('ascii')
+    if len(raw) > 16:
+        raise ValueError(f'Game id {game_id!r} is neither a UUID nor 16 ASCII characters or fewer')
+    return raw.ljust(16, b'\0'), 0
+
+
+def decode_game_id(raw: bytes, flags: int) -> str:
+    if flags & FLAG_UUID:
+        return str(uuid.UUID(bytes=bytes(raw)))
+    return bytes(raw).rstrip(b'\0').decode('ascii')
+
+
+def encode_create(game: Game) -> bytes:
+    raw_id, flags = encode_game_id(game.game_id)
+    return RECORD.pack(CREATE, flags, 0, game.version, time.time(), raw_id, game.seed.ljust(16, b'\0'))
+
+
+def encode_move(game: Game, action: str, mask: int = 0, player: Optional[int] = None) -> bytes:
+    """
+    Record for a move that has just been applied to `game`. `player` is who
+    made it (default: the player on turn, which is wrong after a bank or a
+    zilch has passed the turn, so pass it then).
+    """
+    raw_id, flags = encode_game_id(game.game_id)
+    if player is None:
+        player = game.current_player
+    flags |= FLAG_PLAYER1 * player | FLAG_ZILCH * (action == 'roll' and game.zilch) | FLAG_FINISHED * game.finished
+    state = _STATE.pack(game.packed_dice, game.turn_score, game.total0, game.total1)
+    return RECORD.pack(_ACTIONS[action], flags, mask, game.version, time.time(), raw_id, state)
+
+
+def mask_of(indices) -> int:
+    mask = 0
+    for i in indices:
+        mask |= 1 << i
+    return mask
+
+
+def load_records(path: str, start: int = 0) -> 'np.ndarray':
+    """Every whole record from byte `start` on, memory-mapped as record_dtype()."""
+    import numpy as np
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    count = (size - start) // RECORD_SIZE
+    if count <= 0:
+        return np.empty(0, dtype=record_dtype())
+    return np.memmap(path, dtype=record_dtype(), mode='r', offset=start, shape=(count,))
+
+
+def iter_records(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[tuple]:
+    """Unpacked records between two byte offsets; a torn record at the end is ignored."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(max(0, end - start))
+    whole = len(data) - len(data) % RECORD_SIZE
+    yield from RECORD.iter_unpack(memoryview(data)[:whole])
+
+
+def apply_record(games: Dict[str, Game], record: tuple, verify: bool = True) -> Optional[Game]:
+    """Apply one unpacked record to `games`; returns the game it touched."""
+    kind, flags, mask, version, _, raw_id, data = record
+    game_id = decode_game_id(raw_id, flags)
+    if kind == CREATE:
+        game = games[game_id] = engine.new_game(game_id, bytes(data))
+        game.version = version
+        return game
+    game = games.get(game_id)
+    if game is None:
+        # Created before the snapshot we started from and since finished
+        return None
+    if kind == ROLL:
+        engine.roll(game)
+    elif kind == KEEP:
+        engine.keep(game, [i for i in range(6) if mask >> i & 1])
+    elif kind == BANK:
+        engine.bank(game)
+    else:
+        raise CorruptLogError(f'Unknown record type {kind}')
+    if verify and _STATE.unpack(data) != (game.packed_dice, game.turn_score, game.total0, game.total1):
+        raise CorruptLogError(f'Replay of game {game_id} diverged at version {version}')
+    game.version = version
+    return game
+
+
+def write_snapshot(path: str, games: Dict[str, Game], offset: int,
+                   last_move: Optional[Dict[str, float]] = None) -> None:
+    """Unfinished games as of log byte `offset`, with their last-move times, written atomically."""
+    live = [g for g in games.values() if not g.finished]
+    now = time.time()
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_SNAPSHOT.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_FORMAT, offset, len(live)))
+        for game in live:
+            data = game.to_bytes()
+            f.write(_SNAPSHOT_GAME.pack(len(data), (last_move or {}).get(game.game_id, now)))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_snapshot(path: str) -> Tuple[Dict[str, Game], Dict[str, float], int]:
+    if not os.path.exists(path):
+        return {}, {}, 0
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, fmt, offset, count = _SNAPSHOT.unpack_from(data)
+    if magic != _SNAPSHOT_MAGIC or fmt not in (1, _SNAPSHOT_FORMAT):
+        raise ValueError(f'{path} is not a game snapshot')
+    # Format 1 games moved no later than the snapshot was written
+    written = os.path.getmtime(path)
+    games: Dict[str, Game] = {}
+    last_move: Dict[str, float] = {}
+    pos = _SNAPSHOT.size
+    for _ in range(count):
+        if fmt == 1:
+            (size,), moved = struct.unpack_from('<I', data, pos), written
+            pos += 4
+        else:
+            size, moved = _SNAPSHOT_GAME.unpack_from(data, pos)
+            pos += _SNAPSHOT_GAME.size
+        game = Game.from_bytes(data[pos:pos + size])
+        games[game.game_id] = game
+        last_move[game.game_id] = moved
+        pos += size
+    return games, last_move, offset
+
+
+def read_snapshot(path: str) -> Tuple[Dict[str, Game], int]:
+    """(games, log offset) from a snapshot, or ({}, 0) if there is none."""
+    games, _, offset = _read_snapshot(path)
+    return games, offset
+
+
+def _rebuild(log_path: str, snapshot_path: Optional[str], end: Optional[int], verify: bool,
+             max_idle: float) -> Tuple[Dict[str, Game], Dict[str, float], int]:
+    games, last_move, start = _read_snapshot(snapshot_path) if snapshot_path else ({}, {}, 0)
+    offset = start
+    for record in iter_records(log_path, start, end):
+        game = apply_record(games, record, verify)
+        if game is not None:
+            last_move[game.game_id] = record[4]
+        offset += RECORD_SIZE
+    if max_idle:
+        cutoff = time.time() - max_idle
+        for game_id in [g for g, moved in last_move.items() if moved < cutoff]:
+            games.pop(game_id, None)
+            del last_move[game_id]
+    return games, last_move, offset
+
+
+def rebuild(log_path: str, snapshot_path: Optional[str] = None, end: Optional[int] = None,
+            verify: bool = True, max_idle: float = 0.0) -> Tuple[Dict[str, Game], int]:
+    """
+    Every game as of log byte `end` (default: the whole log): the snapshot,
+    if any, plus the records after it, leaving out games with no move in
+    the last `max_idle` seconds (0 = keep them). Returns the games and the
+    offset they are valid at.
+    """
+    games, _, offset = _rebuild(log_path, snapshot_path, end, verify, max_idle)
+    return games, offset
+
+
+def rebuild_game(log_path: str, game_id: str, snapshot_path: Optional[str] = None) -> Optional[Game]:
+    """One game: from the snapshot and tail if it is live, else by scanning the whole log."""
+    raw_id, flags = encode_game_id(game_id)
+    games, start = read_snapshot(snapshot_path) if snapshot_path else ({}, 0)
+    if game_id in games:
+        games = {game_id: games[game_id]}
+    else:
+        games, start = {}, 0
+    for record in iter_records(log_path, start):
+        if record[5] == raw_id and (record[1] & FLAG_UUID) == flags:
+            apply_record(games, record)
+    return games.get(game_id)
+
+
+class EventLog:
+    """
+    Writer side of the log: append() queues encoded records and returns at
+    once; a background thread writes, fsyncs and snapshots.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.05, snapshot_interval: float = 300.0,
+                 max_idle: float = 0.0) -> None:
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.max_idle = max_idle  # games idle this long leave snapshots and recovery (0 = never)
+        # _lock only guards the buffer, so append() never waits on the disk;
+        # _file_lock keeps flushes (and so records) in order
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._buffer: List[bytes] = []
+        self._file = open(path, 'ab')
+        # Drop a record torn by a crash so new records stay aligned
+        size = os.path.getsize(path)
+        if size % RECORD_SIZE:
+            size -= size % RECORD_SIZE
+            self._file.truncate(size)
+        self.offset = size
+        self.records_total = 0
+        self.flushes_total = 0
+        self.snapshots_total = 0
+        self._snapshot_offset = read_snapshot(self.snapshot_path)[1]
+        self._last_snapshot = time.monotonic()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='zilch-eventlog', daemon=True)
+        self._flusher.start()
+
+    def append(self, *records: bytes) -> None:
+        with self._lock:
+            self._buffer.extend(records)
+
+    def flush(self) -> None:
+        """Write and fsync everything appended so far."""
+        with self._file_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            data = b''.join(batch)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.offset += len(data)
+            self.records_total += len(batch)
+            self.flushes_total += 1
+
+    def snapshot(self) -> None:
+        """Fold the tail into a new snapshot at the current end of the log."""
+        self.flush()
+        end = self.offset
+        if end == self._snapshot_offset:
+            return
+        games, last_move, offset = _rebuild(self.path, self.snapshot_path, end, True, self.max_idle)
+        write_snapshot(self.snapshot_path, games, offset, last_move)
+        self._snapshot_offset = offset
+        self.snapshots_total += 1
+
+    def recover(self) -> Dict[str, Game]:
+        """Every game still live at the end of the log, from the latest snapshot plus the tail."""
+        self.flush()
+        return rebuild(self.path, self.snapshot_path, max_idle=self.max_idle)[0]
+
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+            if time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+                self._last_snapshot = time.monotonic()
+                self.snapshot()
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            'bytes': self.offset,
+            'tail_bytes': self.offset - self._snapshot_offset,
+            'buffered_records': len(self._buffer),
+            'records_total': self.records_total,
+            'flushes_total': self.flushes_total,
+            'snapshots_total': self.snapshots_total,
+        }
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+        self._file.close()
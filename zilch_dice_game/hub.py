@@ -0,0 +1,75 @@
+"""
+In-process fan-out of game updates to WebSocket subscribers.
+
+Every connection to /game/{id}/ws owns a bounded asyncio queue registered
+here under its game id. Anything that changes a game (HTTP handlers,
+WebSocket commands, AI turns, all running on the event loop) calls publish()
+with the rendered message, and the hub hands it to each subscriber's event
+loop with call_soon_threadsafe, so publishing from another thread or another
+loop works too. Publishing with nobody subscribed is a dict lookup.
+
+Messages carry the whole game state, so a subscriber that falls behind only
+needs the latest ones: when its queue is full the oldest message is dropped.
+Subscribers only see updates made by this process.
+"""
+import asyncio
+import threading
+from typing import Dict, List, Tuple
+
+
+class Subscription:
+    __slots__ = ('game_id', 'queue', 'loop')
+
+    def __init__(self, game_id: str, maxsize: int) -> None:
+        self.game_id = game_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.loop = asyncio.get_running_loop()
+
+    def offer(self, message: bytes) -> None:
+        """Queue a message, dropping the oldest one if the subscriber is behind. Loop thread only."""
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class GameHub:
+    def __init__(self, queue_size: int = 64) -> None:
+        self.queue_size = queue_size
+        self.published = 0
+        self._subscribers: Dict[str, Tuple[Subscription, ...]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, game_id: str) -> Subscription:
+        """Register a subscriber for a game; call from the subscriber's event loop."""
+        sub = Subscription(game_id, self.queue_size)
+        with self._lock:
+            self._subscribers[game_id] = self._subscribers.get(game_id, ()) + (sub,)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            rest = tuple(s for s in self._subscribers.get(sub.game_id, ()) if s is not sub)
+            if rest:
+                self._subscribers[sub.game_id] = rest
+            else:
+                self._subscribers.pop(sub.game_id, None)
+
+    def has_subscribers(self, game_id: str) -> bool:
+        return game_id in self._subscribers
+
+    def publish(self, game_id: str, message: bytes) -> int:
+        """Send a message to every subscriber of a game, from any thread; returns how many."""
+        subs = self._subscribers.get(game_id, ())
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, message)
+            except RuntimeError:
+                # The subscriber's loop has shut down; it will unsubscribe itself
+                pass
+        self.published += len(subs)
+        return len(subs)
+
+    def metrics(self) -> Dict[str, int]:
+        subs: List[Subscription] = [s for group in self._subscribers.values() for s in group]
+        return {'subscribed_games': len(self._subscribers), 'subscribers': len(subs),
+                'messages_published_total': self.published}
@@ -0,0 +1,67 @@
+"""
+Per-game asyncio locks.
+
+Every request that changes a game holds that game's lock for the whole
+read-modify-write, so two requests for the same game run one after the
+other while requests for different games never wait on each other. Locks
+exist only while someone holds or waits on them: each entry counts its
+users and is dropped when the count returns to zero, so the table stays
+as small as the number of games being played at this instant.
+"""
+import asyncio
+from typing import Dict, List
+
+
+class GameLocks:
+    """asyncio.Lock per key, created on demand and reference counted."""
+
+    def __init__(self) -> None:
+        # key -> [lock, holders + waiters]
+        self._locks: Dict[str, List] = {}
+        self.contended_total = 0
+
+    def hold(self, key: str) -> '_Hold':
+        """`async with locks.hold(game_id):` runs the block holding that game's lock."""
+        return _Hold(self, key)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            'locks': len(self._locks),
+            'waiters': sum(users - 1 for _, users in self._locks.values()),
+            'contended_total': self.contended_total,
+        }
+
+
+class _Hold:
+    __slots__ = ('locks', 'key', 'entry')
+
+    def __init__(self, locks: GameLocks, key: str) -> None:
+        self.locks = locks
+        self.key = key
+
+    async def __aenter__(self) -> None:
+        table = self.locks._locks
+        entry = table.get(self.key)
+        if entry is None:
+            entry = table[self.key] = [asyncio.Lock(), 0]
+        elif entry[0].locked():
+            self.locks.contended_total += 1
+        entry[1] += 1
+        self.entry = entry
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._release_entry()
+            raise
+
+    async def __aexit__(self, *exc) -> None:
+        self.entry[0].release()
+        self._release_entry()
+
+    def _release_entry(self) -> None:
+        self.entry[1] -= 1
+        if not self.entry[1]:
+            del self.locks._locks[self.key]
@@ -1,274 +1,485 @@
-# __init__.py
-# from .main import app
-
-# models.py
-from pydantic import BaseModel
-from typing import Dict, List, Optional
-
-class PlayerState(BaseModel):
-    name: str
-    total_score: int = 0
-
-class GameState(BaseModel):
-    game_id: str
-    players: List[PlayerState]  # [0] = human, [1] = AI
-    current_player: int         # 0 = human, 1 = AI
-    dice: List[int] = []        # Current dice values
-    kept: List[int] = []        # Dice kept for scoring
-    turn_score: int = 0         # Score for current turn
-    finished: bool = False
-    winner: Optional[int] = None  # 0 = human, 1 = AI
-
-class KeepRequest(BaseModel):
-    indices: List[int]  # Indices of dice to keep from the current roll
-
-# endpoints.py
-from fastapi import FastAPI, HTTPException
-from .models import PlayerState, GameState, KeepRequest
+# main.py
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional, Sequence
+import asyncio
+import json
+import logging
+import os
+import threading
 import uuid
-import random
 
-app = FastAPI()
+from .models import ActionsRequest, BatchCreateRequest, KeepRequest
+from . import engine
+from .rng import DiceRNG, SEED_BYTES
+from .state import Game
+from .serialization import game_response, games_response, new_game_response, render_event
+from .hub import GameHub, Subscription
+from .locks import GameLocks
+from .eventlog import EventLog, encode_create, encode_move, mask_of
+from .metrics import REGISTRY, MetricsMiddleware, profiler
+from . import serialization
+from .ai import AIPlayer, play_turn_async
+from .config.server_config import ServerConfig, default_config as server_config
+from .store import GameStore, InMemoryGameStore, SQLiteGameStore, StaleGameError
 
-# In-memory store for games (for demo; use DB for production)
-games: Dict[str, GameState] = {}
+logger = logging.getLogger(__name__)
 
-# --- Endpoint: Create New Game ---
-@app.post('/game/new')
-def create_game():
-    game_id = str(uuid.uuid4())
-    players = [PlayerState(name='Human'), PlayerState(name='AI')]
-    game = GameState(
-        game_id=game_id,
-        players=players,
-        current_player=0,  # Human starts
-        dice=[0]*6,
-        kept=[],
-        turn_score=0,
-        finished=False,
-        winner=None
+
+def make_store(cfg: ServerConfig) -> GameStore:
+    if cfg.store_backend == 'sqlite':
+        return SQLiteGameStore(
+            cfg.store_path,
+            flush_interval=cfg.store_flush_ms / 1000,
+            cache_size=cfg.store_cache_size,
+            ttl=cfg.store_ttl_seconds,
+            finished_ttl=cfg.store_finished_ttl_seconds,
+        )
+    if cfg.store_backend != 'memory':
+        raise ValueError(f'Unknown store backend: {cfg.store_backend!r}')
+    return InMemoryGameStore(
+        ttl=cfg.store_ttl_seconds,
+        finished_ttl=cfg.store_finished_ttl_seconds,
+        max_games=cfg.store_max_games,
+        max_bytes=cfg.store_max_bytes,
     )
-    games[game_id] = game
-    return {'game_id': game_id, 'game': game}
 
-# --- Endpoint: Get Game State ---
-@app.get('/game/{game_id}')
-def get_game(game_id: str):
-    game = games.get(game_id)
-    if not game:
-        raise HTTPException(status_code=404, detail='Game not found')
-    return game
 
-# --- Endpoint: Roll Dice ---
-@app.post('/game/{game_id}/roll')
-def roll_dice(game_id: str):
-    game = games.get(game_id)
+def make_event_log(cfg: ServerConfig) -> Optional[EventLog]:
+    if not cfg.event_log_path:
+        return None
+    return EventLog(
+        cfg.event_log_path,
+        flush_interval=cfg.event_log_flush_ms / 1000,
+        snapshot_interval=cfg.event_log_snapshot_seconds,
+        # Don't bring back games the store would already have expired
+        max_idle=cfg.store_ttl_seconds,
+    )
+
+
+store: GameStore = make_store(server_config)
+event_log: Optional[EventLog] = make_event_log(server_config)
+hub = GameHub()
+game_locks = GameLocks()
+
+
+def recover_games() -> int:
+    """Put every game rebuilt from the event log that the store lacks back in it."""
+    if event_log is None:
+        return 0
+    restored = 0
+    for game in event_log.recover().values():
+        if store.get(game.game_id) is None:
+            store.put(game)
+            restored += 1
+    return restored
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if server_config.event_log_recover:
+        recover_games()
+    # The server starts taking requests while the AI is still loading; an
+    # AI turn that arrives first waits for it (get_ai's lock)
+    warmup = asyncio.create_task(warm_up_ai()) if server_config.ai_warmup else None
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    # Flush queued writes before the worker exits
+    store.close()
+    if event_log is not None:
+        event_log.close()
+
+
+# Game endpoints render their JSON directly (see serialization.py); pass
+# ?since=<version> to get only the fields changed since that version.
+#
+# They are async and run on the event loop. Every request for a game holds
+# that game's lock (locks.py) while it reads, changes and stores it, so
+# concurrent requests for one game run in turn and other games never wait.
+# Only a store doing blocking I/O (store.blocking) is called through the
+# threadpool, and AI decisions are awaited rather than waited for.
+app = FastAPI(lifespan=lifespan)
+if server_config.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(StaleGameError)
+def stale_game(request: Request, exc: StaleGameError):
+    return JSONResponse(status_code=409, content={'detail': 'Game was changed by another request; reload it'})
+
+_game_seeds: Optional[DiceRNG] = None
+_game_seeds_lock = threading.Lock()
+
+
+def seed_games(seed: int) -> None:
+    """Derive the seeds of games created from now on from `seed` (0 = random seeds)."""
+    global _game_seeds
+    with _game_seeds_lock:
+        _game_seeds = DiceRNG.from_int(seed) if seed else None
+
+
+def _new_game() -> Game:
+    seed = None
+    if _game_seeds is not None:
+        with _game_seeds_lock:
+            seed = _game_seeds.bytes(SEED_BYTES)
+    return engine.new_game(str(uuid.uuid4()), seed)
+
+
+seed_games(server_config.dice_seed)
+
+AI_PLAYER = 1
+_ai: Optional[AIPlayer] = None
+_ai_lock = threading.Lock()
+
+
+def get_ai() -> AIPlayer:
+    """The shared AI player, built on first use."""
+    global _ai
+    if _ai is None:
+        with _ai_lock:
+            if _ai is None:
+                from .rl.solver import TurnPolicy
+                path = server_config.ai_policy_path
+                policy = TurnPolicy.load(path) if path and os.path.exists(path) else TurnPolicy.solve()
+                _ai = AIPlayer(
+                    policy,
+                    cache_size=server_config.ai_cache_size,
+                    max_batch=server_config.ai_batch_size,
+                    max_wait=server_config.ai_batch_wait_ms / 1000,
+                )
+    return _ai
+
+
+async def _get_ai_async() -> AIPlayer:
+    # The first call imports NumPy and the solver and loads or solves the
+    # policy, which takes a while: keep it off the loop
+    return _ai if _ai is not None else await run_in_threadpool(get_ai)
+
+
+async def warm_up_ai() -> None:
+    """Build the AI player in the background so no request pays for it."""
+    try:
+        await _get_ai_async()
+    except Exception:
+        # Leave it to the first AI turn to report
+        pass
+
+
+async def _store_call(method, *args):
+    """Call a store method, through the threadpool only if the backend blocks."""
+    if store.blocking:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
+
+async def _commit(game: Game, event: str, player: int, records: Sequence[bytes] = ()) -> None:
+    """Store a move, log it and push it to the game's WebSocket subscribers."""
+    await _store_call(store.put, game)
+    if records and event_log is not None:
+        event_log.append(*records)
+    if hub.has_subscribers(game.game_id):
+        hub.publish(game.game_id, render_event(game, event, player))
+
+
+async def _create(games: Sequence[Game]) -> None:
+    def put_all() -> None:
+        for game in games:
+            store.put(game)
+    await _store_call(put_all)
+    if event_log is not None:
+        event_log.append(*(encode_create(game) for game in games))
+
+
+async def _play_ai(game: Game) -> None:
+    # Each AI move is stored and pushed on its own so watchers see the turn unfold
+    ai = await _get_ai_async()
+    before = game.packed_dice
+    async for step in play_turn_async(game, ai):
+        records = ()
+        if event_log is not None:
+            action = 'roll' if step == 'zilch' else step
+            # Kept dice are the ones that went from the table to 0
+            mask = sum(1 << i for i in range(6) if before >> 3 * i & 7 and not game.packed_dice >> 3 * i & 7)
+            records = (encode_move(game, action, mask if action == 'keep' else 0, AI_PLAYER),)
+        before = game.packed_dice
+        await _commit(game, step, AI_PLAYER, records)
+
+
+async def _maybe_auto_ai(game: Game) -> None:
+    """With auto_ai_turn on, play the AI's turn as soon as it is handed over."""
+    if server_config.auto_ai_turn and game.current_player == AI_PLAYER and not game.finished:
+        await _play_ai(game)
+
+
+async def _get_game(game_id: str) -> Game:
+    game = await _store_call(store.get, game_id)
     if not game:
         raise HTTPException(status_code=404, detail='Game not found')
-    if game.finished:
-        raise HTTPException(status_code=400, detail='Game is finished')
-    # Only allow rolling if it's the human's turn
-    if game.current_player != 0:
-        raise HTTPException(status_code=400, detail="It's not your turn")
-    num_to_roll = 6 if len(game.dice) == 0 or all(d == 0 for d in game.dice) else game.dice.count(0)
-    if num_to_roll == 0:
-        num_to_roll = 6  # Hot dice: all dice scored, roll all 6 again
-    new_dice = []
-    for d in game.dice:
-        if d == 0:
-            new_dice.append(random.randint(1, 6))
-        else:
-            new_dice.append(d)
-    if len(new_dice) < 6:
-        new_dice += [random.randint(1, 6) for _ in range(6 - len(new_dice))]
-    game.dice = new_dice
     return game
 
-# --- Endpoint: Keep Dice ---
-@app.post('/game/{game_id}/keep')
-def keep_dice(game_id: str, req: KeepRequest):
-    game = games.get(game_id)
-    if not game:
-        raise HTTPException(status_code=404, detail='Game not found')
-    if game.finished:
-        raise HTTPException(status_code=400, detail='Game is finished')
-    if game.current_player != 0:
-        raise HTTPException(status_code=400, detail="It's not your turn")
-    if any(i < 0 or i >= len(game.dice) for i in req.indices):
-        raise HTTPException(status_code=400, detail='Invalid dice indices')
-    for i in req.indices:
-        if game.dice[i] == 0:
-            continue  # Already kept
-        game.kept.append(game.dice[i])
-        # Add to turn score (simple: 1=100, 5=50, 3 of a kind, etc. - scoring logic can be improved)
-        if game.dice[i] == 1:
-            game.turn_score += 100
-        elif game.dice[i] == 5:
-            game.turn_score += 50
-        # (TODO: Add full scoring logic for triples, straights, etc.)
-        game.dice[i] = 0
+
+def _apply_human(game: Game, action: str, indices: Optional[List[int]] = None,
+                 records: Optional[List[bytes]] = None) -> str:
+    """
+    Apply one human roll/keep/bank to `game`; returns the event name and,
+    with the event log on, adds the move's record to `records`. Raises GameError.
+    """
+    # Only allow moves on the human's turn (the engine rejects finished games)
+    if game.current_player != 0 and not game.finished:
+        raise engine.GameError("It's not your turn")
+    if action == 'roll':
+        event = 'zilch' if engine.roll(game) else 'roll'
+    elif action == 'keep':
+        engine.keep(game, indices)
+        event = 'keep'
+    else:
+        # Adds the turn score and hands the turn to the AI (or ends the game)
+        engine.bank(game)
+        event = 'bank'
+    if records is not None and event_log is not None:
+        records.append(encode_move(game, action, mask_of(indices or ()), 0))
+    return event
+
+
+async def _human_move(game_id: str, action: str, indices: Optional[List[int]] = None) -> Game:
+    """
+    Apply a human move; a turn that passes to the AI may be played right away.
+    Call with the game's lock held.
+    """
+    game = await _get_game(game_id)
+    records: List[bytes] = []
+    try:
+        event = _apply_human(game, action, indices, records)
+    except engine.GameError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await _commit(game, event, 0, records)
+    # A zilch or a bank hands the turn to the AI
+    await _maybe_auto_ai(game)
     return game
 
-# --- Endpoint: Bank Points ---
-@app.post('/game/{game_id}/bank')
-def bank_points(game_id: str):
-    game = games.get(game_id)
-    if not game:
-        raise HTTPException(status_code=404, detail='Game not found')
+
+async def _ai_move(game_id: str) -> Game:
+    """Play the AI's turn. Call with the game's lock held."""
+    game = await _get_game(game_id)
     if game.finished:
         raise HTTPException(status_code=400, detail='Game is finished')
-    if game.current_player != 0:
-        raise HTTPException(status_code=400, detail="It's not your turn")
-    # Add turn score to current player's total
-    game.players[game.current_player].total_score += game.turn_score
-    # Check for win (e.g., 10,000 points)
-    if game.players[game.current_player].total_score >= 10000:
-        game.finished = True
-        game.winner = game.current_player
-    else:
-        # Switch to AI turn (1)
-        game.current_player = 1
-        game.turn_score = 0
-        game.kept = []
-        game.dice = [0]*6
+    if game.current_player != AI_PLAYER:
+        raise HTTPException(status_code=400, detail="It's not the AI's turn")
+    await _play_ai(game)
     return game
 
-@app.get('/')
-def read_root():
-    return {'message': 'Welcome to the Zilch Dice Game API!'}
+REGISTRY.register_dict('zilch_store', 'Game store', lambda: store.metrics())
+REGISTRY.register_dict('zilch_ws', 'WebSocket game channels', lambda: hub.metrics())
+REGISTRY.register_dict('zilch_game_locks', 'Per-game request locks', lambda: game_locks.metrics())
+REGISTRY.register_dict('zilch_responses', 'Rendered-state snapshots for delta responses',
+                       serialization.snapshot_metrics)
+REGISTRY.register_dict('zilch_eventlog', 'Game event log',
+                       lambda: event_log.metrics() if event_log is not None else None)
+# Only reported once the AI has been built
+REGISTRY.register_dict('zilch_ai', 'AI player', lambda: _ai.metrics() if _ai else None)
 
-# main.py
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Dict, List, Optional
-import uuid
-import random
+# --- Endpoint: Metrics ---
+@app.get('/metrics')
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+# --- Endpoint: Sampling Profiler ---
+def _profiling_enabled() -> None:
+    if not server_config.profiling_enabled:
+        raise HTTPException(status_code=404, detail='Not Found')
 
-app = FastAPI()
 
-# --- Player State Model ---
-class PlayerState(BaseModel):
-    name: str
-    total_score: int = 0
+@app.post('/debug/profile')
+def start_profile(seconds: float = 10.0, interval_ms: float = 5.0):
+    """Sample every thread's stack for `seconds`; fetch the result with GET."""
+    _profiling_enabled()
+    if not 0 < seconds <= 600 or not 0.1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail='seconds must be in (0, 600], interval_ms in [0.1, 1000]')
+    if not profiler.start(seconds, interval_ms / 1000):
+        raise HTTPException(status_code=409, detail='A profile is already running')
+    return profiler.status()
 
-# --- Game State Model ---
-class GameState(BaseModel):
-    game_id: str
-    players: List[PlayerState]  # [0] = human, [1] = AI
-    current_player: int         # 0 = human, 1 = AI
-    dice: List[int] = []        # Current dice values
-    kept: List[int] = []        # Dice kept for scoring
-    turn_score: int = 0         # Score for current turn
-    finished: bool = False
-    winner: Optional[int] = None  # 0 = human, 1 = AI
 
-# --- Keep Request Model ---
-class KeepRequest(BaseModel):
-    indices: List[int]  # Indices of dice to keep from the current roll
+@app.delete('/debug/profile')
+def stop_profile():
+    _profiling_enabled()
+    profiler.stop()
+    return profiler.status()
 
-# In-memory store for games (for demo; use DB for production)
-games: Dict[str, GameState] = {}
+
+@app.get('/debug/profile')
+def get_profile(limit: Optional[int] = None):
+    """Stacks sampled by the current or last run, in folded (flamegraph) format."""
+    _profiling_enabled()
+    return PlainTextResponse(profiler.folded(limit), headers={
+        'X-Profile-Running': str(profiler.running).lower(),
+        'X-Profile-Samples': str(profiler.samples),
+    })
 
 # --- Endpoint: Create New Game ---
 @app.post('/game/new')
-def create_game():
-    game_id = str(uuid.uuid4())
-    players = [PlayerState(name='Human'), PlayerState(name='AI')]
-    game = GameState(
-        game_id=game_id,
-        players=players,
-        current_player=0,  # Human starts
-        dice=[0]*6,
-        kept=[],
-        turn_score=0,
-        finished=False,
-        winner=None
-    )
-    games[game_id] = game
-    return {'game_id': game_id, 'game': game}
+async def create_game():
+    game = _new_game()
+    await _create([game])
+    return new_game_response(game)
+
+# --- Endpoint: Create Many Games ---
+@app.post('/games/batch')
+async def create_games(req: BatchCreateRequest):
+    if not 1 <= req.count <= server_config.batch_max_games:
+        raise HTTPException(status_code=400, detail=f'count must be between 1 and {server_config.batch_max_games}')
+    games = [_new_game() for _ in range(req.count)]
+    await _create(games)
+    return games_response(games)
 
 # --- Endpoint: Get Game State ---
 @app.get('/game/{game_id}')
-def get_game(game_id: str):
-    game = games.get(game_id)
-    if not game:
-        raise HTTPException(status_code=404, detail='Game not found')
-    return game
+async def get_game(game_id: str, since: Optional[int] = None):
+    # Locked too: a blocking store bumps the version off the loop, and the
+    # response must not pair one version with another's state
+    async with game_locks.hold(game_id):
+        return game_response(await _get_game(game_id), since)
 
 # --- Endpoint: Roll Dice ---
 @app.post('/game/{game_id}/roll')
-def roll_dice(game_id: str):
-    game = games.get(game_id)
-    if not game:
-        raise HTTPException(status_code=404, detail='Game not found')
-    if game.finished:
-        raise HTTPException(status_code=400, detail='Game is finished')
-    # Only allow rolling if it's the human's turn
-    if game.current_player != 0:
-        raise HTTPException(status_code=400, detail="It's not your turn")
-    num_to_roll = 6 if len(game.dice) == 0 or all(d == 0 for d in game.dice) else game.dice.count(0)
-    if num_to_roll == 0:
-        num_to_roll = 6  # Hot dice: all dice scored, roll all 6 again
-    new_dice = []
-    for d in game.dice:
-        if d == 0:
-            new_dice.append(random.randint(1, 6))
-        else:
-            new_dice.append(d)
-    if len(new_dice) < 6:
-        new_dice += [random.randint(1, 6) for _ in range(6 - len(new_dice))]
-    game.dice = new_dice
-    return game
+async def roll_dice(game_id: str, since: Optional[int] = None):
+    async with game_locks.hold(game_id):
+        return game_response(await _human_move(game_id, 'roll'), since)
 
 # --- Endpoint: Keep Dice ---
 @app.post('/game/{game_id}/keep')
-def keep_dice(game_id: str, req: KeepRequest):
-    game = games.get(game_id)
-    if not game:
-        raise HTTPException(status_code=404, detail='Game not found')
-    if game.finished:
-        raise HTTPException(status_code=400, detail='Game is finished')
-    if game.current_player != 0:
-        raise HTTPException(status_code=400, detail="It's not your turn")
-    if any(i < 0 or i >= len(game.dice) for i in req.indices):
-        raise HTTPException(status_code=400, detail='Invalid dice indices')
-    for i in req.indices:
-        if game.dice[i] == 0:
-            continue  # Already kept
-        game.kept.append(game.dice[i])
-        # Add to turn score (simple: 1=100, 5=50, 3 of a kind, etc. - scoring logic can be improved)
-        if game.dice[i] == 1:
-            game.turn_score += 100
-        elif game.dice[i] == 5:
-            game.turn_score += 50
-        # (TODO: Add full scoring logic for triples, straights, etc.)
-        game.dice[i] = 0
-    return game
+async def keep_dice(game_id: str, req: KeepRequest, since: Optional[int] = None):
+    async with game_locks.hold(game_id):
+        return game_response(await _human_move(game_id, 'keep', req.indices), since)
 
 # --- Endpoint: Bank Points ---
 @app.post('/game/{game_id}/bank')
-def bank_points(game_id: str):
-    game = games.get(game_id)
-    if not game:
-        raise HTTPException(status_code=404, detail='Game not found')
-    if game.finished:
-        raise HTTPException(status_code=400, detail='Game is finished')
-    if game.current_player != 0:
-        raise HTTPException(status_code=400, detail="It's not your turn")
-    # Add turn score to current player's total
-    game.players[game.current_player].total_score += game.turn_score
-    # Check for win (e.g., 10,000 points)
-    if game.players[game.current_player].total_score >= 10000:
-        game.finished = True
-        game.winner = game.current_player
-    else:
-        # Switch to AI turn (1)
-        game.current_player = 1
-        game.turn_score = 0
-        game.kept = []
-        game.dice = [0]*6
-    return game
+async def bank_points(game_id: str, since: Optional[int] = None):
+    async with game_locks.hold(game_id):
+        return game_response(await _human_move(game_id, 'bank'), since)
+
+# --- Endpoint: Action Sequence ---
+@app.post('/game/{game_id}/actions')
+async def apply_actions(game_id: str, req: ActionsRequest, since: Optional[int] = None):
+    """
+    Apply human moves in order, all or nothing. If one fails the game is left
+    as it was and the error says which: {"detail": {"index", "detail"}}.
+
+    **A roll can only be the last action**; a sequence with a roll anywhere
+    else is refused with 400 before anything runs. A whole turn takes one
+    request per roll: [roll], then [keep, roll], ..., then [keep, bank].
+    Rolls draw from the game's dice stream, and a failed sequence is
+    discarded with the copy it ran on, so actions after a roll would let a
+    client see the next dice and back out of them.
+    """
+    if len(req.actions) > server_config.batch_max_actions:
+        raise HTTPException(status_code=400, detail=f'At most {server_config.batch_max_actions} actions per request')
+    for i, action in enumerate(req.actions[:-1]):
+        if action.action == 'roll':
+            raise HTTPException(status_code=400, detail={'index': i + 1, 'detail': 'A roll must be the last action'})
+    async with game_locks.hold(game_id):
+        # Work on a copy so a failure part way through changes nothing
+        game = (await _get_game(game_id)).copy()
+        records: List[bytes] = []
+        for i, action in enumerate(req.actions):
+            try:
+                _apply_human(game, action.action, action.indices, records)
+            except engine.GameError as e:
+                raise HTTPException(status_code=400, detail={'index': i, 'detail': str(e)})
+        if req.actions:
+            await _commit(game, 'actions', 0, records)
+            await _maybe_auto_ai(game)
+        return game_response(game, since)
+
+# --- Endpoint: AI Turn ---
+@app.post('/game/{game_id}/ai-turn')
+async def ai_turn(game_id: str, since: Optional[int] = None):
+    async with game_locks.hold(game_id):
+        return game_response(await _ai_move(game_id), since)
+
+# --- Endpoint: Game Channel ---
+def _error_message(detail: str) -> bytes:
+    return b'{"error":%s}' % json.dumps(detail).encode()
+
+
+async def _socket_command(game_id: str, command) -> Optional[bytes]:
+    """Run one WebSocket command; returns an error message for the sender, if any."""
+    action = command.get('action') if isinstance(command, dict) else None
+    try:
+        async with game_locks.hold(game_id):
+            if action == 'keep':
+                await _human_move(game_id, action, KeepRequest.model_validate(command).indices)
+            elif action in ('roll', 'bank'):
+                await _human_move(game_id, action)
+            elif action == 'ai-turn':
+                await _ai_move(game_id)
+            else:
+                return _error_message(f'Unknown action: {action!r}')
+    except HTTPException as e:
+        return _error_message(e.detail)
+    except ValidationError:
+        return _error_message('Invalid dice indices')
+    except StaleGameError:
+        return _error_message('Game was changed by another request; reload it')
+    return None
+
+
+async def _pump(websocket: WebSocket, sub: Subscription) -> None:
+    while True:
+        message = await sub.queue.get()
+        await websocket.send_text(message.decode())
+
+
+def _pump_done(task: asyncio.Task) -> None:
+    # Nothing awaits the sender, so report how it failed here
+    if not task.cancelled() and task.exception() is not None:
+        logger.error('Sending game updates to a WebSocket failed', exc_info=task.exception())
+
+
+@app.websocket('/game/{game_id}/ws')
+async def game_socket(websocket: WebSocket, game_id: str):
+    """
+    One connection per game. The client sends {"action": "roll" | "keep" |
+    "bank" | "ai-turn", "indices": [...]} and receives {"event", "player",
+    "game"} for every move made in the game, by anyone, including each step
+    of the AI's turn; rejected commands get {"error": detail}. The first
+    message is the current state, with event "state".
+    """
+    await websocket.accept()
+    # Subscribe before reading the game so no move can fall in between;
+    # clients order messages by game.version
+    sub = hub.subscribe(game_id)
+    sender = None
+    try:
+        game = await _store_call(store.get, game_id)
+        if not game:
+            await websocket.close(code=4404, reason='Game not found')
+            return
+        sub.offer(render_event(game, 'state', game.current_player))
+        # Every outgoing message goes through the queue, so one task does all the sending
+        sender = asyncio.create_task(_pump(websocket, sub))
+        sender.add_done_callback(_pump_done)
+        while True:
+            try:
+                command = json.loads(await websocket.receive_text())
+            except ValueError:
+                sub.offer(_error_message('Commands must be JSON'))
+                continue
+            error = await _socket_command(game_id, command)
+            if error:
+                sub.offer(error)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.unsubscribe(sub)
+        if sender:
+            sender.cancel()
 
 @app.get('/')
-def read_root():
-    return {'message': 'Welcome to the Zilch Dice Game API!'}
\ No newline at end of file
+async def read_root():
+    return {'message': 'Welcome to the Zilch Dice Game API!'}
@@ -0,0 +1,342 @@
+"""
+Process-local metrics in the Prometheus text format, and a sampling profiler.
+
+Metrics are declared once at module level (like prometheus_client) and
+updated in place: Counter.inc and Histogram.observe take a lock, bump a
+number or two and return, so they cost well under a microsecond and can
+stay on in production. Values that other objects already track (store
+sizes, cache hit rates) are read through callbacks only when /metrics is
+scraped, so they cost nothing in between.
+
+The profiler samples every thread's stack with sys._current_frames() from
+a background thread for a fixed number of seconds, and reports the stacks
+in the folded format flamegraph tools read ("a;b;c 42" per line). While it
+is not running it costs nothing.
+"""
+import bisect
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+LabelValues = Tuple[str, ...]
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+# Latency buckets in seconds, from 100 µs to 10 s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, labels: LabelValues = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: LabelValues = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (+Inf last)..., sum]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, labels: LabelValues = ()) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def count(self, labels: LabelValues = ()) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            series = sorted((labels, list(s)) for labels, s in self._series.items())
+        for labels, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(counts[-1])}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class CallbackGauge(Metric):
+    """A gauge (or counter) whose value is read from a callback at scrape time."""
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Optional[GaugeValue]],
+                 labelnames: Sequence[str] = (), kind: str = 'gauge') -> None:
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        value = self.callback()
+        if value is None:
+            return []
+        lines = super().render()
+        values = value if isinstance(value, dict) else {(): value}
+        for labels, v in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}')
+        return lines
+
+
+class DictMetrics(Metric):
+    """
+    One metric per key of a metrics() dict, e.g. store.metrics(), read once
+    per scrape. Keys ending in _total are exposed as counters, the rest as
+    gauges.
+    """
+
+    def __init__(self, prefix: str, documentation: str, source: Callable[[], Optional[Dict[str, float]]]) -> None:
+        super().__init__(prefix, documentation)
+        self.source = source
+
+    def render(self) -> List[str]:
+        values = self.source()
+        if not values:
+            return []
+        lines = []
+        for key, value in values.items():
+            name = f'{self.name}_{key}'
+            kind = 'counter' if key.endswith('_total') else 'gauge'
+            lines += [f'# HELP {name} {self.documentation}: {key}', f'# TYPE {name} {kind}',
+                      f'{name} {_format_value(value)}']
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric; registering a name again replaces the old one."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], Optional[GaugeValue]],
+              labelnames: Sequence[str] = (), kind: str = 'gauge') -> CallbackGauge:
+        return self.register(CallbackGauge(name, documentation, callback, labelnames, kind))
+
+    def register_dict(self, prefix: str, documentation: str,
+                      source: Callable[[], Optional[Dict[str, float]]]) -> 'DictMetrics':
+        return self.register(DictMetrics(prefix, documentation, source))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# --- HTTP ---
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'zilch_http_requests_total', 'HTTP requests handled', ('method', 'route', 'status'))
+HTTP_LATENCY = REGISTRY.histogram(
+    'zilch_http_request_duration_seconds', 'HTTP request latency', ('method', 'route'))
+
+# --- AI ---
+
+AI_DECISION_LATENCY = REGISTRY.histogram(
+    'zilch_ai_decision_duration_seconds', 'Time for one AI keep/bank decision, cache hits included',
+    buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+             0.0025, 0.005, 0.01, 0.025, 0.1))
+
+# --- Training ---
+
+TRAIN_EPISODES = REGISTRY.counter('zilch_train_episodes_total', 'Training episodes played')
+TRAIN_STEPS = REGISTRY.counter('zilch_train_steps_total', 'Environment steps taken in training')
+TRAIN_EPISODE_LATENCY = REGISTRY.histogram(
+    'zilch_train_episode_duration_seconds', 'Time per training episode (single-process training)',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 1.0))
+TRAIN_CHECKPOINTS = REGISTRY.counter(
+    'zilch_train_checkpoints_total', 'Training checkpoints written', ('kind',))
+TRAIN_ROUND_LATENCY = REGISTRY.histogram(
+    'zilch_train_round_duration_seconds', 'Time per actor/learner sync round (parallel training)',
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request, labelled by route template
+    (/game/{game_id}/roll) rather than raw path so game ids don't create
+    new series. Requests that match no route are counted as "unmatched".
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get('route')
+            path = getattr(route, 'path', 'unmatched')
+            method = scope['method']
+            HTTP_LATENCY.observe(elapsed, (method, path))
+            HTTP_REQUESTS.inc(1, (method, path, str(status[0])))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every other thread every `interval` seconds for
+    `duration` seconds. start() returns immediately; folded() gives the
+    stacks collected so far (or by the last run).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: _Tally = _Tally()
+        self.samples = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self.interval = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float, interval: float = 0.005) -> bool:
+        """Start a run; returns False if one is already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks = _Tally()
+            self.samples = 0
+            self.started_at = time.time()
+            self.duration = duration
+            self.interval = interval
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='zilch-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_filename.rsplit("/", 1)[-1]}:{code.co_name}')
+                    frame = frame.f_back
+                sampled.append(';'.join(reversed(stack)))
+            # Readers copy the tally under the same lock
+            with self._lock:
+                self._stacks.update(sampled)
+                self.samples += 1
+            self._stop.wait(self.interval)
+
+    def folded(self, limit: Optional[int] = None) -> str:
+        """Collected stacks in folded format, most frequent first."""
+        with self._lock:
+            stacks = self._stacks.copy()
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common(limit))
+
+    def status(self) -> Dict[str, object]:
+        return {
+            'running': self.running,
+            'started_at': self.started_at,
+            'duration': self.duration,
+            'interval': self.interval,
+            'samples': self.samples,
+            'stacks': len(self._stacks),
+        }
+
+
+profiler = SamplingProfiler()
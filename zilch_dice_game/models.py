@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 
 class PlayerState(BaseModel):
     name: str
@@ -14,6 +14,20 @@ class GameState(BaseModel):
     turn_score: int = 0         # Score for current turn
     finished: bool = False
     winner: Optional[int] = None  # 0 = human, 1 = AI
+    awaiting_keep: bool = False   # Dice were rolled; scoring dice must be kept before rolling again
+    zilch: bool = False           # The last roll scored nothing and ended the turn
+    version: int = 0              # Bumped by the game store on every saved change
 
 class KeepRequest(BaseModel):
-    indices: List[int]  # Indices of dice to keep from the current roll
\ No newline at end of file
+    indices: List[int]  # Indices of dice to keep from the current roll
+class BatchCreateRequest(BaseModel):
+    count: int = 1  # Number of games to create
+
+class Action(BaseModel):
+    action: Literal['roll', 'keep', 'bank']
+    indices: List[int] = []  # Only used by 'keep'
+
+class ActionsRequest(BaseModel):
+    actions: List[Action] = Field(
+        description='Applied in order, all or nothing. A roll may only be the last action.'
+    )
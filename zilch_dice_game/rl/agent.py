@@ -1,10 +1,14 @@
 from __future__ import annotations
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional, Union
 import numpy as np
 import json
 import os
 
 from ..utils.state_utils import ActionSpace
+from .qtable import (
+    DenseQTable, check_num_actions, encode_keys, is_binary_model, load_binary, masked_argmax, masked_max,
+    save_binary,
+)
 
 
 def _discretize_state(state: np.ndarray) -> Tuple[int, ...]:
@@ -24,6 +28,7 @@ class ZilchRLAgent:
         epsilon: float = 1.0,
         epsilon_min: float = 0.01,
         epsilon_decay: float = 0.999,
+        q_backend: str = "dict",
     ) -> None:
         self.action_space = action_space
         # Learning rate: how strongly we move current Q toward the target
@@ -34,56 +39,156 @@ class ZilchRLAgent:
         self.epsilon = epsilon
         self.epsilon_min = epsilon_min
         self.epsilon_decay = epsilon_decay
-        # Q-table mapping: state (discrete tuple) -> list of action values
-        self.q_table: Dict[Tuple[int, ...], List[float]] = {}
+        # Q-table, either
+        #  - "dict": state (discrete tuple) -> list of action values, or
+        #  - "dense": DenseQTable, one float32 row per state behind a packed-key index
+        if q_backend not in ("dict", "dense"):
+            raise ValueError(f"unknown q_backend: {q_backend!r}")
+        self.q_backend = q_backend
+        self.q_table: Union[Dict[Tuple[int, ...], List[float]], DenseQTable] = (
+            {} if q_backend == "dict" else DenseQTable(action_space.size())
+        )
 
     def _ensure_state(self, state_key: Tuple[int, ...]) -> None:
         if state_key not in self.q_table:
             # Initialize Q-values to zeros for all actions
             self.q_table[state_key] = [0.0 for _ in range(self.action_space.size())]
 
+    def valid_masks(self, states: np.ndarray) -> np.ndarray:
+        """Legal-action masks for observations, from the dice in their first six columns."""
+        states = np.asarray(states)
+        return self.action_space.valid_action_masks(states[..., :6].reshape(-1, 6)).reshape(
+            states.shape[:-1] + (self.action_space.size(),)
+        )
+
     def choose_action(self, state: np.ndarray) -> int:
-        """Epsilon-greedy action selection."""
+        """Epsilon-greedy action selection among the legal actions."""
+        valid = self.valid_masks(state)
+        # Explore with probability epsilon, otherwise exploit best-known action
+        if np.random.rand() < self.epsilon:
+            if self.q_backend == "dict":
+                self._ensure_state(_discretize_state(state))
+            legal = np.flatnonzero(valid)
+            if legal.size == 0:
+                return np.random.randint(0, self.action_space.size())
+            return int(legal[np.random.randint(0, legal.size)])
+
+        if self.q_backend == "dense":
+            return int(masked_argmax(self.q_table.q_values(state), valid))
+
         state_key = _discretize_state(state)
         self._ensure_state(state_key)
+        q_values = np.asarray(self.q_table[state_key])
+        # Argmax over legal actions to pick the greedy action
+        return int(masked_argmax(q_values, valid))
 
-        # Explore with probability epsilon, otherwise exploit best-known action
-        if np.random.rand() < self.epsilon:
-            return np.random.randint(0, self.action_space.size())
+    def choose_actions(self, states: np.ndarray, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """Epsilon-greedy actions for a (N, 10) batch of observations (dense backend)."""
+        if self.q_backend != "dense":
+            return np.array([self.choose_action(s) for s in states], dtype=np.int64)
+        return self.q_table.choose_actions(states, self.epsilon, rng, valid=self.valid_masks(states))
 
-        q_values = self.q_table[state_key]
-        # Argmax over actions to pick the greedy action
-        return int(np.argmax(q_values))
+    def _decay_epsilon(self, steps: int = 1) -> None:
+        # Gradually shift from exploring to exploiting learned values
+        if self.epsilon > self.epsilon_min:
+            self.epsilon = max(self.epsilon_min, self.epsilon * self.epsilon_decay ** steps)
 
     def update(self, state: np.ndarray, action: int, reward: float, next_state: np.ndarray, done: bool) -> None:
+        if self.q_backend == "dense":
+            table: DenseQTable = self.q_table
+            keys = encode_keys(np.stack([state, next_state]))
+            row, next_row = table.row(int(keys[0])), table.row(int(keys[1]))
+            q_current = table.values[row, action]
+            max_next = 0.0 if done else float(masked_max(table.values[next_row], self.valid_masks(next_state)))
+            target = reward + self.gamma * max_next
+            table.values[row, action] = q_current + self.alpha * (target - q_current)
+            self._decay_epsilon()
+            return
+
         state_key = _discretize_state(state)
         next_key = _discretize_state(next_state)
         self._ensure_state(state_key)
         self._ensure_state(next_key)
 
-        # Q-learning target = r + gamma * max_a' Q(s', a') (0 if terminal)
+        # Q-learning target = r + gamma * max over legal a' of Q(s', a') (0 if terminal)
         q_current = self.q_table[state_key][action]
-        max_next = 0.0 if done else max(self.q_table[next_key])
+        max_next = 0.0 if done else float(masked_max(np.asarray(self.q_table[next_key]), self.valid_masks(next_state)))
         target = reward + self.gamma * max_next
         # Incremental update toward target
         self.q_table[state_key][action] = q_current + self.alpha * (target - q_current)
 
         # Decay exploration
-        # Gradually shift from exploring to exploiting learned values
-        if self.epsilon > self.epsilon_min:
-            self.epsilon *= self.epsilon_decay
-            if self.epsilon < self.epsilon_min:
-                self.epsilon = self.epsilon_min
+        self._decay_epsilon()
+
+    def update_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+    ) -> None:
+        """
+        Q-learning updates for a batch of transitions (e.g. sampled from a
+        ReplayBuffer), every target computed from the values before the
+        batch; a (state, action) pair sampled more than once moves by the
+        mean of its updates. Unlike update(), epsilon is left alone: it
+        decays with the steps the caller takes in the environment, not with
+        the updates.
+        """
+        next_valid = self.valid_masks(next_states)
+        if self.q_backend == "dense":
+            self.q_table.update_batch(states, actions, rewards, next_states, dones,
+                                      self.alpha, self.gamma, next_valid=next_valid)
+            return
+
+        keys = [_discretize_state(s) for s in states]
+        next_keys = [_discretize_state(s) for s in next_states]
+        for key in keys + next_keys:
+            self._ensure_state(key)
+        actions = np.asarray(actions, dtype=np.int64)
+        max_next = masked_max(np.array([self.q_table[k] for k in next_keys], dtype=np.float64), next_valid)
+        max_next[np.asarray(dones, dtype=bool)] = 0.0
+        current = np.array([self.q_table[k][a] for k, a in zip(keys, actions.tolist())])
+        delta = self.alpha * (np.asarray(rewards, dtype=np.float64) + self.gamma * max_next - current)
+        sums: Dict[Tuple[Tuple[int, ...], int], List[float]] = {}
+        for key, action, d in zip(keys, actions.tolist(), delta.tolist()):
+            total = sums.setdefault((key, action), [0.0, 0])
+            total[0] += d
+            total[1] += 1
+        for (key, action), (d, count) in sums.items():
+            self.q_table[key][action] += d / count
 
     def save(self, path: str) -> None:
+        """
+        Persist epsilon and the Q-table. Paths ending in .json use the JSON
+        format; anything else gets the binary ZQTB format from qtable.py.
+        """
+        if not path.endswith(".json"):
+            table = self.q_table
+            if not isinstance(table, DenseQTable):
+                table = DenseQTable.from_dict(table, self.action_space.size())
+            save_binary(table, path, self.epsilon)
+            return
         # Persist epsilon and Q-table to JSON (simple baseline persistence)
         os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        items = self.q_table.items()
+        # JSON keys must be strings; load() parses the "(1, 2, ...)" form back
+        q_table = {str(tuple(k)): list(v) for k, v in items}
         with open(path, "w") as f:
-            json.dump({"epsilon": self.epsilon, "q_table": self.q_table}, f)
+            json.dump({"epsilon": self.epsilon, "q_table": q_table}, f)
 
-    def load(self, path: str) -> None:
+    def load(self, path: str, mmap_mode: str = "c") -> None:
+        """
+        Load a model saved by save(), in either format. Binary models are
+        memory-mapped (see qtable.load_binary for mmap_mode) rather than read.
+        """
         if not os.path.exists(path):
             return
+        if is_binary_model(path):
+            table, self.epsilon = load_binary(path, mode=mmap_mode, num_actions=self.action_space.size())
+            self.q_table = table if self.q_backend == "dense" else dict(table.items())
+            return
         with open(path, "r") as f:
             data = json.load(f)
         self.epsilon = float(data.get("epsilon", self.epsilon))
@@ -97,5 +202,9 @@ class ZilchRLAgent:
                 key_tuple = tuple(int(p) for p in parts if p.strip() != "")
             else:
                 key_tuple = tuple(k)
+            check_num_actions(path, len(v), self.action_space.size())
             parsed[key_tuple] = list(v)
-        self.q_table = parsed
+        if self.q_backend == "dense":
+            self.q_table = DenseQTable.from_dict(parsed, self.action_space.size())
+        else:
+            self.q_table = parsed
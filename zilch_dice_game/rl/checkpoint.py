@@ -0,0 +1,200 @@
+"""
+Training checkpoints, written in the background.
+
+A checkpoint directory holds at most one full snapshot of the Q-table, one
+incremental snapshot and a manifest:
+
+    full-000010.zqtb       every state, in the ZQTB format (qtable.py)
+    inc-000013.zqtb        only the states added or changed since that full
+                           snapshot, in the same format
+    checkpoint.json        which two files are current, plus the episode
+                           count, epsilon and RNG state they go with
+
+Checkpointer.save() only copies the table and hands the copy to a writer
+thread, which does the diffing and the I/O, so the training loop never
+waits on the disk. If the writer is still busy when the next checkpoint
+comes, the pending one is replaced rather than queued. Every
+`full_every`-th checkpoint is a full snapshot; in between, an incremental
+one costs I/O in proportion to what changed. Files are written under a
+temporary name and renamed, and the manifest is replaced last, so a crash
+at any point leaves the previous checkpoint intact.
+
+load_checkpoint() rebuilds the table as of the latest checkpoint: the full
+snapshot with the incremental rows applied on top.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+
+from ..metrics import TRAIN_CHECKPOINTS
+from .qtable import DenseQTable, load_binary, save_arrays
+
+MANIFEST = "checkpoint.json"
+CHECKPOINT_FORMAT = 1
+
+Meta = Dict[str, Any]
+
+
+def table_arrays(agent) -> Tuple[np.ndarray, np.ndarray]:
+    """(sorted keys, values) copied out of an agent's Q-table, either backend."""
+    table = agent.q_table
+    if not isinstance(table, DenseQTable):
+        table = DenseQTable.from_dict(table, agent.action_space.size())
+        return table.sorted_arrays()
+    keys, values = table.sorted_arrays()
+    # sorted_arrays() may return views of the live table
+    return np.array(keys), np.array(values)
+
+
+def changed_rows(base_keys: np.ndarray, base_values: np.ndarray,
+                 keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Bool mask over `keys`: states missing from the base snapshot or with different values."""
+    if len(base_keys) == 0:
+        return np.ones(len(keys), dtype=bool)
+    pos = np.minimum(np.searchsorted(base_keys, keys), len(base_keys) - 1)
+    found = base_keys[pos] == keys
+    changed = ~found
+    changed[found] = (values[found] != base_values[pos[found]]).any(axis=1)
+    return changed
+
+
+def numpy_global_state() -> Dict[str, Any]:
+    """np.random's global state (used by the dict agent) in a JSON-friendly form."""
+    name, keys, pos, has_gauss, cached = np.random.get_state()
+    return {"name": name, "keys": keys.tolist(), "pos": int(pos),
+            "has_gauss": int(has_gauss), "cached_gaussian": float(cached)}
+
+
+def restore_numpy_global_state(state: Dict[str, Any]) -> None:
+    np.random.set_state((state["name"], np.array(state["keys"], dtype=np.uint32), state["pos"],
+                         state["has_gauss"], state["cached_gaussian"]))
+
+
+def read_manifest(directory: str) -> Optional[Meta]:
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_checkpoint(directory: str, num_actions: Optional[int] = None) -> Tuple[DenseQTable, Meta]:
+    """The Q-table and manifest of the latest checkpoint in `directory` (see load_binary for `num_actions`)."""
+    meta = read_manifest(directory)
+    if meta is None:
+        raise FileNotFoundError(f"No checkpoint in {directory}")
+    if meta.get("format") != CHECKPOINT_FORMAT:
+        raise ValueError(f"{directory} holds an unsupported checkpoint format")
+    table, _ = load_binary(os.path.join(directory, meta["full"]), mode="c", num_actions=num_actions)
+    if meta.get("incremental"):
+        delta, _ = load_binary(os.path.join(directory, meta["incremental"]), mode="r")
+        keys, values = delta.sorted_arrays()
+        if len(keys):
+            # rows() may grow the table, replacing table.values
+            rows = table.rows(keys)
+            table.values[rows] = values
+    return table, meta
+
+
+class Checkpointer:
+    """Writes checkpoints of a training run to `directory` on a background thread."""
+
+    def __init__(self, directory: str, full_every: int = 10) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.full_every = max(1, full_every)
+        previous = read_manifest(directory)
+        # Continue numbering after a resumed run's checkpoints
+        self.sequence = previous["sequence"] if previous else 0
+        self.written_total = 0
+        self.error: Optional[BaseException] = None
+        self._base: Optional[Tuple[np.ndarray, np.ndarray, str]] = None
+        self._pending: Optional[Tuple[np.ndarray, np.ndarray, Meta]] = None
+        self._busy = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._writer = threading.Thread(target=self._run, name="zilch-checkpoint", daemon=True)
+        self._writer.start()
+
+    def save(self, agent, episodes: int, rng: Optional[Dict[str, Any]] = None) -> None:
+        """Snapshot `agent` after `episodes` episodes; returns once the table is copied."""
+        self._raise_error()
+        keys, values = table_arrays(agent)
+        meta = {
+            "episodes": episodes,
+            "epsilon": float(agent.epsilon),
+            "q_backend": agent.q_backend,
+            "num_actions": agent.action_space.size(),
+            "rng": rng or {},
+        }
+        with self._cond:
+            self._pending = (keys, values, meta)
+            self._cond.notify()
+
+    def flush(self) -> None:
+        """Wait until everything saved so far is on disk."""
+        with self._cond:
+            while (self._pending is not None or self._busy) and self._writer.is_alive():
+                self._cond.wait()
+        self._raise_error()
+
+    def close(self) -> None:
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._writer.join()
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("Writing a checkpoint failed") from error
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                item, self._pending = self._pending, None
+                self._busy = True
+            try:
+                self._write(*item)
+            except BaseException as exc:  # reported by the next save() or flush()
+                self.error = exc
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _write(self, keys: np.ndarray, values: np.ndarray, meta: Meta) -> None:
+        self.sequence += 1
+        epsilon = meta["epsilon"]
+        if self._base is None or self.sequence % self.full_every == 0:
+            full = f"full-{self.sequence:06d}.zqtb"
+            save_arrays(keys, values, os.path.join(self.directory, full), epsilon, meta["num_actions"])
+            self._base = (keys, values, full)
+            incremental = None
+            kind = "full"
+        else:
+            base_keys, base_values, full = self._base
+            changed = changed_rows(base_keys, base_values, keys, values)
+            incremental = f"inc-{self.sequence:06d}.zqtb"
+            save_arrays(keys[changed], values[changed], os.path.join(self.directory, incremental),
+                        epsilon, meta["num_actions"])
+            kind = "incremental"
+        manifest = dict(meta, format=CHECKPOINT_FORMAT, sequence=self.sequence,
+                        full=full, incremental=incremental)
+        path = os.path.join(self.directory, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+        # Files no longer referenced by the manifest
+        for name in os.listdir(self.directory):
+            if name.endswith(".zqtb") and name.startswith(("full-", "inc-")) and name not in (full, incremental):
+                os.remove(os.path.join(self.directory, name))
+        self.written_total += 1
+        TRAIN_CHECKPOINTS.inc(1, (kind,))
@@ -1,70 +1,97 @@
-from typing import Dict, List, Tuple, Optional, Any, Union
+from typing import Dict, List, Optional, Tuple, Union
 import numpy as np
-from ..models import GameState, PlayerState
-from ..main import app  # We'll use the FastAPI app for game logic
-from fastapi.testclient import TestClient
+from ..state import Game
+from .. import engine
+from ..rng import DiceRNG, SEED_BYTES
 from ..utils.state_utils import encode_state, ActionSpace
 
 class ZilchEnv:
     """
     A Gym-like environment for the Zilch dice game.
     This provides a clean interface for reinforcement learning.
+
+    Games run directly on the in-process rules engine (see engine.py for the
+    per-move cost). The env is self-play: the agent acts for whichever player
+    is on turn, and every observation it sees is a fresh, scoring roll.
+    An action index keeps the dice its subset names, then banks or rolls on
+    (see ActionSpace; env.action_space.valid_actions(obs[:6]) lists the
+    legal ones). A list of dice indices keeps them and rolls on, and an
+    empty list banks.
+
+    With a seed, the games of every episode get seeds drawn from it in turn,
+    so the same seed and the same actions reproduce a training run.
     """
     
-    def __init__(self):
-        self.client = TestClient(app)
+    def __init__(self, seed: Optional[int] = None):
         self.action_space = ActionSpace()
+        self._game_seeds = DiceRNG.from_int(seed) if seed is not None else None
         self.reset()
         
+    def seed_state(self) -> Optional[Dict[str, object]]:
+        """Where the stream of game seeds stands (None if unseeded), to resume from later."""
+        if self._game_seeds is None:
+            return None
+        return {"seed": self._game_seeds.seed.hex(), "position": self._game_seeds.position}
+
+    def restore_seed_state(self, state: Dict[str, object]) -> None:
+        """Continue the stream of game seeds from seed_state(); takes effect at the next reset()."""
+        self._game_seeds = DiceRNG(bytes.fromhex(state["seed"]), int(state["position"]))
+
     def reset(self) -> np.ndarray:
         """Reset the environment to start a new game."""
-        response = self.client.post("/new-game/")
-        self.game_state = GameState(**response.json())
-        response = self.client.post("/start/")
-        self.game_state = GameState(**response.json())
+        seed = self._game_seeds.bytes(SEED_BYTES) if self._game_seeds else None
+        self.game_state: Game = engine.new_game('env', seed)
+        self._roll_until_scoring()
         return self._get_observation()
     
     def step(self, action: Union[int, List[int]]) -> Tuple[np.ndarray, float, bool, Dict]:
         """Take an action in the environment."""
-        if isinstance(action, int):
-            dice_to_keep = self._decode_action(action)
-        else:
-            dice_to_keep = action
-            
         try:
-            response = self.client.post(
-                "/keep/",
-                json={"dice_indices": dice_to_keep}
-            )
-            self.game_state = GameState(**response.json())
-            
-            # Simplified reward and done logic
-            reward = 0
-            done = self.game_state.winner is not None
+            if isinstance(action, (int, np.integer)):
+                dice_to_keep, bank = self._decode_action(int(action))
+            else:
+                dice_to_keep, bank = list(action), not action
+
+            reward = 0.0
+            if dice_to_keep:
+                engine.keep(self.game_state, dice_to_keep)
+            if bank:
+                # Reward is the points the acting player banks
+                reward = float(engine.bank(self.game_state))
+            done = self.game_state.finished
+            if not done:
+                self._roll_until_scoring()
             
             return self._get_observation(), reward, done, {}
             
-        except Exception as e:
+        except engine.GameError as e:
             return self._get_observation(), -10, True, {"error": str(e)}
+
+    def _roll_until_scoring(self) -> None:
+        """Roll for the player on turn, passing the turn along on every zilch."""
+        while engine.roll(self.game_state):
+            pass
     
     def _get_observation(self) -> np.ndarray:
         """Convert the game state to a numerical observation."""
         return encode_state(
             dice=self.game_state.dice,
             turn_score=self.game_state.turn_score,
-            p0_score=self.game_state.players[0].total_score,
-            p1_score=self.game_state.players[1].total_score,
+            p0_score=self.game_state.total0,
+            p1_score=self.game_state.total1,
             current_player=self.game_state.current_player,
         )
     
-    def _decode_action(self, action_idx: int) -> List[int]:
-        """Convert an action index to dice indices to keep using ActionSpace."""
-        return self.action_space.index_to_action(action_idx)
+    def _decode_action(self, action_idx: int) -> Tuple[List[int], bool]:
+        """Convert an action index to (dice indices to keep, bank?) using ActionSpace."""
+        if not 0 <= action_idx < self.action_space.size():
+            raise engine.GameError(f"Unknown action {action_idx}")
+        return self.action_space.decode(action_idx)
     
     def render(self, mode: str = 'human') -> None:
         """Render the current game state."""
         if mode == 'human':
-            print(f"\n--- Turn {self.game_state.turn_count} ---")
+            print(f"\n--- Player {self.game_state.current_player} to move ---")
             print(f"Dice: {self.game_state.dice}")
-            print(f"Current player: {self.game_state.current_player}")
+            print(f"Scores: {list(self.game_state.totals)}")
             print(f"Turn score: {self.game_state.turn_score}")
@@ -0,0 +1,344 @@
+from __future__ import annotations
+from typing import Dict, Iterator, List, Optional, Tuple
+import os
+import struct
+import numpy as np
+
+# Perfect (collision-free) packing of an encode_state() observation into one
+# int64 key. Fields, from most to least significant:
+#   dice            6 base-7 digits (17 bits)
+#   turn_score/50   14 bits
+#   p0_score/50     11 bits
+#   p1_score/50     11 bits
+#   current_player  1 bit
+# Every score in Zilch is a multiple of 50, so dividing by 50 loses nothing.
+SCORE_UNIT = 50
+_TURN_BITS = 14
+_TOTAL_BITS = 11
+_DICE_RADIX = np.array([7 ** i for i in range(6)], dtype=np.int64)
+
+
+def encode_keys(states: np.ndarray) -> np.ndarray:
+    """Pack (N, 10) observations (or one (10,) observation) into int64 keys."""
+    s = np.asarray(states).astype(np.int64)
+    dice = s[..., :6] @ _DICE_RADIX
+    turn = s[..., 6] // SCORE_UNIT
+    p0 = s[..., 7] // SCORE_UNIT
+    p1 = s[..., 8] // SCORE_UNIT
+    if (turn >= 1 << _TURN_BITS).any() or (np.maximum(p0, p1) >= 1 << _TOTAL_BITS).any():
+        raise ValueError("score out of range for the state index")
+    key = dice
+    key = (key << _TURN_BITS) | turn
+    key = (key << _TOTAL_BITS) | p0
+    key = (key << _TOTAL_BITS) | p1
+    return (key << 1) | s[..., 9]
+
+
+def decode_keys(keys: np.ndarray) -> np.ndarray:
+    """Inverse of encode_keys: int64 keys back to (N, 10) float32 observations."""
+    k = np.asarray(keys, dtype=np.int64)
+    out = np.empty(k.shape + (10,), dtype=np.float32)
+    out[..., 9] = k & 1
+    k = k >> 1
+    out[..., 8] = (k & ((1 << _TOTAL_BITS) - 1)) * SCORE_UNIT
+    k = k >> _TOTAL_BITS
+    out[..., 7] = (k & ((1 << _TOTAL_BITS) - 1)) * SCORE_UNIT
+    k = k >> _TOTAL_BITS
+    out[..., 6] = (k & ((1 << _TURN_BITS) - 1)) * SCORE_UNIT
+    k = k >> _TURN_BITS
+    for i in range(6):
+        k, digit = np.divmod(k, 7)
+        out[..., i] = digit
+    return out
+
+
+def masked_argmax(q: np.ndarray, valid: Optional[np.ndarray]) -> np.ndarray:
+    """
+    Argmax over the last axis among valid actions only (first one on ties).
+    Rows with no valid action fall back to the plain argmax.
+    """
+    if valid is None:
+        return np.argmax(q, axis=-1)
+    masked = np.where(valid, q, -np.inf)
+    return np.where(valid.any(axis=-1), np.argmax(masked, axis=-1), np.argmax(q, axis=-1))
+
+
+def masked_max(q: np.ndarray, valid: Optional[np.ndarray]) -> np.ndarray:
+    """Max over the last axis among valid actions; 0 for rows with none."""
+    if valid is None:
+        return q.max(axis=-1)
+    masked = np.where(valid, q, -np.inf).max(axis=-1)
+    return np.where(np.isfinite(masked), masked, 0.0).astype(q.dtype)
+
+
+def sample_valid(valid: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """A uniformly random valid action per row of a (N, A) mask (any action if none is valid)."""
+    weights = rng.random(valid.shape)
+    return np.argmax(np.where(valid.any(axis=-1, keepdims=True), weights * valid, weights), axis=-1)
+
+
+class DenseQTable:
+    """
+    Q-values for every seen state in one contiguous float32 array.
+
+    Each state's packed key (see encode_keys) is mapped to a dense row index
+    through a sorted key array searched with np.searchsorted, so the table
+    costs 16 bytes of index plus 4 bytes per action per state. Keys added one
+    at a time are buffered in a small dict and merged into the sorted array
+    in bulk, which keeps single-state inserts cheap.
+    """
+
+    def __init__(self, num_actions: int, capacity: int = 1024) -> None:
+        self.num_actions = num_actions
+        self.values = np.zeros((capacity, num_actions), dtype=np.float32)
+        self.size = 0
+        self._keys = np.empty(0, dtype=np.int64)   # sorted
+        # Row of each sorted key; None means row i belongs to key i, as in a
+        # table opened from a binary file
+        self._rows: Optional[np.ndarray] = np.empty(0, dtype=np.int64)
+        self._pending: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.values)
+        if needed <= capacity:
+            return
+        capacity = max(capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((capacity, self.num_actions), dtype=np.float32)
+        grown[: self.size] = self.values[: self.size]
+        self.values = grown
+
+    def _sorted_rows(self) -> np.ndarray:
+        if self._rows is None:
+            self._rows = np.arange(len(self._keys), dtype=np.int64)
+        return self._rows
+
+    def _merge(self, keys: np.ndarray, rows: np.ndarray) -> None:
+        self._sorted_rows()
+        all_keys = np.concatenate([self._keys, keys])
+        all_rows = np.concatenate([self._rows, rows])
+        order = np.argsort(all_keys, kind="stable")
+        self._keys = all_keys[order]
+        self._rows = all_rows[order]
+
+    def _flush(self) -> None:
+        if self._pending:
+            keys = np.fromiter(self._pending.keys(), dtype=np.int64, count=len(self._pending))
+            rows = np.fromiter(self._pending.values(), dtype=np.int64, count=len(self._pending))
+            self._pending = {}
+            self._merge(keys, rows)
+
+    def _find_sorted(self, keys: np.ndarray) -> np.ndarray:
+        """Rows for keys in the sorted index, -1 where absent."""
+        if len(self._keys) == 0:
+            return np.full(keys.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        rows = pos if self._rows is None else self._rows[pos]
+        return np.where(self._keys[pos] == keys, rows, -1)
+
+    def row(self, key: int, add: bool = True) -> int:
+        """Row index for one key, allocating a zeroed row if it is new (-1 if add=False)."""
+        row = self._pending.get(key)
+        if row is not None:
+            return row
+        if len(self._keys):
+            pos = int(np.searchsorted(self._keys, key))
+            if pos < len(self._keys) and self._keys[pos] == key:
+                return pos if self._rows is None else int(self._rows[pos])
+        if not add:
+            return -1
+        row = self.size
+        self._grow(row + 1)
+        self.size += 1
+        self._pending[key] = row
+        if len(self._pending) >= max(1024, len(self._keys) >> 4):
+            self._flush()
+        return row
+
+    def rows(self, keys: np.ndarray, add: bool = True) -> np.ndarray:
+        """Vectorized row() for an int64 key array."""
+        self._flush()
+        keys = np.asarray(keys, dtype=np.int64)
+        rows = self._find_sorted(keys)
+        missing = rows < 0
+        if add and missing.any():
+            new_keys, inverse = np.unique(keys[missing], return_inverse=True)
+            new_rows = np.arange(self.size, self.size + len(new_keys), dtype=np.int64)
+            self._grow(self.size + len(new_keys))
+            self.size += len(new_keys)
+            self._merge(new_keys, new_rows)
+            rows[missing] = new_rows[inverse]
+        return rows
+
+    def q_values(self, state: np.ndarray) -> np.ndarray:
+        """Q-values (a view) for one observation."""
+        # row() may grow the table, replacing self.values
+        row = self.row(int(encode_keys(state)))
+        return self.values[row]
+
+    def choose_actions(
+        self,
+        states: np.ndarray,
+        epsilon: float,
+        rng: Optional[np.random.Generator] = None,
+        add: bool = True,
+        valid: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Epsilon-greedy actions for a (N, 10) batch of observations. With
+        add=False unseen states are treated as all-zero rows instead of being
+        inserted, so a read-only (mapped) table is never copied. `valid`, an
+        (N, num_actions) bool mask, restricts both exploring and exploiting
+        to legal actions.
+        """
+        rng = rng or np.random.default_rng()
+        rows = self.rows(encode_keys(states), add=add)
+        q = self.values[np.maximum(rows, 0)]
+        q[rows < 0] = 0.0
+        actions = masked_argmax(q, valid)
+        explore = rng.random(len(rows)) < epsilon
+        if valid is None:
+            actions[explore] = rng.integers(0, self.num_actions, size=int(explore.sum()))
+        else:
+            actions[explore] = sample_valid(valid[explore], rng)
+        return actions
+
+    def update_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+        alpha: float,
+        gamma: float,
+        next_valid: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        One Q-learning step for a batch of transitions in a single vectorized
+        pass. `next_valid` masks the max over next-state actions to the legal
+        ones. A (state, action) pair that occurs several times in the batch
+        moves by the mean of its updates, once.
+        """
+        rows = self.rows(encode_keys(states))
+        next_rows = self.rows(encode_keys(next_states))
+        actions = np.asarray(actions, dtype=np.int64)
+        max_next = masked_max(self.values[next_rows], next_valid)
+        max_next[np.asarray(dones, dtype=bool)] = 0.0
+        target = np.asarray(rewards, dtype=np.float32) + gamma * max_next
+        delta = alpha * (target - self.values[rows, actions])
+        # Every copy of a repeated pair computed its delta from the same
+        # value, so summing them would overshoot the target
+        pairs, inverse = np.unique(rows * self.num_actions + actions, return_inverse=True)
+        mean = np.bincount(inverse, weights=delta) / np.bincount(inverse)
+        self.values[pairs // self.num_actions, pairs % self.num_actions] += mean.astype(np.float32)
+
+    def items(self) -> Iterator[Tuple[Tuple[int, ...], List[float]]]:
+        """(state tuple, Q-values) pairs, in the dict backend's key format."""
+        self._flush()
+        states = decode_keys(self._keys).astype(np.int64)
+        for state, row in zip(states.tolist(), self._sorted_rows().tolist()):
+            yield tuple(state), self.values[row].tolist()
+
+    @classmethod
+    def from_dict(cls, q_table: Dict[Tuple[int, ...], List[float]], num_actions: int) -> "DenseQTable":
+        """Build a table from the dict backend's {state tuple: Q-values} layout."""
+        table = cls(num_actions, capacity=max(1, len(q_table)))
+        if q_table:
+            rows = table.rows(encode_keys(np.array(list(q_table.keys()), dtype=np.int64)))
+            table.values[rows] = np.array(list(q_table.values()), dtype=np.float32)
+        return table
+
+    def set(self, state: Tuple[int, ...], q_values: List[float]) -> None:
+        self.values[self.row(int(encode_keys(np.array(state))))] = q_values
+
+    def nbytes(self) -> int:
+        rows = 0 if self._rows is None else self._rows.nbytes
+        return self.values[: self.size].nbytes + self._keys.nbytes + rows
+
+    def sorted_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(sorted keys, values with row i belonging to key i)."""
+        self._flush()
+        if self._rows is None:
+            return self._keys, self.values[: self.size]
+        return self._keys, self.values[self._rows]
+
+
+# Binary model format ("ZQTB"): a fixed 64-byte little-endian header followed
+# by the sorted int64 key array and the (num_states, num_actions) float32
+# value matrix, row i holding the Q-values of key i. Both arrays start on a
+# 64-byte boundary so they can be memory-mapped in place.
+BINARY_MAGIC = b"ZQTB"
+BINARY_VERSION = 1
+_HEADER = struct.Struct("<4sIQIId")  # magic, version, states, actions, key layout, epsilon
+_HEADER_SIZE = 64
+_KEY_LAYOUT = 1  # encode_keys() packing above
+
+
+def _align(offset: int) -> int:
+    return (offset + 63) & ~63
+
+
+def is_binary_model(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def save_binary(table: DenseQTable, path: str, epsilon: float = 0.0) -> None:
+    """Write a table in the ZQTB format (atomically, via a temp file)."""
+    keys, values = table.sorted_arrays()
+    save_arrays(keys, values, path, epsilon, table.num_actions)
+
+
+def save_arrays(keys: np.ndarray, values: np.ndarray, path: str, epsilon: float = 0.0,
+                num_actions: Optional[int] = None) -> None:
+    """save_binary() for sorted keys and their (len(keys), num_actions) values."""
+    n, a = len(keys), values.shape[1] if num_actions is None else num_actions
+    keys_offset = _HEADER_SIZE
+    values_offset = _align(keys_offset + 8 * n)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, n, a, _KEY_LAYOUT, epsilon).ljust(_HEADER_SIZE, b"\0"))
+        f.write(np.ascontiguousarray(keys, dtype="<i8").tobytes())
+        f.write(b"\0" * (values_offset - keys_offset - 8 * n))
+        f.write(np.ascontiguousarray(values, dtype="<f4").tobytes())
+    os.replace(tmp, path)
+
+
+def check_num_actions(path: str, found: int, expected: Optional[int]) -> None:
+    if expected is not None and found != expected:
+        raise ValueError(f"{path} holds Q-values for {found} actions, but the action space has {expected}; "
+                         f"the model was trained for a different action space")
+
+
+def load_binary(path: str, mode: str = "r", num_actions: Optional[int] = None) -> Tuple[DenseQTable, float]:
+    """
+    Open a ZQTB file as a DenseQTable backed by np.memmap; returns (table, epsilon).
+
+    Nothing is read up front, so opening is O(1) in the file size, and with
+    mode="r" the pages are shared read-only with every other process mapping
+    the same file. Use mode="c" (copy-on-write) to update Q-values in place
+    without touching the file; adding new states copies the values into RAM.
+    With `num_actions`, a table for a different action space is refused.
+    """
+    with open(path, "rb") as f:
+        magic, version, n, a, layout, epsilon = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != BINARY_MAGIC or version != BINARY_VERSION or layout != _KEY_LAYOUT:
+        raise ValueError(f"{path} is not a ZQTB v{BINARY_VERSION} model")
+    check_num_actions(path, a, num_actions)
+    keys_offset = _HEADER_SIZE
+    values_offset = _align(keys_offset + 8 * n)
+    table = DenseQTable(a, capacity=0)
+    if n:
+        table._keys = np.memmap(path, dtype="<i8", mode="r", offset=keys_offset, shape=(n,))
+        table.values = np.memmap(path, dtype="<f4", mode=mode, offset=values_offset, shape=(n, a))
+    else:
+        table.values = np.zeros((1, a), dtype=np.float32)
+    table._rows = None
+    table.size = n
+    return table, float(epsilon)
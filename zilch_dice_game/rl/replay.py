@@ -0,0 +1,83 @@
+from typing import Dict, Optional
+import numpy as np
+
+# Transition fields, in the order add()/add_batch() take them; sample()
+# returns a dict with these keys, the same layout collect_episodes uses
+FIELDS = ("states", "actions", "rewards", "next_states", "dones")
+
+
+class ReplayBuffer:
+    """
+    Experience replay over a fixed-size ring of preallocated NumPy arrays.
+
+    Transitions are written in place at the ring position, overwriting the
+    oldest once the buffer is full, so adding never allocates. sample()
+    draws uniformly (with replacement) from everything stored and returns
+    copies ready for ZilchRLAgent.update_batch.
+    """
+
+    def __init__(self, capacity: int, obs_dim: int = 10, seed: Optional[int] = None) -> None:
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.states = np.zeros((capacity, obs_dim), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, obs_dim), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.position = 0  # next slot to write
+        self.size = 0
+        self.added_total = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, state: np.ndarray, action: int, reward: float, next_state: np.ndarray, done: bool) -> None:
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self._advance(1)
+
+    def add_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+    ) -> None:
+        """Append N transitions; with N > capacity only the last `capacity` are kept."""
+        n = len(actions)
+        skip = max(0, n - self.capacity)
+        values = (states, actions, rewards, next_states, dones)
+        for array, new in zip(self._arrays(), values):
+            self._write(array, np.asarray(new)[skip:])
+        self._advance(n - skip)
+        self.added_total += skip
+
+    def sample(self, batch_size: int, rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+        if not self.size:
+            raise ValueError("cannot sample from an empty buffer")
+        idx = (rng or self.rng).integers(0, self.size, size=batch_size)
+        return {name: array[idx] for name, array in zip(FIELDS, self._arrays())}
+
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self._arrays())
+
+    def _arrays(self):
+        return self.states, self.actions, self.rewards, self.next_states, self.dones
+
+    def _write(self, array: np.ndarray, values: np.ndarray) -> None:
+        start, n = self.position, len(values)
+        first = min(n, self.capacity - start)
+        array[start:start + first] = values[:first]
+        array[:n - first] = values[first:]
+
+    def _advance(self, n: int) -> None:
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.capacity, self.size + n)
+        self.added_total += n
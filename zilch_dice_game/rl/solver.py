@@ -0,0 +1,218 @@
+"""
+Exact optimal turn policy for Zilch, solved by dynamic programming.
+
+Within a turn the only things that matter are the dice left to roll (n), the
+turn score so far (t) and the rolled multiset, so the policy that maximizes
+expected points per turn can be computed exactly instead of learned:
+
+    V(n, t)      = max(t, R(n, t))                          value before a roll
+    R(n, t)      = sum over rolls m of n dice: P(m) * best(m, t)
+    best(m, t)   = max over legal keeps k of m: V(n', t + score(k))
+                   (0 for a zilch; n' = n - |k|, or 6 on hot dice)
+
+Every keep adds at least 50 points, so V(., t) only depends on larger turn
+scores and a single backward sweep over t (from `cap` down to 0) solves it
+with no iteration. Turn scores at or above `cap` always bank.
+
+The game totals enter at decision time: when a keep would take the player to
+WINNING_SCORE, the policy keeps the most points it can and banks the win.
+
+The solved decisions are stored as one uint16 per (turn score / 50, rolled
+multiset): the low bits hold the id of the multiset to keep (+1) and the top
+bit means "bank after keeping". Looking a decision up is a single index.
+"""
+from itertools import product
+from math import factorial
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+from .. import scoring
+from ..engine import NUM_DICE, WINNING_SCORE
+
+SCORE_UNIT = 50
+DEFAULT_CAP = 25000
+_BANK_BIT = 1 << 15
+_KEEP_BITS = _BANK_BIT - 1
+
+_MULTISETS = scoring.MULTISETS
+_NUM_MULTISETS = len(_MULTISETS)
+_MS_SIZE = np.array([len(m) for m in _MULTISETS], dtype=np.int64)
+# Face counts of each multiset (row 0 of _KEEP_COUNTS below is "keep nothing")
+_MS_COUNTS = np.array(
+    [[m.count(face) for face in range(1, 7)] for m in _MULTISETS], dtype=np.int64
+)
+_KEEP_COUNTS = np.vstack([np.zeros((1, 6), dtype=np.int64), _MS_COUNTS])
+# Multiset id for every scoring key
+_ID_BY_KEY = np.full(scoring.NUM_KEYS, -1, dtype=np.int16)
+_ID_BY_KEY[[scoring.dice_key(m) for m in _MULTISETS]] = np.arange(_NUM_MULTISETS)
+
+
+def _roll_probability(counts: Sequence[int]) -> float:
+    n = sum(counts)
+    ways = factorial(n)
+    for c in counts:
+        ways //= factorial(c)
+    return ways / 6 ** n
+
+
+def _legal_keeps() -> Tuple[np.ndarray, ...]:
+    """(multiset id, keep id, keep score in units, dice left) for every legal keep."""
+    ms_ids, keep_ids, scores, left = [], [], [], []
+    for ms_id, counts in enumerate(_MS_COUNTS.tolist()):
+        n = sum(counts)
+        for sub in product(*(range(c + 1) for c in counts)):
+            kept = [face for face, c in enumerate(sub, start=1) for _ in range(c)]
+            points = scoring.keep_score(kept) if kept else 0
+            if not points:
+                continue
+            ms_ids.append(ms_id)
+            keep_ids.append(int(_ID_BY_KEY[scoring.dice_key(kept)]))
+            scores.append(points // SCORE_UNIT)
+            left.append(n - len(kept) or NUM_DICE)
+    return tuple(np.array(a, dtype=np.int64) for a in (ms_ids, keep_ids, scores, left))
+
+
+class TurnPolicy:
+    """A solved turn policy: O(1) keep/bank decisions plus per-state values."""
+
+    def __init__(
+        self,
+        decisions: np.ndarray,
+        values: np.ndarray,
+        zilch_probability: np.ndarray,
+        hot_dice_probability: np.ndarray,
+        cap: int,
+    ) -> None:
+        self.decisions = decisions                        # (cap/50 + 1, 923) uint16
+        self.values = values                              # (7, cap/50 + 1) float64, V(n, t)
+        self.zilch_probability = zilch_probability        # (7,) by dice rolled
+        self.hot_dice_probability = hot_dice_probability  # (7,) all n dice score
+        self.cap = cap
+
+    @classmethod
+    def solve(cls, cap: int = DEFAULT_CAP) -> "TurnPolicy":
+        """Solve the expected-points-optimal policy for turn scores below `cap`."""
+        top = cap // SCORE_UNIT
+        ms_ids, keep_ids, scores, left = _legal_keeps()
+        prob = np.array([_roll_probability(c) for c in _MS_COUNTS.tolist()])
+        can_score = np.zeros(_NUM_MULTISETS, dtype=bool)
+        can_score[ms_ids] = True
+        hot = np.zeros(_NUM_MULTISETS, dtype=bool)
+        hot[ms_ids[left == NUM_DICE]] = True  # includes keeps that use every die
+
+        zilch_p = np.bincount(_MS_SIZE, weights=prob * ~can_score, minlength=NUM_DICE + 1)
+        hot_p = np.bincount(_MS_SIZE, weights=prob * hot, minlength=NUM_DICE + 1)
+
+        # V[n, i] is the value of turn score i*50 with n dice to roll; at or
+        # past the cap the player banks, so V = t there.
+        width = top + int(scores.max()) + 1
+        grid = np.arange(width, dtype=np.float64) * SCORE_UNIT
+        V = np.tile(grid, (NUM_DICE + 1, 1))
+        R = np.full((NUM_DICE + 1, width), -np.inf)
+        decisions = np.zeros((top + 1, _NUM_MULTISETS), dtype=np.uint16)
+
+        def choose(vals: np.ndarray) -> np.ndarray:
+            """Index into the legal-keep arrays of the best keep for each multiset."""
+            best = np.full(_NUM_MULTISETS, -np.inf)
+            np.maximum.at(best, ms_ids, vals)
+            winners = np.flatnonzero(vals >= best[ms_ids])
+            _, first = np.unique(ms_ids[winners], return_index=True)
+            return winners[first]
+
+        for i in range(top - 1, -1, -1):
+            after = i + scores
+            chosen = choose(V[left, after])
+            best = np.zeros(_NUM_MULTISETS)
+            best[ms_ids[chosen]] = V[left[chosen], after[chosen]]
+            R[:, i] = np.bincount(_MS_SIZE, weights=prob * best, minlength=NUM_DICE + 1)
+            V[1:, i] = np.maximum(grid[i], R[1:, i])
+            bank = (after[chosen] * SCORE_UNIT) >= R[left[chosen], after[chosen]]
+            decisions[i, ms_ids[chosen]] = (keep_ids[chosen] + 1) | np.where(bank, _BANK_BIT, 0)
+
+        # Past the cap: take the most points on offer and bank
+        chosen = choose(scores.astype(np.float64))
+        decisions[top, ms_ids[chosen]] = (keep_ids[chosen] + 1) | _BANK_BIT
+        return cls(decisions, V[:, : top + 1], zilch_p, hot_p, cap)
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(
+            path,
+            decisions=self.decisions,
+            values=self.values,
+            zilch_probability=self.zilch_probability,
+            hot_dice_probability=self.hot_dice_probability,
+            cap=np.int64(self.cap),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "TurnPolicy":
+        with np.load(path) as data:
+            return cls(
+                data["decisions"],
+                data["values"],
+                data["zilch_probability"],
+                data["hot_dice_probability"],
+                int(data["cap"]),
+            )
+
+    def expected_turn_score(self) -> float:
+        """Expected points of a whole turn played with this policy."""
+        return float(self.values[NUM_DICE, 0])
+
+    def decide_many(
+        self,
+        dice: np.ndarray,
+        turn_scores: np.ndarray,
+        my_totals: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decisions for a (N, 6) batch of rolls (0 = die set aside). Returns
+        (keep, bank): an (N, 6) bool mask of dice to keep and an (N,) bool
+        array telling whether to bank afterwards. A zilch gets an empty keep.
+        """
+        dice = np.asarray(dice, dtype=np.int64)
+        turn_scores = np.asarray(turn_scores, dtype=np.int64)
+        ms = _ID_BY_KEY[scoring.dice_keys(dice)].astype(np.int64)
+        t = np.minimum(turn_scores // SCORE_UNIT, len(self.decisions) - 1)
+        code = np.where(ms >= 0, self.decisions[t, np.maximum(ms, 0)], 0).astype(np.int64)
+        bank = (code & _BANK_BIT) != 0
+        keep_ids = code & _KEEP_BITS
+        if my_totals is not None:
+            # Banking the most points on offer wins outright: do that
+            best = scoring.score_many(dice)
+            wins = (np.asarray(my_totals) + turn_scores + best >= WINNING_SCORE) & (best > 0)
+            keep_ids[wins] = _ID_BY_KEY[scoring.best_keep_many(dice[wins])] + 1
+            bank |= wins
+        remaining = _KEEP_COUNTS[keep_ids]
+        keep = np.zeros(dice.shape, dtype=bool)
+        rows = np.arange(len(dice))
+        for i in range(dice.shape[1]):
+            face = dice[:, i] - 1
+            take = (face >= 0) & (remaining[rows, np.maximum(face, 0)] > 0)
+            keep[:, i] = take
+            remaining[rows[take], face[take]] -= 1
+        return keep, bank
+
+    def decide(
+        self,
+        dice: Sequence[int],
+        turn_score: int,
+        my_total: int = 0,
+    ) -> Tuple[List[int], bool]:
+        """(indices of the dice to keep, bank afterwards?) for one roll."""
+        keep, bank = self.decide_many(np.array([dice]), np.array([turn_score]), np.array([my_total]))
+        return np.flatnonzero(keep[0]).tolist(), bool(bank[0])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Solve the optimal Zilch turn policy and save it.")
+    parser.add_argument("path", help="output .npz file")
+    parser.add_argument("--cap", type=int, default=DEFAULT_CAP, help="turn score at which to always bank")
+    args = parser.parse_args()
+    policy = TurnPolicy.solve(args.cap)
+    policy.save(args.path)
+    print(f"Expected turn score: {policy.expected_turn_score():.1f}")
+    for n in range(1, NUM_DICE + 1):
+        print(f"{n} dice: P(zilch)={policy.zilch_probability[n]:.4f} P(hot dice)={policy.hot_dice_probability[n]:.4f}")
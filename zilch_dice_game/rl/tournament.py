@@ -0,0 +1,420 @@
+"""
+AI-vs-AI tournaments: is policy A better than policy B?
+
+Policies are named by spec strings, so worker processes can build their own
+copies:
+    random            a uniformly random legal action
+    greedy[:N]        keep the highest-scoring legal set, bank at N points
+                      (default 350) or with two or fewer dice left
+    solver[:PATH]     the solved TurnPolicy (rl/solver.py), or one saved to PATH
+    qtable:PATH       a trained Q-table saved by ZilchRLAgent.save (JSON or
+                      binary; binary tables are memory-mapped and shared)
+
+A match plays full games between two policies in VecZilchEnv batches, in a
+process pool. Each env row plays a fixed quota of games with the seats
+alternating between rows, so neither policy gets the first move more often
+and short games aren't over-counted. Results stream back per batch: A's
+win rate (draws, i.e. games cut off at max_steps, excluded) with a Wilson
+interval, mean final scores and game lengths in turns with normal-
+approximation intervals.
+
+The match stops as soon as A's win-rate interval lies entirely above or
+below 0.5, or entirely within `tie_margin` of it, once `min_games` have been
+played. Checking after every batch is repeated testing, so the default
+confidence is 0.999 rather than 0.95 to keep the chance of a wrong early call
+small.
+
+    python -m zilch_dice_game.rl.tournament qtable:new.zqtb qtable:old.zqtb greedy random
+    python -m zilch_dice_game.rl.tournament qtable:new.zqtb solver --gate --output match.json
+
+With several policies every pair plays a match. With --gate the exit status
+is 1 unless the first policy clearly beats every other one.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import combinations
+from math import sqrt
+from statistics import NormalDist
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from ..engine import NUM_DICE
+from ..utils.state_utils import ActionSpace, NUM_SUBSETS, keep_points, valid_action_masks
+from .qtable import sample_valid
+from .vec_env import VecZilchEnv
+
+Summary = Dict[str, Any]
+
+# Observation columns (see encode_state)
+_TURN_SCORE, _TOTAL0, _PLAYER = NUM_DICE, NUM_DICE + 1, NUM_DICE + 3
+_SUBSET_SIZES = np.array([bin(m).count("1") for m in range(1, NUM_SUBSETS + 1)])
+_SUBSET_WEIGHTS = 1 << np.arange(NUM_DICE)
+
+
+# --- policies ---
+
+class RandomPolicy:
+    def __call__(self, obs: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        return sample_valid(valid_action_masks(obs[:, :NUM_DICE]), rng)
+
+
+class GreedyPolicy:
+    def __init__(self, bank_at: int = 350) -> None:
+        self.bank_at = bank_at
+
+    def __call__(self, obs: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        dice = obs[:, :NUM_DICE]
+        points = keep_points(dice)
+        # Most points, then most dice
+        subset = np.argmax(points * 8 + _SUBSET_SIZES, axis=1)
+        left = (dice > 0).sum(axis=1) - _SUBSET_SIZES[subset]
+        turn = obs[:, _TURN_SCORE] + points[np.arange(len(obs)), subset]
+        bank = (left > 0) & ((turn >= self.bank_at) | (left <= 2))
+        return 2 * subset + bank
+
+
+class SolverPolicy:
+    def __init__(self, path: Optional[str] = None) -> None:
+        from .solver import TurnPolicy
+        self.policy = TurnPolicy.load(path) if path else TurnPolicy.solve()
+
+    def __call__(self, obs: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        player = obs[:, _PLAYER].astype(np.int64)
+        my_total = obs[np.arange(len(obs)), _TOTAL0 + player]
+        keep, bank = self.policy.decide_many(obs[:, :NUM_DICE], obs[:, _TURN_SCORE], my_total)
+        return 2 * (keep @ _SUBSET_WEIGHTS - 1) + bank
+
+
+class QTablePolicy:
+    def __init__(self, path: str) -> None:
+        from .agent import ZilchRLAgent
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.agent = ZilchRLAgent(ActionSpace(), epsilon=0.0, q_backend="dense")
+        self.agent.load(path, mmap_mode="r")
+
+    def __call__(self, obs: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        valid = self.agent.valid_masks(obs)
+        return self.agent.q_table.choose_actions(obs, 0.0, rng, add=False, valid=valid)
+
+
+Policy = Callable[[np.ndarray, np.random.Generator], np.ndarray]
+
+
+def make_policy(spec: str) -> Policy:
+    """Build a policy from its spec string (see the module docstring)."""
+    kind, _, arg = spec.partition(":")
+    if kind == "random":
+        return RandomPolicy()
+    if kind == "greedy":
+        return GreedyPolicy(int(arg) if arg else 350)
+    if kind == "solver":
+        return SolverPolicy(arg or None)
+    if kind == "qtable" and arg:
+        return QTablePolicy(arg)
+    raise ValueError(f"Unknown policy {spec!r}: use random, greedy[:N], solver[:PATH] or qtable:PATH")
+
+
+# --- playing games ---
+
+def play_games(a: Policy, b: Policy, games: int, seed: int, max_steps: int = 1000,
+               num_envs: int = 1024) -> Dict[str, float]:
+    """
+    Play `games` games of A against B and return the sums the statistics
+    are built from. A sits in seat 0 on even env rows and seat 1 on odd ones.
+    """
+    num_envs = max(2, min(num_envs, games + games % 2))
+    quota = np.full(num_envs, games // num_envs)
+    quota[: games % num_envs] += 1
+    rng = np.random.default_rng(seed)
+    env = VecZilchEnv(num_envs, seed=int(rng.integers(2 ** 63)), max_episode_steps=max_steps)
+    seat_a = np.arange(num_envs) % 2
+    played = np.zeros(num_envs, dtype=np.int64)
+    sums = dict.fromkeys(("games", "a_wins", "b_wins", "draws", "a_score", "a_score_sq",
+                          "b_score", "b_score_sq", "turns", "turns_sq"), 0.0)
+    obs = env.reset()
+    while (played < quota).any():
+        a_moves = obs[:, _PLAYER] == seat_a
+        actions = np.empty(num_envs, dtype=np.int64)
+        if a_moves.any():
+            actions[a_moves] = a(obs[a_moves], rng)
+        if not a_moves.all():
+            actions[~a_moves] = b(obs[~a_moves], rng)
+        obs, _, dones, info = env.step(actions)
+        counted = dones & (played < quota)
+        played += dones
+        if not counted.any():
+            continue
+        winner = info["winner"][counted].astype(np.int64)
+        # An illegal action forfeits the game to the other player
+        illegal = info["illegal"][counted]
+        winner[illegal] = np.where(a_moves[counted][illegal], 1 - seat_a[counted][illegal], seat_a[counted][illegal])
+        seats = seat_a[counted]
+        rows = np.arange(len(seats))
+        totals = info["final_totals"][counted]
+        a_score, b_score = totals[rows, seats], totals[rows, 1 - seats]
+        turns = info["turns"][counted]
+        sums["games"] += len(seats)
+        sums["a_wins"] += int((winner == seats).sum())
+        sums["b_wins"] += int(((winner >= 0) & (winner != seats)).sum())
+        sums["draws"] += int((winner < 0).sum())
+        sums["a_score"] += float(a_score.sum())
+        sums["a_score_sq"] += float((a_score.astype(np.float64) ** 2).sum())
+        sums["b_score"] += float(b_score.sum())
+        sums["b_score_sq"] += float((b_score.astype(np.float64) ** 2).sum())
+        sums["turns"] += float(turns.sum())
+        sums["turns_sq"] += float((turns.astype(np.float64) ** 2).sum())
+    return sums
+
+
+# Worker processes build the policies once and keep them between batches
+_worker_policies: Dict[str, Policy] = {}
+
+
+def _worker_batch(a: str, b: str, games: int, seed: int, max_steps: int) -> Dict[str, float]:
+    for spec in (a, b):
+        if spec not in _worker_policies:
+            _worker_policies[spec] = make_policy(spec)
+    return play_games(_worker_policies[a], _worker_policies[b], games, seed, max_steps)
+
+
+# --- statistics ---
+
+def wilson_interval(successes: float, trials: float, z: float) -> Tuple[float, float]:
+    if trials <= 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    centre = (p + z * z / (2 * trials)) / denominator
+    half = z * sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def mean_interval(total: float, total_sq: float, n: float, z: float) -> Tuple[float, float, float]:
+    """(mean, low, high) from a sum and a sum of squares."""
+    if n <= 0:
+        return 0.0, 0.0, 0.0
+    mean = total / n
+    variance = max(0.0, total_sq / n - mean * mean) * n / max(n - 1, 1)
+    half = z * sqrt(variance / n)
+    return mean, mean - half, mean + half
+
+
+class MatchStats:
+    """Running totals for one match; summary() at any point gives the standings so far."""
+
+    def __init__(self, a: str, b: str, confidence: float = 0.999) -> None:
+        self.a = a
+        self.b = b
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.confidence = confidence
+        self.sums: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    def add(self, sums: Dict[str, float]) -> None:
+        for key, value in sums.items():
+            self.sums[key] = self.sums.get(key, 0.0) + value
+
+    @property
+    def games(self) -> int:
+        return int(self.sums.get("games", 0))
+
+    def win_interval(self) -> Tuple[float, float]:
+        s = self.sums
+        return wilson_interval(s.get("a_wins", 0), s.get("a_wins", 0) + s.get("b_wins", 0), self.z)
+
+    def verdict(self, tie_margin: float) -> Optional[str]:
+        """'a' or 'b' if that policy is clearly better, 'tie' if neither can be, else None."""
+        low, high = self.win_interval()
+        if low > 0.5:
+            return "a"
+        if high < 0.5:
+            return "b"
+        if 0.5 - tie_margin <= low and high <= 0.5 + tie_margin:
+            return "tie"
+        return None
+
+    def summary(self, tie_margin: float = 0.005) -> Summary:
+        s, z = self.sums, self.z
+        decided = s.get("a_wins", 0) + s.get("b_wins", 0)
+        games = s.get("games", 0)
+        elapsed = time.perf_counter() - self.started
+        a_score = mean_interval(s.get("a_score", 0), s.get("a_score_sq", 0), games, z)
+        b_score = mean_interval(s.get("b_score", 0), s.get("b_score_sq", 0), games, z)
+        turns = mean_interval(s.get("turns", 0), s.get("turns_sq", 0), games, z)
+        return {
+            "a": self.a,
+            "b": self.b,
+            "games": int(games),
+            "a_wins": int(s.get("a_wins", 0)),
+            "b_wins": int(s.get("b_wins", 0)),
+            "draws": int(s.get("draws", 0)),
+            "confidence": self.confidence,
+            "a_win_rate": s.get("a_wins", 0) / decided if decided else 0.0,
+            "a_win_rate_ci": list(self.win_interval()),
+            "a_mean_score": a_score[0],
+            "a_mean_score_ci": list(a_score[1:]),
+            "b_mean_score": b_score[0],
+            "b_mean_score_ci": list(b_score[1:]),
+            "mean_turns": turns[0],
+            "mean_turns_ci": list(turns[1:]),
+            "verdict": self.verdict(tie_margin),
+            "seconds": elapsed,
+            "games_per_sec": games / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+def format_summary(summary: Summary) -> str:
+    low, high = summary["a_win_rate_ci"]
+    return (
+        f"{summary['a']} vs {summary['b']}: {summary['games']:,} games, "
+        f"{summary['a']} wins {100 * summary['a_win_rate']:.2f}% [{100 * low:.2f}, {100 * high:.2f}], "
+        f"scores {summary['a_mean_score']:.0f} / {summary['b_mean_score']:.0f}, "
+        f"{summary['mean_turns']:.1f} turns, {summary['games_per_sec']:,.0f} games/s"
+        + (f" -> {summary['verdict']}" if summary["verdict"] else "")
+    )
+
+
+# --- matches ---
+
+def play_match(
+    a: str,
+    b: str,
+    games: int = 100_000,
+    workers: Optional[int] = None,
+    batch_games: int = 4096,
+    confidence: float = 0.999,
+    min_games: int = 2000,
+    tie_margin: float = 0.005,
+    max_steps: int = 1000,
+    seed: Optional[int] = None,
+    on_progress: Optional[Callable[[Summary], None]] = None,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Summary:
+    """
+    Play up to `games` games of policy A against policy B, stopping early
+    once the verdict is clear. on_progress gets the running summary after
+    every batch. With workers=1 (and no pool) everything runs in this
+    process.
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = MatchStats(a, b, confidence)
+    seeds = np.random.SeedSequence(seed)
+    remaining = games
+    stopped_early = False
+
+    def next_batch() -> Tuple[int, int]:
+        nonlocal remaining
+        size = min(batch_games, remaining)
+        remaining -= size
+        return size, int(seeds.spawn(1)[0].generate_state(1)[0])
+
+    def record(sums: Dict[str, float]) -> bool:
+        """Add a batch; True once the match can stop."""
+        stats.add(sums)
+        if on_progress:
+            on_progress(stats.summary(tie_margin))
+        return stats.games >= min_games and stats.verdict(tie_margin) is not None
+
+    if workers == 1 and pool is None:
+        policies = (make_policy(a), make_policy(b))
+        while remaining > 0:
+            size, batch_seed = next_batch()
+            if record(play_games(*policies, size, batch_seed, max_steps)):
+                stopped_early = remaining > 0
+                break
+    else:
+        own_pool = pool is None
+        pool = pool or ProcessPoolExecutor(max_workers=workers)
+        try:
+            pending: Set[Future] = set()
+            # Two batches per worker keep every process busy while results come back
+            while remaining > 0 or pending:
+                while remaining > 0 and len(pending) < 2 * workers:
+                    size, batch_seed = next_batch()
+                    pending.add(pool.submit(_worker_batch, a, b, size, batch_seed, max_steps))
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                finished = False
+                for future in done:
+                    finished = record(future.result()) or finished
+                if finished:
+                    stopped_early = remaining > 0 or bool(pending)
+                    for future in pending:
+                        future.cancel()
+                    break
+        finally:
+            if own_pool:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    summary = stats.summary(tie_margin)
+    summary["stopped_early"] = stopped_early
+    return summary
+
+
+def run_tournament(policies: List[str], workers: Optional[int] = None,
+                   on_progress: Optional[Callable[[Summary], None]] = None, **options) -> List[Summary]:
+    """A match between every pair of policies, sharing one process pool."""
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        return [
+            play_match(a, b, workers=workers, pool=pool, on_progress=on_progress, **options)
+            for a, b in combinations(policies, 2)
+        ]
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def passes_gate(results: List[Summary], candidate: str) -> bool:
+    """True if `candidate` clearly beat every policy it played."""
+    for r in results:
+        if candidate in (r["a"], r["b"]) and r["verdict"] != ("a" if r["a"] == candidate else "b"):
+            return False
+    return True
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Play Zilch policies against each other.")
+    parser.add_argument("policies", nargs="+", help="random, greedy[:N], solver[:PATH] or qtable:PATH")
+    parser.add_argument("--games", type=int, default=1_000_000, help="most games per match")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument("--batch", type=int, default=4096, help="games per worker batch")
+    parser.add_argument("--confidence", type=float, default=0.999, help="confidence level of the intervals")
+    parser.add_argument("--min-games", type=int, default=2000, help="games before stopping early")
+    parser.add_argument("--tie-margin", type=float, default=0.005,
+                        help="call a tie once the win rate is known to be within this of 50%%")
+    parser.add_argument("--max-steps", type=int, default=1000, help="steps before a game counts as a draw")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="write the results here as JSON")
+    parser.add_argument("--gate", action="store_true",
+                        help="exit with status 1 unless the first policy clearly beats every other one")
+    parser.add_argument("--quiet", action="store_true", help="only print final results")
+    args = parser.parse_args(argv)
+    if len(args.policies) < 2:
+        parser.error("name at least two policies")
+
+    progress = None if args.quiet else (lambda s: print(format_summary(s), flush=True))
+    results = run_tournament(
+        args.policies, workers=args.workers, on_progress=progress, games=args.games,
+        batch_games=args.batch, confidence=args.confidence, min_games=args.min_games,
+        tie_margin=args.tie_margin, max_steps=args.max_steps, seed=args.seed,
+    )
+    print("Results:")
+    for r in results:
+        print("  " + format_summary(r))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.gate and not passes_gate(results, args.policies[0]):
+        print(f"GATE FAILED: {args.policies[0]} did not clearly beat every other policy", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
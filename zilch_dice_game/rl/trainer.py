@@ -1,19 +1,39 @@
-from typing import Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import tempfile
+import time
 import numpy as np
 
 from .env import ZilchEnv
 from .agent import ZilchRLAgent
+from .checkpoint import Checkpointer, load_checkpoint, numpy_global_state, restore_numpy_global_state
+from .qtable import encode_keys, load_binary, save_binary
+from .replay import ReplayBuffer
+from .vec_env import VecZilchEnv
 from ..config.rl_config import RLConfig, default_config
+from ..metrics import TRAIN_EPISODE_LATENCY, TRAIN_EPISODES, TRAIN_ROUND_LATENCY, TRAIN_STEPS
+from ..utils.state_utils import ActionSpace
+
+# Games an actor steps side by side in its VecZilchEnv
+_ACTOR_ENVS = 256
+# Games the replay trainer steps side by side; each step adds this many
+# transitions and applies one batch_size update
+_REPLAY_ENVS = 64
+# Arrays of a batch of transitions, as an actor sends them
+_TRANSITIONS = ("states", "actions", "rewards", "next_states", "dones")
 
 
 def run_episode(env: ZilchEnv, agent: ZilchRLAgent, cfg: RLConfig) -> float:
     """
     Run a single training episode and return cumulative reward.
     """
+    start = time.perf_counter()
     state = env.reset()
     total_reward = 0.0
 
-    for _ in range(cfg.max_steps_per_episode):
+    steps = 0
+    for steps in range(1, cfg.max_steps_per_episode + 1):
         action = agent.choose_action(state)
         next_state, reward, done, info = env.step(action)
         agent.update(state, action, reward, next_state, done)
@@ -22,9 +42,68 @@ def run_episode(env: ZilchEnv, agent: ZilchRLAgent, cfg: RLConfig) -> float:
         if done:
             break
 
+    TRAIN_EPISODES.inc()
+    TRAIN_STEPS.inc(steps)
+    TRAIN_EPISODE_LATENCY.observe(time.perf_counter() - start)
     return total_reward
 
 
+def _make_agent(action_space: ActionSpace, cfg: RLConfig, q_backend: Optional[str] = None) -> ZilchRLAgent:
+    return ZilchRLAgent(
+        action_space=action_space,
+        alpha=cfg.alpha,
+        gamma=cfg.gamma,
+        epsilon=cfg.epsilon_start,
+        epsilon_min=cfg.epsilon_min,
+        epsilon_decay=cfg.epsilon_decay,
+        q_backend=q_backend or cfg.q_backend,
+    )
+
+
+def _checkpointer(cfg: RLConfig) -> Optional[Checkpointer]:
+    return Checkpointer(cfg.checkpoint_dir, cfg.checkpoint_full_every) if cfg.checkpoint_dir else None
+
+
+def _seed(cfg: RLConfig) -> int:
+    """The run's seed: cfg.seed, or fresh entropy when it is None."""
+    return cfg.seed if cfg.seed is not None else int(np.random.SeedSequence().entropy)
+
+
+def _rng_state(rngs: Dict[str, np.random.Generator], **extra: Any) -> Dict[str, Any]:
+    """Every RNG a training loop draws from, for a checkpoint."""
+    state: Dict[str, Any] = {"numpy": numpy_global_state()}
+    state.update((name, rng.bit_generator.state) for name, rng in rngs.items())
+    state.update(extra)
+    return state
+
+
+def _next_checkpoint(episodes: int, cfg: RLConfig) -> int:
+    """First multiple of cfg.checkpoint_every after `episodes`."""
+    return (episodes // cfg.checkpoint_every + 1) * cfg.checkpoint_every
+
+
+def _resume(agent: ZilchRLAgent, cfg: RLConfig,
+            rngs: Dict[str, np.random.Generator]) -> Tuple[int, Dict[str, Any]]:
+    """
+    Restore the run checkpointed in cfg.resume_from, if any; returns the
+    episodes it had played and its saved RNG state, for the entries that
+    aren't numpy generators.
+    """
+    if not cfg.resume_from:
+        return 0, {}
+    table, meta = load_checkpoint(cfg.resume_from, agent.action_space.size())
+    agent.q_table = table if agent.q_backend == "dense" else dict(table.items())
+    agent.epsilon = float(meta["epsilon"])
+    saved = meta.get("rng", {})
+    if "numpy" in saved:
+        restore_numpy_global_state(saved["numpy"])
+    for name, rng in rngs.items():
+        if name in saved:
+            rng.bit_generator.state = saved[name]
+    print(f"Resuming from {cfg.resume_from} at episode {meta['episodes']}")
+    return int(meta["episodes"]), saved
+
+
 def train(episodes: int = None, cfg: RLConfig = None) -> ZilchRLAgent:
     """
     Train a Q-learning agent for the Zilch environment.
@@ -33,26 +112,231 @@ def train(episodes: int = None, cfg: RLConfig = None) -> ZilchRLAgent:
     cfg = cfg or default_config
     if episodes is not None:
         cfg.episodes = episodes
+    if cfg.num_workers > 1:
+        return train_parallel(cfg)
+    if cfg.buffer_size > 0:
+        return train_replay(cfg)
 
-    env = ZilchEnv()
-    agent = ZilchRLAgent(
-        action_space=env.action_space,
-        alpha=cfg.alpha,
-        gamma=cfg.gamma,
-        epsilon=cfg.epsilon_start,
-        epsilon_min=cfg.epsilon_min,
-        epsilon_decay=cfg.epsilon_decay,
-    )
+    env = ZilchEnv(_seed(cfg))
+    agent = _make_agent(env.action_space, cfg)
+    if cfg.seed is not None:
+        # The agent explores with np.random
+        np.random.seed(cfg.seed % 2 ** 32)
+    start, saved = _resume(agent, cfg, {})
+    if "games" in saved:
+        env.restore_seed_state(saved["games"])
+    checkpoints = _checkpointer(cfg)
 
     rewards: List[float] = []
-    for ep in range(cfg.episodes):
-        ep_reward = run_episode(env, agent, cfg)
-        rewards.append(ep_reward)
-        if (ep + 1) % max(1, cfg.episodes // 10) == 0:
-            avg = np.mean(rewards[-max(1, cfg.episodes // 10):])
-            print(f"Episode {ep+1}/{cfg.episodes} | Last: {ep_reward:.2f} | Avg recent: {avg:.2f} | epsilon: {agent.epsilon:.3f}")
+    try:
+        for ep in range(start, cfg.episodes):
+            ep_reward = run_episode(env, agent, cfg)
+            rewards.append(ep_reward)
+            if (ep + 1) % max(1, cfg.episodes // 10) == 0:
+                avg = np.mean(rewards[-max(1, cfg.episodes // 10):])
+                print(f"Episode {ep+1}/{cfg.episodes} | Last: {ep_reward:.2f} | Avg recent: {avg:.2f} | epsilon: {agent.epsilon:.3f}")
+            if checkpoints is not None and (ep + 1) % cfg.checkpoint_every == 0:
+                checkpoints.save(agent, ep + 1, _rng_state({}, games=env.seed_state()))
+        if checkpoints is not None:
+            checkpoints.save(agent, max(start, cfg.episodes), _rng_state({}, games=env.seed_state()))
+    finally:
+        if checkpoints is not None:
+            checkpoints.close()
 
     # Save learned Q-table
     agent.save(cfg.model_path)
     return agent
 
+
+def train_replay(cfg: RLConfig) -> ZilchRLAgent:
+    """
+    Single-process training from a replay buffer: _REPLAY_ENVS games are
+    stepped together, their transitions go into a ReplayBuffer of
+    cfg.buffer_size, and once it holds cfg.batch_size transitions every step
+    applies one vectorized update of a sampled batch.
+
+    A resumed run continues with the checkpointed table, epsilon and RNG
+    state but an empty buffer, and games in progress start over.
+    """
+    env_seed, buffer_seed, explore_seed = np.random.SeedSequence(_seed(cfg)).generate_state(3)
+    env = VecZilchEnv(_REPLAY_ENVS, seed=int(env_seed), max_episode_steps=cfg.max_steps_per_episode)
+    agent = _make_agent(env.action_space, cfg)
+    buffer = ReplayBuffer(cfg.buffer_size, seed=int(buffer_seed))
+    explore = np.random.default_rng(int(explore_seed))
+    rngs = {"env": env.rng, "buffer": buffer.rng, "explore": explore}
+    start, _ = _resume(agent, cfg, rngs)
+    checkpoints = _checkpointer(cfg)
+    next_checkpoint = _next_checkpoint(start, cfg)
+    report_every = max(1, cfg.episodes // 10)
+    rewards: List[float] = []
+    running = np.zeros(env.num_envs, dtype=np.float64)
+    obs = env.reset()
+    try:
+        while start + len(rewards) < cfg.episodes:
+            actions = agent.choose_actions(obs, explore)
+            next_obs, step_rewards, dones, info = env.step(actions)
+            # A game cut off at max_steps_per_episode isn't over: bootstrap from
+            # where it stood, not from the reset game
+            buffer.add_batch(obs, actions, step_rewards, info["final_observation"],
+                             dones & ~info["truncated"])
+            agent._decay_epsilon(env.num_envs)
+            if len(buffer) >= cfg.batch_size:
+                batch = buffer.sample(cfg.batch_size)
+                agent.update_batch(batch["states"], batch["actions"], batch["rewards"],
+                                   batch["next_states"], batch["dones"])
+            running += step_rewards
+            finished = running[dones].tolist()
+            running[dones] = 0.0
+            obs = next_obs
+            TRAIN_STEPS.inc(env.num_envs)
+            TRAIN_EPISODES.inc(len(finished))
+            for ep_reward in finished:
+                rewards.append(ep_reward)
+                episode = start + len(rewards)
+                if episode % report_every == 0 and episode <= cfg.episodes:
+                    avg = np.mean(rewards[-report_every:])
+                    print(f"Episode {episode}/{cfg.episodes} | Avg recent: {avg:.2f} | "
+                          f"buffer: {len(buffer)} | epsilon: {agent.epsilon:.3f}")
+            if checkpoints is not None and start + len(rewards) >= next_checkpoint:
+                checkpoints.save(agent, start + len(rewards), _rng_state(rngs))
+                next_checkpoint = _next_checkpoint(start + len(rewards), cfg)
+        if checkpoints is not None:
+            checkpoints.save(agent, max(start, cfg.episodes), _rng_state(rngs))
+    finally:
+        if checkpoints is not None:
+            checkpoints.close()
+
+    agent.save(cfg.model_path)
+    return agent
+
+
+def collect_episodes(
+    snapshot_path: str,
+    epsilon: float,
+    episodes: int,
+    max_steps: int,
+    seed: int,
+) -> Tuple[Dict[str, np.ndarray], List[float]]:
+    """
+    Actor process body: play `episodes` epsilon-greedy episodes against the
+    policy snapshot at `snapshot_path` (memory-mapped read-only, so all
+    actors share its pages) and return the transitions plus episode rewards.
+    The actor never writes to the table; learning happens in the learner.
+    """
+    table, _ = load_binary(snapshot_path, mode="r")
+    rng = np.random.default_rng(seed)
+    env = VecZilchEnv(min(episodes, _ACTOR_ENVS), seed=int(rng.integers(2 ** 63)), max_episode_steps=max_steps)
+    obs = env.reset()
+    running = np.zeros(env.num_envs, dtype=np.float64)
+    episode_rewards: List[float] = []
+    chunks: List[Tuple[np.ndarray, ...]] = []
+    while len(episode_rewards) < episodes:
+        valid = env.action_space.valid_action_masks(obs[:, :6])
+        actions = table.choose_actions(obs, epsilon, rng, add=False, valid=valid)
+        next_obs, rewards, dones, info = env.step(actions)
+        # Cut-off games aren't terminal (see train_replay)
+        chunks.append((obs, actions, rewards, info["final_observation"], dones & ~info["truncated"]))
+        running += rewards
+        episode_rewards.extend(running[dones].tolist())
+        running[dones] = 0.0
+        obs = next_obs
+    batch = {name: np.concatenate([c[i] for c in chunks]) for i, name in enumerate(_TRANSITIONS)}
+    return batch, episode_rewards[:episodes]
+
+
+def _visits(batch: Dict[str, np.ndarray]) -> np.ndarray:
+    """For each transition, how many earlier ones in the batch have its (state, action) pair."""
+    pairs = np.stack([encode_keys(batch["states"]), np.asarray(batch["actions"], dtype=np.int64)], axis=1)
+    _, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    order = np.argsort(inverse.ravel(), kind="stable")
+    grouped = inverse.ravel()[order]
+    position = np.arange(len(order))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = grouped[1:] != grouped[:-1]
+    visits = np.empty(len(order), dtype=np.int64)
+    visits[order] = position - np.maximum.accumulate(np.where(first, position, 0))
+    return visits
+
+
+def _learn(agent: ZilchRLAgent, batch: Dict[str, np.ndarray]) -> None:
+    """
+    Apply an actor's transitions the way stepping through them one by one
+    would: update_batch moves a repeated (state, action) pair once, so the
+    batch is applied in waves, the k-th visit of every pair in wave k. A pair
+    visited k times gets k updates, as in train().
+    """
+    visits = _visits(batch)
+    for wave in range(int(visits.max()) + 1 if len(visits) else 0):
+        picked = visits == wave
+        agent.update_batch(*(batch[name][picked] for name in _TRANSITIONS))
+
+
+def train_parallel(cfg: RLConfig) -> ZilchRLAgent:
+    """
+    Actor/learner training across cfg.num_workers processes.
+
+    Each sync round the learner writes its dense Q-table to a binary
+    snapshot; every actor maps that snapshot, plays cfg.sync_interval
+    episodes with the current epsilon, and sends its transitions back. The
+    learner applies them with _learn() in actor order, then starts the next
+    round from the updated table.
+
+    The actors' seeds are spawned from one SeedSequence, a batch per round;
+    checkpoints record its entropy and the rounds played, so a resumed run
+    gives its actors the seeds the uninterrupted run would have.
+    """
+    agent = _make_agent(ActionSpace(), cfg, q_backend="dense")
+    start, saved = _resume(agent, cfg, {})
+    checkpoints = _checkpointer(cfg)
+    next_checkpoint = _next_checkpoint(start, cfg)
+    per_round = cfg.num_workers * cfg.sync_interval
+    rounds = -(-max(0, cfg.episodes - start) // per_round) if start else max(1, -(-cfg.episodes // per_round))
+    actors = saved.get("actors", {"entropy": _seed(cfg), "rounds": 0})
+    played = actors["rounds"]
+    seeds = np.random.SeedSequence(actors["entropy"], n_children_spawned=played * cfg.num_workers)
+    rewards: List[float] = []
+
+    with tempfile.TemporaryDirectory(prefix="zilch-train-") as tmp, \
+            ProcessPoolExecutor(max_workers=cfg.num_workers) as pool:
+        snapshot = os.path.join(tmp, "policy.qtb")
+        try:
+            for rnd in range(rounds):
+                round_start = time.perf_counter()
+                save_binary(agent.q_table, snapshot, agent.epsilon)
+                futures = [
+                    pool.submit(
+                        collect_episodes,
+                        snapshot,
+                        agent.epsilon,
+                        cfg.sync_interval,
+                        cfg.max_steps_per_episode,
+                        int(child.generate_state(1)[0]),
+                    )
+                    for child in seeds.spawn(cfg.num_workers)
+                ]
+                # In order, so a seeded run applies the same updates every time
+                for future in futures:
+                    batch, ep_rewards = future.result()
+                    _learn(agent, batch)
+                    agent._decay_epsilon(len(batch["actions"]))
+                    rewards.extend(ep_rewards)
+                    TRAIN_EPISODES.inc(len(ep_rewards))
+                    TRAIN_STEPS.inc(len(batch["actions"]))
+                played += 1
+                TRAIN_ROUND_LATENCY.observe(time.perf_counter() - round_start)
+                avg = np.mean(rewards[-per_round:])
+                print(f"Round {rnd+1}/{rounds} | Episodes: {start + len(rewards)} | Avg recent: {avg:.2f} | "
+                      f"states: {len(agent.q_table)} | epsilon: {agent.epsilon:.3f}")
+                if checkpoints is not None and start + len(rewards) >= next_checkpoint:
+                    checkpoints.save(agent, start + len(rewards),
+                                     _rng_state({}, actors={"entropy": seeds.entropy, "rounds": played}))
+                    next_checkpoint = _next_checkpoint(start + len(rewards), cfg)
+            if checkpoints is not None:
+                checkpoints.save(agent, start + len(rewards),
+                                 _rng_state({}, actors={"entropy": seeds.entropy, "rounds": played}))
+        finally:
+            if checkpoints is not None:
+                checkpoints.close()
+
+    agent.save(cfg.model_path)
+    return agent
@@ -0,0 +1,162 @@
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+from .. import scoring
+from ..engine import NUM_DICE, WINNING_SCORE
+from ..utils.state_utils import ActionSpace
+
+ILLEGAL_ACTION_REWARD = -10.0
+
+
+class VecZilchEnv:
+    """
+    N independent self-play Zilch games stepped together with whole-array
+    NumPy operations.
+
+    Follows the same rules and action semantics as ZilchEnv (keep the dice
+    an action's subset names, then bank or roll on; an illegal keep ends the
+    episode with a -10 reward), but holds every game in flat arrays:
+      dice            (N, 6) uint8, 0 = set aside
+      turn_score      (N,)   int32
+      totals          (N, 2) int32
+      current_player  (N,)   uint8
+      turns           (N,)   int32, turns finished so far
+    Finished games are reset automatically inside step(), so the returned
+    observations always describe a live game facing a fresh, scoring roll.
+    With max_episode_steps set, games that run that long are cut off and
+    reset as well (reported as done, with info['truncated'] set). A cut-off
+    game hasn't ended, so learners should bootstrap from
+    info['final_observation'] rather than treat it as terminal.
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        action_space: Optional[ActionSpace] = None,
+        seed: Optional[int] = None,
+        max_episode_steps: Optional[int] = None,
+    ):
+        self.num_envs = num_envs
+        self.max_episode_steps = max_episode_steps
+        self.action_space = action_space or ActionSpace()
+        self.rng = np.random.default_rng(seed)
+
+        # Per-action lookup tables: which dice slots an action keeps, and
+        # whether it banks afterwards
+        actions = self.action_space.all_actions()
+        self._keep_masks = np.zeros((len(actions), NUM_DICE), dtype=bool)
+        self._bank = np.zeros(len(actions), dtype=bool)
+        for a, (indices, bank) in enumerate(actions):
+            self._keep_masks[a, indices] = True
+            self._bank[a] = bank
+
+        self.dice = np.zeros((num_envs, NUM_DICE), dtype=np.uint8)
+        self.turn_score = np.zeros(num_envs, dtype=np.int32)
+        self.totals = np.zeros((num_envs, 2), dtype=np.int32)
+        self.current_player = np.zeros(num_envs, dtype=np.uint8)
+        self.steps = np.zeros(num_envs, dtype=np.int32)
+        self.turns = np.zeros(num_envs, dtype=np.int32)
+
+    def reset(self) -> np.ndarray:
+        """Start all N games over; returns (N, 10) observations."""
+        self._reset_rows(np.ones(self.num_envs, dtype=bool))
+        return self._observations()
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Apply one action per game. Returns (observations, rewards, dones, info)
+        where info['illegal'] flags games whose action was rejected,
+        info['truncated'] games cut off at max_episode_steps and
+        info['winner'] holds the winning player of games that just ended (-1
+        otherwise). For games that just ended, info['final_totals'] and
+        info['turns'] hold their final scores and turn count (0 otherwise),
+        since the games themselves have already been reset, and
+        info['final_observation'] holds the observation the step led to
+        before the reset (for the other games, the same as the one returned).
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        n = self.num_envs
+        rows = np.arange(n)
+        rewards = np.zeros(n, dtype=np.float32)
+        winner = np.full(n, -1, dtype=np.int8)
+
+        requested = self._keep_masks[actions]
+        bank = self._bank[actions]
+        on_table = self.dice > 0
+        kept = np.where(requested, self.dice, 0)
+        points = scoring.keep_score_many(kept)
+        # Asking for a set-aside die, or for dice that don't all score, is illegal
+        illegal = ((requested & ~on_table).any(axis=1)) | (points == 0)
+        rewards[illegal] = ILLEGAL_ACTION_REWARD
+        dones = illegal.copy()
+
+        keeping = ~illegal
+        self.dice[requested & keeping[:, None]] = 0
+        self.turn_score[keeping] += points[keeping]
+
+        bank &= keeping
+        if bank.any():
+            b = rows[bank]
+            player = self.current_player[b]
+            self.totals[b, player] += self.turn_score[b]
+            rewards[b] = self.turn_score[b]
+            won = self.totals[b, player] >= WINNING_SCORE
+            winner[b[won]] = player[won]
+            dones[b[won]] = True
+            self.turns[b[won]] += 1
+            self._end_turn(b[~won])
+
+        self.steps += 1
+        truncated = ~dones
+        if self.max_episode_steps is not None:
+            truncated &= self.steps >= self.max_episode_steps
+        else:
+            truncated[:] = False
+        dones |= truncated
+
+        self._roll(~dones)
+        final_totals = np.where(dones[:, None], self.totals, 0)
+        turns = np.where(dones, self.turns, 0)
+        final_obs = self._observations()
+        self._reset_rows(dones)
+        info = {'illegal': illegal, 'truncated': truncated, 'winner': winner,
+                'final_totals': final_totals, 'turns': turns, 'final_observation': final_obs}
+        return self._observations(), rewards, dones, info
+
+    def _end_turn(self, rows: np.ndarray) -> None:
+        self.turns[rows] += 1
+        self.current_player[rows] ^= 1
+        self.turn_score[rows] = 0
+        self.dice[rows] = 0
+
+    def _roll(self, mask: np.ndarray) -> None:
+        """Roll the dice on the table for masked games, passing the turn on each zilch."""
+        rows = np.flatnonzero(mask)
+        while rows.size:
+            on_table = self.dice[rows] > 0
+            # Start of a turn or hot dice: all six are rolled
+            on_table[~on_table.any(axis=1)] = True
+            values = self.rng.integers(1, 7, size=on_table.shape, dtype=np.uint8)
+            rolled = np.where(on_table, values, 0).astype(np.uint8)
+            self.dice[rows] = rolled
+            zilched = rows[scoring.score_many(rolled) == 0]
+            self._end_turn(zilched)
+            rows = zilched
+
+    def _reset_rows(self, mask: np.ndarray) -> None:
+        self.dice[mask] = 0
+        self.turn_score[mask] = 0
+        self.totals[mask] = 0
+        self.current_player[mask] = 0
+        self.steps[mask] = 0
+        self.turns[mask] = 0
+        self._roll(mask)
+
+    def _observations(self) -> np.ndarray:
+        """(N, 10) float32 observations laid out like encode_state()."""
+        obs = np.empty((self.num_envs, NUM_DICE + 4), dtype=np.float32)
+        obs[:, :NUM_DICE] = self.dice
+        obs[:, NUM_DICE] = self.turn_score
+        obs[:, NUM_DICE + 1:NUM_DICE + 3] = self.totals
+        obs[:, NUM_DICE + 3] = self.current_player
+        return obs
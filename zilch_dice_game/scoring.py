@@ -0,0 +1,210 @@
+"""
+Table-driven Zilch scoring (see RULES.md).
+
+Every sorted multiset of one to six dice (923 of them) is scored once at
+import time, so scoring a roll afterwards is a key computation plus a single
+table lookup.  A roll is keyed by its face counts written in base 7, which
+makes the key independent of dice order; a 0 (a die that has been set aside)
+contributes nothing to the key.
+
+Three numbers are kept per multiset:
+  - best score: the most points any subset of the dice can score,
+  - best keep: the key of the dice that make up that score,
+  - keep score: the points for setting aside exactly these dice, or 0 when
+    at least one of them does not take part in a scoring combination.
+
+The game engine only needs the dict tables. The NumPy copies used for
+batch scoring are built, and NumPy imported, on the first batch call, so
+importing the API doesn't pay for them.
+"""
+from functools import lru_cache
+from itertools import combinations, combinations_with_replacement, product
+from typing import TYPE_CHECKING, Dict, Iterable, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+NUM_DICE = 6
+NUM_FACES = 6
+
+# Key contribution of one die showing a given face (index 0 = no die)
+_FACE_WEIGHT: Tuple[int, ...] = (0, 1, 7, 49, 343, 2401, 16807)
+# Number of distinct keys (face counts 0-6 for each of the six faces)
+NUM_KEYS = 7 ** NUM_FACES
+
+STRAIGHT_SCORE = 1500
+THREE_PAIRS_SCORE = 1500
+TWO_TRIPLETS_SCORE = 2500
+
+
+def _triple_score(face: int) -> int:
+    return 1000 if face == 1 else face * 100
+
+
+def _counts_key(counts: Sequence[int]) -> int:
+    return sum(c * _FACE_WEIGHT[f + 1] for f, c in enumerate(counts))
+
+
+def counts_from_key(key: int) -> Tuple[int, ...]:
+    """Face counts (for faces 1-6) encoded by a dice key."""
+    counts = []
+    for _ in range(NUM_FACES):
+        key, c = divmod(key, 7)
+        counts.append(c)
+    return tuple(counts)
+
+
+def _combos(counts: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    """Every (points, dice used) scoring combination that fits in `counts`."""
+    found = []
+    for f, c in enumerate(counts):
+        face = f + 1
+        if face in (1, 5) and c >= 1:
+            used = [0] * NUM_FACES
+            used[f] = 1
+            found.append((100 if face == 1 else 50, tuple(used)))
+        for n in range(3, c + 1):
+            # Four/five/six of a kind double/triple/quadruple the triple
+            used = [0] * NUM_FACES
+            used[f] = n
+            found.append((_triple_score(face) * (n - 2), tuple(used)))
+    if all(c >= 1 for c in counts):
+        found.append((STRAIGHT_SCORE, (1,) * NUM_FACES))
+    for faces in combinations([f for f, c in enumerate(counts) if c >= 2], 3):
+        used = [0] * NUM_FACES
+        for f in faces:
+            used[f] = 2
+        found.append((THREE_PAIRS_SCORE, tuple(used)))
+    for faces in combinations([f for f, c in enumerate(counts) if c >= 3], 2):
+        used = [0] * NUM_FACES
+        for f in faces:
+            used[f] = 3
+        found.append((TWO_TRIPLETS_SCORE, tuple(used)))
+    return found
+
+
+def _build_tables() -> Tuple[Dict[int, int], Dict[int, int], Dict[int, int]]:
+    # Points for scoring *all* of the dice in a multiset (-1 if impossible)
+    full: Dict[Tuple[int, ...], int] = {(0,) * NUM_FACES: 0}
+
+    def full_score(counts: Tuple[int, ...]) -> int:
+        if counts in full:
+            return full[counts]
+        best = -1
+        for points, used in _combos(counts):
+            rest = full_score(tuple(c - u for c, u in zip(counts, used)))
+            if rest >= 0 and points + rest > best:
+                best = points + rest
+        full[counts] = best
+        return best
+
+    best_score: Dict[int, int] = {0: 0}
+    best_keep: Dict[int, int] = {0: 0}
+    keep_score: Dict[int, int] = {0: 0}
+    for n in range(1, NUM_DICE + 1):
+        for dice in combinations_with_replacement(range(1, NUM_FACES + 1), n):
+            counts = tuple(dice.count(face) for face in range(1, NUM_FACES + 1))
+            key = _counts_key(counts)
+            top, top_counts = 0, (0,) * NUM_FACES
+            for sub in product(*(range(c + 1) for c in counts)):
+                points = full_score(sub)
+                # Prefer the larger keep on ties so the mask covers every scorer
+                if points > top or (points == top and points > 0 and sum(sub) > sum(top_counts)):
+                    top, top_counts = points, sub
+            best_score[key] = top
+            best_keep[key] = _counts_key(top_counts)
+            keep_score[key] = max(full_score(counts), 0)
+    return best_score, best_keep, keep_score
+
+
+_BEST_SCORE, _BEST_KEEP, _KEEP_SCORE = _build_tables()
+
+# Every sorted multiset of 1-6 dice, in the same order the tables were built
+MULTISETS: Tuple[Tuple[int, ...], ...] = tuple(
+    dice
+    for n in range(1, NUM_DICE + 1)
+    for dice in combinations_with_replacement(range(1, NUM_FACES + 1), n)
+)
+
+
+@lru_cache(maxsize=None)
+def _by_key() -> Tuple["np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Face weights and dense copies of the tables indexed directly by key, for batch scoring."""
+    import numpy as np
+
+    def key_table(table: Dict[int, int]) -> np.ndarray:
+        arr = np.zeros(NUM_KEYS, dtype=np.int32)
+        arr[np.fromiter(table.keys(), dtype=np.int64)] = np.fromiter(table.values(), dtype=np.int64)
+        return arr
+
+    return (np.array(_FACE_WEIGHT, dtype=np.int32),
+            key_table(_BEST_SCORE), key_table(_BEST_KEEP), key_table(_KEEP_SCORE))
+
+
+def dice_key(dice: Iterable[int]) -> int:
+    """Order-independent key of a roll; 0 entries are ignored."""
+    key = 0
+    for d in dice:
+        key += _FACE_WEIGHT[d]
+    return key
+
+
+def score(dice: Iterable[int]) -> int:
+    """Best score available from the dice (0 means the roll is a zilch)."""
+    return _BEST_SCORE[dice_key(dice)]
+
+
+def is_zilch(dice: Iterable[int]) -> bool:
+    return _BEST_SCORE[dice_key(dice)] == 0
+
+
+def keep_score(dice: Iterable[int]) -> int:
+    """Points for setting aside exactly these dice, or 0 if any of them doesn't score."""
+    return _KEEP_SCORE[dice_key(dice)]
+
+
+def scoring_mask(dice: Sequence[int]) -> int:
+    """
+    Bitmask over positions in `dice` (bit i = dice[i]) of the dice that make
+    up the best score.
+    """
+    remaining = list(counts_from_key(_BEST_KEEP[dice_key(dice)]))
+    mask = 0
+    for i, d in enumerate(dice):
+        if d and remaining[d - 1]:
+            remaining[d - 1] -= 1
+            mask |= 1 << i
+    return mask
+
+
+def dice_key_weights() -> "np.ndarray":
+    """Key contribution of each face (index 0 = no die), for building keys in bulk."""
+    return _by_key()[0]
+
+
+def keep_score_by_key() -> "np.ndarray":
+    """keep_score() of every key, as a read-only array indexed by key."""
+    view = _by_key()[3].view()
+    view.flags.writeable = False
+    return view
+
+
+def dice_keys(dice_batch: "np.ndarray") -> "np.ndarray":
+    """Keys for a (N, k) integer array of dice (0 = no die)."""
+    import numpy as np
+    return _by_key()[0][np.asarray(dice_batch)].sum(axis=-1)
+
+
+def score_many(dice_batch: "np.ndarray") -> "np.ndarray":
+    """Best score for each row of a (N, k) dice array."""
+    return _by_key()[1][dice_keys(dice_batch)]
+
+
+def keep_score_many(dice_batch: "np.ndarray") -> "np.ndarray":
+    """keep_score() for each row of a (N, k) dice array."""
+    return _by_key()[3][dice_keys(dice_batch)]
+
+
+def best_keep_many(dice_batch: "np.ndarray") -> "np.ndarray":
+    """Key of the best-scoring dice for each row of a (N, k) dice array."""
+    return _by_key()[2][dice_keys(dice_batch)]
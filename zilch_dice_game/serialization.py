@@ -0,0 +1,120 @@
+"""
+Fast JSON rendering of games, with optional delta responses.
+
+Responses are rendered straight from the compact Game into JSON bytes with
+one string template, skipping the pydantic model and FastAPI's
+jsonable_encoder. The output is the same document GameState serializes to.
+
+Delta responses: a client that already holds version N of a game can send
+?since=N and get back only the fields that changed, as
+    {"delta": true, "game_id": ..., "since": N, "version": M, <changed fields>}
+This works as long as this process rendered version N recently: each Game
+carries its last DELTA_VERSIONS rendered versions (Game.rendered), so they
+cost nothing once the store drops the game. Otherwise the full state is
+returned, which clients recognize by the missing "delta" key.
+"""
+import json
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi.responses import Response
+
+from .state import Game, PLAYER_NAMES
+
+_NAMES = [json.dumps(name) for name in PLAYER_NAMES]
+_BOOL = ('false', 'true')
+
+# Fields that can change, in the order GameState declares them
+_FIELDS = ('players', 'current_player', 'dice', 'kept', 'turn_score',
+           'finished', 'winner', 'awaiting_keep', 'zilch')
+
+# Rendered versions kept per game for delta responses
+DELTA_VERSIONS = 4
+
+# [hits, misses] of ?since= lookups
+_delta_stats = [0, 0]
+
+
+def _dice_json(packed: int) -> str:
+    return '[%d,%d,%d,%d,%d,%d]' % (
+        packed & 7, packed >> 3 & 7, packed >> 6 & 7,
+        packed >> 9 & 7, packed >> 12 & 7, packed >> 15 & 7,
+    )
+
+
+def _field_values(game: Game) -> Tuple[str, ...]:
+    """Each field of _FIELDS already rendered as JSON."""
+    return (
+        '[{"name":%s,"total_score":%d},{"name":%s,"total_score":%d}]'
+        % (_NAMES[0], game.total0, _NAMES[1], game.total1),
+        str(game.current_player),
+        _dice_json(game.packed_dice),
+        '[%s]' % ','.join(map(str, game.kept_bytes)),
+        str(game.turn_score),
+        _BOOL[game.finished],
+        'null' if game.winner is None else str(game.winner),
+        _BOOL[game.awaiting_keep],
+        _BOOL[game.zilch],
+    )
+
+
+def _remember(game: Game, values: Tuple[str, ...]) -> None:
+    rendered = game.rendered
+    if rendered and rendered[0][0] == game.version:
+        return
+    # A new tuple rather than an update in place: Game.copy() shares it
+    game.rendered = ((game.version, values),) + rendered[:DELTA_VERSIONS - 1]
+
+
+def render_game(game: Game) -> bytes:
+    """The game as GameState JSON bytes."""
+    values = _field_values(game)
+    _remember(game, values)
+    body = ','.join('"%s":%s' % pair for pair in zip(_FIELDS, values))
+    return ('{"game_id":%s,%s,"version":%d}' % (json.dumps(game.game_id), body, game.version)).encode()
+
+
+def render_delta(game: Game, since: int) -> Optional[bytes]:
+    """Only the fields changed since version `since`, or None if that version isn't known."""
+    before = next((values for version, values in game.rendered if version == since), None)
+    if before is None:
+        _delta_stats[1] += 1
+        return None
+    _delta_stats[0] += 1
+    values = _field_values(game)
+    _remember(game, values)
+    changed = ''.join(
+        ',"%s":%s' % (name, new) for name, old, new in zip(_FIELDS, before, values) if old != new
+    )
+    return ('{"delta":true,"game_id":%s,"since":%d,"version":%d%s}'
+            % (json.dumps(game.game_id), since, game.version, changed)).encode()
+
+
+def game_response(game: Game, since: Optional[int] = None) -> Response:
+    """JSON response for a game: a delta when `since` is given and known, else the full state."""
+    body = render_delta(game, since) if since is not None else None
+    if body is None:
+        body = render_game(game)
+    return Response(content=body, media_type='application/json')
+
+
+def new_game_response(game: Game) -> Response:
+    """The {'game_id', 'game'} document returned when a game is created."""
+    body = b'{"game_id":%s,"game":%s}' % (json.dumps(game.game_id).encode(), render_game(game))
+    return Response(content=body, media_type='application/json')
+
+
+def games_response(games: Iterable[Game]) -> Response:
+    """{'games': [...]} for a batch of games."""
+    body = b'{"games":[%s]}' % b','.join(render_game(game) for game in games)
+    return Response(content=body, media_type='application/json')
+
+
+def render_event(game: Game, event: str, player: int) -> bytes:
+    """A WebSocket push: the move that was just made and the resulting state."""
+    return b'{"event":"%s","player":%d,"game":%s}' % (event.encode(), player, render_game(game))
+
+
+def snapshot_metrics() -> Dict[str, float]:
+    hits, misses = _delta_stats
+    return {'delta_hits_total': hits, 'delta_misses_total': misses,
+            'delta_hit_rate': hits / (hits + misses) if hits + misses else 0.0}
@@ -0,0 +1,191 @@
+"""
+Compact internal game state.
+
+Game is what the engine, the stores and the RL env work on; the pydantic
+GameState in models.py is only built when a response goes out. A Game uses
+__slots__, packs the six dice into one int (3 bits per die) and the kept
+dice into bytes, and keeps scores as plain ints, so a live game costs a few
+hundred bytes instead of a pydantic model with its lists and per-object
+dicts.
+"""
+import struct
+from typing import List, Optional, Sequence, Tuple
+
+from .models import GameState, PlayerState
+from .rng import new_seed
+
+NUM_DICE = 6
+PLAYER_NAMES = ('Human', 'AI')
+
+_DIE_BITS = 3
+_DIE_MASK = (1 << _DIE_BITS) - 1
+
+
+def pack_dice(dice: Sequence[int]) -> int:
+    packed = 0
+    for i, d in enumerate(dice):
+        packed |= d << (_DIE_BITS * i)
+    return packed
+
+
+def unpack_dice(packed: int) -> List[int]:
+    return [(packed >> (_DIE_BITS * i)) & _DIE_MASK for i in range(NUM_DICE)]
+
+
+class Game:
+    __slots__ = (
+        'game_id',
+        'packed_dice',     # six 3-bit dice values, 0 = set aside
+        'kept_bytes',      # every die kept this turn, one byte each
+        'turn_score',
+        'total0',
+        'total1',
+        'current_player',
+        'finished',
+        'winner',
+        'awaiting_keep',
+        'zilch',
+        'version',
+        'seed',            # dice stream of this game (see rng.py)
+        'rng_pos',         # byte offset of the next die in that stream
+        'rendered',        # last few versions as rendered by serialization.py; not persisted
+    )
+
+    def __init__(self, game_id: str, seed: Optional[bytes] = None) -> None:
+        self.game_id = game_id
+        self.packed_dice = 0
+        self.kept_bytes = b''
+        self.turn_score = 0
+        self.total0 = 0
+        self.total1 = 0
+        self.current_player = 0
+        self.finished = False
+        self.winner: Optional[int] = None
+        self.awaiting_keep = False
+        self.zilch = False
+        self.version = 0
+        self.seed = new_seed() if seed is None else seed
+        self.rng_pos = 0
+        self.rendered: Tuple[Tuple[int, Tuple[str, ...]], ...] = ()
+
+    @property
+    def dice(self) -> List[int]:
+        """Unpacked copy of the dice; assign a list back to change them."""
+        return unpack_dice(self.packed_dice)
+
+    @dice.setter
+    def dice(self, values: Sequence[int]) -> None:
+        self.packed_dice = pack_dice(values)
+
+    @property
+    def kept(self) -> List[int]:
+        return list(self.kept_bytes)
+
+    @kept.setter
+    def kept(self, values: Sequence[int]) -> None:
+        self.kept_bytes = bytes(values)
+
+    def total(self, player: int) -> int:
+        return self.total1 if player else self.total0
+
+    def add_total(self, player: int, points: int) -> int:
+        """Add points to a player's total; returns the new total."""
+        if player:
+            self.total1 += points
+            return self.total1
+        self.total0 += points
+        return self.total0
+
+    @property
+    def totals(self) -> Tuple[int, int]:
+        return self.total0, self.total1
+
+    def copy(self) -> 'Game':
+        other = Game.__new__(Game)
+        for name in Game.__slots__:
+            setattr(other, name, getattr(self, name))
+        return other
+
+    # --- pydantic edge ---
+
+    def to_model(self) -> GameState:
+        return GameState(
+            game_id=self.game_id,
+            players=[
+                PlayerState(name=PLAYER_NAMES[0], total_score=self.total0),
+                PlayerState(name=PLAYER_NAMES[1], total_score=self.total1),
+            ],
+            current_player=self.current_player,
+            dice=self.dice,
+            kept=self.kept,
+            turn_score=self.turn_score,
+            finished=self.finished,
+            winner=self.winner,
+            awaiting_keep=self.awaiting_keep,
+            zilch=self.zilch,
+            version=self.version,
+        )
+
+    # --- binary form, used by the persistent stores ---
+
+    # format, dice, turn score, totals, version, flags, winner, id length,
+    # kept length, rng position, seed length
+    _HEADER = struct.Struct('<BIIIIQBbBHQB')
+    _FORMAT = 2
+    # Largest game id, kept dice and seed the header's length fields can hold
+    _MAX_ID_BYTES = 0xFF
+    _MAX_KEPT_BYTES = 0xFFFF
+    _MAX_SEED_BYTES = 0xFF
+    # Format 1 had no dice stream; such games get a fresh seed when loaded
+    _HEADER_V1 = struct.Struct('<BIIIIQBbBH')
+
+    def to_bytes(self) -> bytes:
+        flags = (
+            self.current_player
+            | self.finished << 1
+            | self.awaiting_keep << 2
+            | self.zilch << 3
+        )
+        game_id = self.game_id.encode()
+        if (len(game_id) > self._MAX_ID_BYTES or len(self.kept_bytes) > self._MAX_KEPT_BYTES
+                or len(self.seed) > self._MAX_SEED_BYTES):
+            raise ValueError(f'Game {self.game_id!r} is too large for the binary format')
+        winner = -1 if self.winner is None else self.winner
+        return self._HEADER.pack(
+            self._FORMAT, self.packed_dice, self.turn_score, self.total0, self.total1,
+            self.version, flags, winner, len(game_id), len(self.kept_bytes),
+            self.rng_pos, len(self.seed),
+        ) + game_id + self.kept_bytes + self.seed
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Game':
+        fmt = data[0]
+        if fmt == cls._FORMAT:
+            (fmt, dice, turn_score, total0, total1, version, flags, winner,
+             id_len, kept_len, rng_pos, seed_len) = cls._HEADER.unpack_from(data)
+            offset = cls._HEADER.size
+        elif fmt == 1:
+            (fmt, dice, turn_score, total0, total1, version, flags, winner,
+             id_len, kept_len) = cls._HEADER_V1.unpack_from(data)
+            rng_pos, seed_len = 0, 0
+            offset = cls._HEADER_V1.size
+        else:
+            raise ValueError(f'Unknown game format {fmt}')
+        game_id = data[offset:offset + id_len].decode()
+        offset += id_len
+        kept_bytes = bytes(data[offset:offset + kept_len])
+        offset += kept_len
+        game = cls(game_id, bytes(data[offset:offset + seed_len]) if seed_len else None)
+        game.kept_bytes = kept_bytes
+        game.rng_pos = rng_pos
+        game.packed_dice = dice
+        game.turn_score = turn_score
+        game.total0 = total0
+        game.total1 = total1
+        game.version = version
+        game.current_player = flags & 1
+        game.finished = bool(flags & 2)
+        game.awaiting_keep = bool(flags & 4)
+        game.zilch = bool(flags & 8)
+        game.winner = None if winner < 0 else winner
+        return game
@@ -0,0 +1,431 @@
+"""
+Game storage backends.
+
+Handlers only talk to the GameStore interface: get() a game, mutate it with
+the engine, put() it back. The backend decides how long games live and
+where they are kept.
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+import sqlite3
+import sys
+import threading
+import time
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .state import Game
+
+
+class StaleGameError(Exception):
+    """The game was changed by another writer since this copy was read."""
+
+
+class GameStore(ABC):
+    # True when get()/put() do blocking I/O
+    blocking = False
+
+    @abstractmethod
+    def get(self, game_id: str) -> Optional[Game]:
+        """The game with this id, or None if it doesn't exist (or has expired)."""
+
+    @abstractmethod
+    def put(self, game: Game) -> None:
+        """
+        Insert or replace a game and bump its version; call after every
+        mutation. Raises StaleGameError if a newer version has been stored.
+        """
+
+    @abstractmethod
+    def delete(self, game_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def metrics(self) -> Dict[str, float]:
+        """Gauges and counters describing the store, for monitoring."""
+        return {'games': len(self)}
+
+    def close(self) -> None:
+        pass
+
+
+# Small ints are shared by the interpreter; larger ones are separate objects
+_SMALL_INT_MAX = 256
+# Rough size of one rendered version kept in Game.rendered (a tuple of nine short strings)
+_RENDERED_VERSION_BYTES = 700
+
+
+def estimate_game_bytes(game: Game) -> int:
+    """Approximate memory held by one game object and what it references."""
+    size = (sys.getsizeof(game) + sys.getsizeof(game.game_id) + sys.getsizeof(game.kept_bytes)
+            + sys.getsizeof(game.seed) + _RENDERED_VERSION_BYTES * len(game.rendered))
+    for value in (game.packed_dice, game.turn_score, game.total0, game.total1, game.version, game.rng_pos):
+        if value > _SMALL_INT_MAX:
+            size += sys.getsizeof(value)
+    return size
+
+
+class InMemoryGameStore(GameStore):
+    """
+    Games kept in process memory, bounded three ways:
+      - games idle for longer than `ttl` seconds expire,
+      - finished games are dropped `finished_ttl` seconds after they end,
+      - past `max_games` games or `max_bytes` estimated bytes, the least
+        recently used games are evicted.
+    Expiry is checked lazily on access and swept from the cold end of the
+    LRU order on every put(), so no background thread is needed.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600.0,
+        finished_ttl: float = 60.0,
+        max_games: int = 100_000,
+        max_bytes: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self.finished_ttl = finished_ttl
+        self.max_games = max_games
+        self.max_bytes = max_bytes  # 0 = no byte limit
+        self.clock = clock
+        # game_id -> (game, last access time, estimated bytes, finished at last put);
+        # least recently used first
+        self._games: "OrderedDict[str, Tuple[Game, float, int, bool]]" = OrderedDict()
+        self._finished: Deque[Tuple[float, str]] = deque()  # (drop deadline, game_id)
+        self._bytes = 0
+        self._finished_count = 0
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    def _remove(self, game_id: str) -> None:
+        _, _, size, finished = self._games.pop(game_id)
+        self._bytes -= size
+        self._finished_count -= finished
+
+    def _sweep(self, now: float) -> None:
+        while self._finished and self._finished[0][0] <= now:
+            _, game_id = self._finished.popleft()
+            entry = self._games.get(game_id)
+            if entry is not None and entry[3]:
+                self._remove(game_id)
+                self.expired += 1
+        while self._games:
+            game_id, (_, last_access, _, _) = next(iter(self._games.items()))
+            if now - last_access < self.ttl:
+                break
+            self._remove(game_id)
+            self.expired += 1
+        while self._games and (
+            len(self._games) > self.max_games or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            self._remove(next(iter(self._games)))
+            self.evicted += 1
+
+    def get(self, game_id: str) -> Optional[Game]:
+        now = self.clock()
+        with self._lock:
+            entry = self._games.get(game_id)
+            if entry is None:
+                return None
+            game, last_access, size, finished = entry
+            if now - last_access >= self.ttl:
+                self._remove(game_id)
+                self.expired += 1
+                return None
+            self._games[game_id] = (game, now, size, finished)
+            self._games.move_to_end(game_id)
+            return game
+
+    def put(self, game: Game) -> None:
+        now = self.clock()
+        size = estimate_game_bytes(game)
+        with self._lock:
+            previous = self._games.pop(game.game_id, None)
+            was_finished = False
+            if previous is not None:
+                self._bytes -= previous[2]
+                self._finished_count -= previous[3]
+                was_finished = previous[3]
+            game.version += 1
+            if game.finished and not was_finished:
+                # Start the grace period when the game first shows up finished
+                self._finished.append((now + self.finished_ttl, game.game_id))
+            self._games[game.game_id] = (game, now, size, game.finished)
+            self._bytes += size
+            self._finished_count += game.finished
+            self._sweep(now)
+
+    def delete(self, game_id: str) -> None:
+        with self._lock:
+            if game_id in self._games:
+                self._remove(game_id)
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'games': len(self._games),
+                'finished_games': self._finished_count,
+                'bytes': self._bytes,
+                'evicted_total': self.evicted,
+                'expired_total': self.expired,
+            }
+
+
+class SQLiteGameStore(GameStore):
+    """
+    Games persisted in a SQLite database in WAL mode, shareable by every
+    worker process on a host and surviving restarts.
+
+    - Write-behind: put() snapshots the game and queues it; a background
+      thread writes everything queued within `flush_interval` seconds in one
+      transaction. A crash loses at most that window.
+    - Read-through hot cache: each worker keeps up to `cache_size` games in
+      an LRU. A cached game is revalidated with a cheap version lookup before
+      it is served, unless this worker holds unflushed writes for it.
+    - Versions: every put() must start from the version the store last
+      handed out. The first put() of a game since its last flush claims the
+      next version in the database right away, with a conditional UPDATE of
+      the version column only, and the flushed UPDATE is conditional on that
+      claim. So a writer in another worker that clashes gets StaleGameError
+      before its request is answered, never a write dropped at flush time.
+      The claim costs one small write per game per flush window.
+    """
+
+    blocking = True
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            game_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            finished INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            data BLOB NOT NULL
+        )
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 0.005,
+        cache_size: int = 10_000,
+        ttl: float = 3600.0,
+        finished_ttl: float = 60.0,
+        cleanup_interval: float = 60.0,
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.finished_ttl = finished_ttl
+        self.cleanup_interval = cleanup_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Held by flushes and version claims, so a claim never sees a
+        # half-flushed game
+        self._write_lock = threading.Lock()
+        self._cache: "OrderedDict[str, Game]" = OrderedDict()
+        # game_id -> (serialized game, version, finished, version the row holds
+        # until this write lands; 0 = not inserted yet)
+        self._pending: Dict[str, Tuple[bytes, int, bool, int]] = {}
+        self.flushes = 0
+        self.conflicts = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(self._SCHEMA)
+        conn.commit()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="zilch-sqlite-flush", daemon=True)
+        self._flusher.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _dump(game: Game) -> bytes:
+        return game.to_bytes()
+
+    @staticmethod
+    def _load(data: bytes) -> Game:
+        return Game.from_bytes(data)
+
+    def _remember(self, game: Game) -> None:
+        self._cache[game.game_id] = game
+        self._cache.move_to_end(game.game_id)
+        while len(self._cache) > self.cache_size:
+            # Never drop a game with unflushed writes
+            victim = next((g for g in self._cache if g not in self._pending), None)
+            if victim is None:
+                break
+            del self._cache[victim]
+
+    def get(self, game_id: str) -> Optional[Game]:
+        with self._lock:
+            cached = self._cache.get(game_id)
+            if cached is not None and game_id in self._pending:
+                self.cache_hits += 1
+                self._cache.move_to_end(game_id)
+                return cached
+        conn = self._conn()
+        if cached is not None:
+            row = conn.execute("SELECT version FROM games WHERE game_id = ?", (game_id,)).fetchone()
+            if row is not None and row[0] == cached.version:
+                with self._lock:
+                    self.cache_hits += 1
+                    if game_id in self._cache:
+                        self._cache.move_to_end(game_id)
+                return cached
+        row = conn.execute("SELECT data FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        with self._lock:
+            self.cache_misses += 1
+            if row is None:
+                self._cache.pop(game_id, None)
+                return None
+            game = self._load(row[0])
+            self._remember(game)
+            return game
+
+    def put(self, game: Game) -> None:
+        with self._write_lock:
+            with self._lock:
+                pending = self._pending.get(game.game_id)
+                cached = self._cache.get(game.game_id)
+                if cached is not None and cached is not game and cached.version > game.version:
+                    raise StaleGameError(game.game_id)
+            if pending is not None:
+                base = pending[3]
+            elif game.version:
+                self._claim(game)
+                base = game.version + 1
+            else:
+                base = 0
+            with self._lock:
+                game.version += 1
+                self._pending[game.game_id] = (self._dump(game), game.version, game.finished, base)
+                self._remember(game)
+
+    def _claim(self, game: Game) -> None:
+        """Move the stored version past game.version, or raise StaleGameError if it has moved on."""
+        cur = self._conn().execute(
+            "UPDATE games SET version = ?, updated_at = ? WHERE game_id = ? AND version = ?",
+            (game.version + 1, time.time(), game.game_id, game.version),
+        )
+        if cur.rowcount == 0:
+            with self._lock:
+                self.conflicts += 1
+                # Reload whatever won on next access
+                self._cache.pop(game.game_id, None)
+            raise StaleGameError(game.game_id)
+
+    def delete(self, game_id: str) -> None:
+        with self._lock:
+            self._cache.pop(game_id, None)
+            self._pending.pop(game_id, None)
+        self._conn().execute("DELETE FROM games WHERE game_id = ?", (game_id,))
+
+    def __len__(self) -> int:
+        self.flush()
+        return self._conn().execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def flush(self) -> None:
+        """Write everything queued so far (normally done by the background thread)."""
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            try:
+                self._write(batch)
+            except sqlite3.Error:
+                with self._lock:
+                    # Requeue for the next flush, unless a newer write superseded it
+                    for game_id, item in batch.items():
+                        newer = self._pending.get(game_id)
+                        if newer is None:
+                            self._pending[game_id] = item
+                        else:
+                            self._pending[game_id] = newer[:3] + (item[3],)
+                raise
+
+    def _write(self, batch: Dict[str, Tuple[bytes, int, bool, int]]) -> None:
+        now = time.time()
+        conn = self._conn()
+        lost: List[str] = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for game_id, (data, version, finished, base) in batch.items():
+                if base == 0:
+                    cur = conn.execute(
+                        "INSERT OR IGNORE INTO games (game_id, version, finished, updated_at, data) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (game_id, version, finished, now, data),
+                    )
+                else:
+                    cur = conn.execute(
+                        "UPDATE games SET version = ?, finished = ?, updated_at = ?, data = ? "
+                        "WHERE game_id = ? AND version = ?",
+                        (version, finished, now, data, game_id, base),
+                    )
+                if cur.rowcount == 0:
+                    lost.append(game_id)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.flushes += 1
+            self.conflicts += len(lost)
+            for game_id in lost:
+                # The row was deleted (expired) under us; reload on next access
+                if game_id not in self._pending:
+                    self._cache.pop(game_id, None)
+
+    def _cleanup(self) -> None:
+        now = time.time()
+        self._conn().execute(
+            "DELETE FROM games WHERE updated_at < ? OR (finished = 1 AND updated_at < ?)",
+            (now - self.ttl, now - self.finished_ttl),
+        )
+
+    def _flush_loop(self) -> None:
+        last_cleanup = time.monotonic()
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - last_cleanup >= self.cleanup_interval:
+                    last_cleanup = time.monotonic()
+                    self._cleanup()
+            except sqlite3.Error:
+                # Keep the flusher alive through transient errors (e.g. a busy DB)
+                continue
+
+    def close(self) -> None:
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+
+    def metrics(self) -> Dict[str, float]:
+        games = self._conn().execute("SELECT COUNT(*) FROM games").fetchone()[0]
+        with self._lock:
+            return {
+                'games': games,
+                'cached_games': len(self._cache),
+                'pending_writes': len(self._pending),
+                'flushes_total': self.flushes,
+                'conflicts_total': self.conflicts,
+                'cache_hits_total': self.cache_hits,
+                'cache_misses_total': self.cache_misses,
+            }
@@ -1,31 +1,106 @@
-from typing import List, Tuple
+from functools import lru_cache
+from typing import List, Sequence, Tuple
 import numpy as np
 
-# Simple, initial action space scaffold:
-#  - 0: keep nothing (placeholder/no-op)
-#  - 1: keep first die (index 0) if any dice exist
-# We'll expand this to enumerate valid scoring keeps later.
+from .. import scoring
+
+# Action space: every non-empty subset of the six dice positions to keep,
+# each followed by either rolling on or banking, 63 * 2 = 126 actions.
+# Action a keeps subset (a // 2) + 1 (bit i = die i) and banks if a is odd.
+NUM_DICE = 6
+NUM_SUBSETS = (1 << NUM_DICE) - 1
+NUM_ACTIONS = 2 * NUM_SUBSETS
+
+# Position weights of a dice configuration (0-6 per slot, base 7)
+_POSITION_WEIGHT = 7 ** np.arange(NUM_DICE, dtype=np.int64)
+NUM_CONFIGS = 7 ** NUM_DICE
+
+_SUBSET_BITS = np.array(
+    [[(m >> i) & 1 for i in range(NUM_DICE)] for m in range(1, NUM_SUBSETS + 1)], dtype=bool
+)
+
+
+@lru_cache(maxsize=1)
+def legal_keep_table() -> np.ndarray:
+    """
+    For every dice configuration (slot values 0-6, indexed by config_index),
+    a uint64 bitmask of the legal keeps: bit m - 1 is set when keeping
+    subset m takes only dice on the table and every one of them scores.
+    Built once, on first use.
+    """
+    digits = (np.arange(NUM_CONFIGS, dtype=np.int32)[:, None] // _POSITION_WEIGHT.astype(np.int32)) % 7
+    subsets = _SUBSET_BITS.T.astype(np.int32)  # (6, 63)
+    # Scoring key of every subset of every configuration, and whether the
+    # subset takes any set-aside (0) slot
+    keys = scoring.dice_key_weights()[digits] @ subsets
+    takes_empty = (digits == 0).astype(np.int32) @ subsets
+    legal = (scoring.keep_score_by_key()[keys] > 0) & (takes_empty == 0)
+    return (legal.astype(np.uint64) << np.arange(NUM_SUBSETS, dtype=np.uint64)).sum(axis=1, dtype=np.uint64)
+
+
+def config_index(dice_batch: np.ndarray) -> np.ndarray:
+    """Index into legal_keep_table() of each row of an (N, 6) dice array."""
+    return np.asarray(dice_batch, dtype=np.int64) @ _POSITION_WEIGHT
+
+
+def valid_keep_masks(dice_batch: np.ndarray) -> np.ndarray:
+    """(N, 63) bool: which keep subsets are legal for each row of dice."""
+    legal = legal_keep_table()[config_index(dice_batch)].astype('<u8')
+    bits = np.unpackbits(legal.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    return bits[:, :NUM_SUBSETS].view(bool)
+
+
+def keep_points(dice_batch: np.ndarray) -> np.ndarray:
+    """(N, 63) int: points each keep subset scores for each row of dice, 0 where illegal."""
+    dice_batch = np.asarray(dice_batch, dtype=np.int64)
+    keys = scoring.dice_key_weights()[dice_batch] @ _SUBSET_BITS.T.astype(np.int32)
+    return np.where(valid_keep_masks(dice_batch), scoring.keep_score_by_key()[keys], 0)
+
+
+def valid_action_masks(dice_batch: np.ndarray) -> np.ndarray:
+    """(N, 126) bool: which actions are legal for each row of an (N, 6) dice array."""
+    return np.repeat(valid_keep_masks(dice_batch), 2, axis=1)
+
 
 class ActionSpace:
     def __init__(self):
-        # Static mapping for now; expand later
-        self._actions: List[List[int]] = [
-            [],      # keep nothing
-            [0],     # keep first die
+        self._actions: List[Tuple[List[int], bool]] = [
+            ([i for i in range(NUM_DICE) if (m >> i) & 1], bank)
+            for m in range(1, NUM_SUBSETS + 1)
+            for bank in (False, True)
         ]
 
     def size(self) -> int:
         return len(self._actions)
 
-    def all_actions(self) -> List[List[int]]:
+    def all_actions(self) -> List[Tuple[List[int], bool]]:
+        """(dice indices to keep, bank afterwards?) for every action index."""
         return list(self._actions)
 
+    def decode(self, idx: int) -> Tuple[List[int], bool]:
+        return self._actions[idx]
+
     def index_to_action(self, idx: int) -> List[int]:
+        """Dice indices an action keeps; see decode() for the bank flag."""
         if 0 <= idx < len(self._actions):
-            return self._actions[idx]
+            return self._actions[idx][0]
         # Default to no-op if out of range
         return []
 
+    @staticmethod
+    def encode(indices: Sequence[int], bank: bool) -> int:
+        """Action index that keeps `indices` and then banks or rolls on."""
+        m = 0
+        for i in indices:
+            m |= 1 << i
+        return 2 * (m - 1) + bool(bank)
+
+    def valid_action_masks(self, dice_batch: np.ndarray) -> np.ndarray:
+        return valid_action_masks(dice_batch)
+
+    def valid_actions(self, dice: Sequence[int]) -> List[int]:
+        return np.flatnonzero(valid_action_masks(np.array([dice]))[0]).tolist()
+
 
 def encode_state(dice: List[int], turn_score: int, p0_score: int, p1_score: int, current_player: int) -> np.ndarray:
     """
@@ -59,11 +134,13 @@ def encode_state(dice: List[int], turn_score: int, p0_score: int, p1_score: int,
 
 def basic_valid_actions(dice: List[int]) -> List[List[int]]:
     """
-    Return a minimal set of candidate actions based on the current dice.
-    For now, we expose two actions only: keep nothing, keep first die if present.
-    This is a placeholder to be expanded with proper scoring-aware keeps.
+    Every legal keep for a roll, as lists of dice indices: non-empty sets
+    of dice on the table that all score. Empty for a zilch.
     """
-    actions = [[]]
-    if len(dice) > 0:
-        actions.append([0])
-    return actions
+    padded = (list(dice) + [0] * NUM_DICE)[:NUM_DICE]
+    legal = int(legal_keep_table()[int(config_index(np.array(padded)))])
+    return [
+        [i for i in range(NUM_DICE) if (m >> i) & 1]
+        for m in range(1, NUM_SUBSETS + 1)
+        if legal >> (m - 1) & 1
+    ]